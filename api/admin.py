@@ -1,5 +1,5 @@
-from api.models import MemberRFIDCheck
-from api.views import RFIDCheckLogDetailView, RFIDCheckLogViewList
+from api.models import MemberRFIDCheck, MemberRFIDCheckDay
+from api.views import RFIDCheckDayDetailView, RFIDCheckDayViewList, RFIDCheckLogDetailView, RFIDCheckLogViewList
 from core.admin import admin_site
 from core.admin.ViewableAdmin import ViewableModelAdmin
 from django.contrib.admin import register
@@ -8,8 +8,22 @@ from django.contrib.admin import register
 class MemberRFIDLogAdmin(ViewableModelAdmin):
 
     list_display = ("timestamp", "rfid_checked", "message", "was_valid")
+    search_fields = ("=rfid_checked",)
+    date_hierarchy = "timestamp"
     list_view = RFIDCheckLogViewList
     detail_view_class = RFIDCheckLogDetailView
 
 
+class MemberRFIDCheckDayAdmin(ViewableModelAdmin):
+    """The counts of the checks that are older than the retention period of the full log"""
+
+    list_display = ("date", "rfid_checked", "num_valid", "num_invalid")
+    search_fields = ("=rfid_checked",)
+    date_hierarchy = "date"
+    ordering = ("-date",)
+    list_view = RFIDCheckDayViewList
+    detail_view_class = RFIDCheckDayDetailView
+
+
 admin_site.register(MemberRFIDCheck, MemberRFIDLogAdmin)
+admin_site.register(MemberRFIDCheckDay, MemberRFIDCheckDayAdmin)
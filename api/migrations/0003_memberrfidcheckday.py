@@ -0,0 +1,43 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    """Indexes the rfid check log by time, and adds the daily counts that old checks are compacted into"""
+
+    dependencies = [
+        ('api', '0002_memberrfidcheck_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberRFIDCheckDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('rfid_checked', models.CharField(max_length=12)),
+                ('num_valid', models.PositiveIntegerField(default=0, verbose_name='Valid checks')),
+                ('num_invalid', models.PositiveIntegerField(default=0, verbose_name='Invalid checks')),
+            ],
+            options={
+                'verbose_name': 'daily RFID check count',
+            },
+        ),
+        migrations.AlterField(
+            model_name='memberrfidcheck',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='memberrfidcheck',
+            index=models.Index(fields=['rfid_checked', 'timestamp'], name='api_memberr_rfid_ch_dbc58f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memberrfidcheckday',
+            index=models.Index(fields=['rfid_checked', 'date'], name='api_memberr_rfid_ch_f94006_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='memberrfidcheckday',
+            unique_together={('date', 'rfid_checked')},
+        ),
+    ]
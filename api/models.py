@@ -1,35 +1,145 @@
-from core.models.MemberModels import Member
-from django.db import models
+import atexit
+import logging
+import threading
+from datetime import datetime, time, timedelta
 
-# Create your models here.
+from core.caching import ProcessCache
+from core.models.MemberModels import Member, get_permission_holders
+from django.db import DatabaseError, close_old_connections, models, transaction
+from django.db.models import Count, Q
+from django.utils.timezone import localdate, make_aware, now
+from uwccsystem.settings import RFID_CHECK_LOG_BATCH_SIZE, RFID_CHECK_LOG_FLUSH_INTERVAL, RFID_CHECK_LOG_RETENTION
+
+logger = logging.getLogger(__name__)
+
+#: The door access of every member rfid, see RfidCheckManager.get_access_table
+door_access_cache = ProcessCache("door_access")
+
+
+class RfidCheckLog:
+    """
+    Collects the rfid checks made by this process and writes them to the database in batches
+
+    Writing a row on every tap would put an INSERT in front of every door check, so the checks are kept in memory and
+    saved by a background thread every flush_interval seconds, or as soon as batch_size checks are waiting. With a
+    flush_interval of 0 every check is written immediately instead, without any thread.
+    """
+
+    def __init__(self, flush_interval=RFID_CHECK_LOG_FLUSH_INTERVAL, batch_size=RFID_CHECK_LOG_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pending = []
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, check):
+        """Queue an unsaved MemberRFIDCheck to be written"""
+        with self._lock:
+            self._pending.append(check)
+            num_pending = len(self._pending)
+
+        if not self.flush_interval:
+            self.flush()
+            return
+
+        self._start()
+        if num_pending >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Write all the waiting checks to the database"""
+        with self._lock:
+            checks, self._pending = self._pending, []
+        if checks:
+            MemberRFIDCheck.objects.bulk_create(checks, batch_size=self.batch_size)
+
+    def _start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rfid-check-log", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.exception("Could not save the rfid check log")
+
+
+#: The checks of this process which still need to be saved
+rfid_check_log = RfidCheckLog()
+atexit.register(rfid_check_log.flush)
 
 
 class RfidCheckManager(models.Manager):
     @staticmethod
-    def create(rfid=None):
-
-        matching_members = list(Member.objects.filter(rfid=rfid))
-        num_members = len(matching_members)
-
-        if num_members > 1:
-            message = "Multiple Members with this RFID!"
-            is_valid = False
-        elif num_members == 0:
-            message = "Not a member RFID"
-            is_valid = False
-        else:
-            member = matching_members[0]
-            message = f"{member.get_full_name()}: {member.group}"
-            if member.is_active_member:
-                is_valid = True
-            else:
-                is_valid = False
+    def get_access_table():
+        """
+        Get the door access of every member rfid, cached for the whole process
 
-        check_entry = MemberRFIDCheck(
-            rfid_checked=rfid, was_valid=is_valid, message=message
-        )
-        check_entry.save()
-        return is_valid
+        Members are let in when they have the is_active_member permission and their membership hasn't run out, which is
+        the same as Member.objects.active(). The expiration date is compared on every check, so the table stays
+        correct when a membership runs out overnight.
+
+        :return: dict of rfid: (message to log, whether the member's group lets them in, date their membership expires)
+        """
+
+        def load():
+            groups, member_ids = get_permission_holders("core.is_active_member")
+            groups, member_ids = set(groups), set(member_ids)
+
+            table = {}
+            members = Member.objects.exclude(rfid="").only(
+                "pk", "rfid", "first_name", "last_name", "group", "date_expires", "is_active", "is_superuser"
+            )
+            for member in members.iterator(chunk_size=2000):
+                if member.rfid in table:
+                    table[member.rfid] = ("Multiple Members with this RFID!", False, None)
+                    continue
+                has_access = member.is_active and (
+                    member.is_superuser or member.group in groups or member.pk in member_ids
+                )
+                table[member.rfid] = (f"{member.get_full_name()}: {member.group}", has_access, member.date_expires)
+            return table
+
+        return door_access_cache.get("table", load)
+
+    def check_rfid(self, rfid):
+        """
+        Check whether the rfid belongs to an active member, logging the check
+
+        The answer comes from the cached access table, and the log entry is written later by the rfid_check_log, so this
+        doesn't need any queries most of the time
+        """
+        return self.check_rfids([rfid])[rfid]
+
+    def check_rfids(self, rfids):
+        """
+        Check several rfids at once, like check_rfid() does
+
+        :return: dict of rfid: whether it belongs to an active member
+        """
+        table = self.get_access_table()
+        today = now().date()
+
+        results = {}
+        for rfid in rfids:
+            message, has_access, date_expires = table.get(rfid, ("Not a member RFID", False, None))
+            is_valid = has_access and date_expires >= today
+            rfid_check_log.add(MemberRFIDCheck(rfid_checked=rfid, was_valid=is_valid, message=message[:100]))
+            results[rfid] = is_valid
+        return results
+
+    def create(self, rfid=None):
+        """Kept for compatibility, checks the rfid and returns whether it is valid"""
+        return self.check_rfid(rfid)
 
 
 class MemberRFIDCheck(models.Model):
@@ -37,5 +147,79 @@ class MemberRFIDCheck(models.Model):
 
     rfid_checked = models.CharField(max_length=12)
     was_valid = models.BooleanField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    #: Set when the check is made, not when the buffered log entry is finally saved
+    timestamp = models.DateTimeField(default=now, editable=False, db_index=True)
     message = models.CharField(max_length=100)
+
+    class Meta:
+        indexes = [models.Index(fields=["rfid_checked", "timestamp"])]
+
+
+def start_of_day(day):
+    """The first moment of the given day, in the current time zone"""
+    return make_aware(datetime.combine(day, time.min))
+
+
+class RfidCheckDayManager(models.Manager):
+    def compact(self, retention=RFID_CHECK_LOG_RETENTION):
+        """
+        Count the rfid checks older than the retention period into one row per day and rfid, and delete them
+
+        Every day is counted and deleted in its own transaction, so compacting can be stopped and picked up again at any
+        time, and checks that are only saved after their day was compacted are added to the existing counts.
+
+        :return: the number of checks that were compacted
+        """
+        cutoff = start_of_day(localdate() - retention)
+        compacted = 0
+
+        oldest = MemberRFIDCheck.objects.filter(timestamp__lt=cutoff).order_by("timestamp").first()
+        while oldest is not None:
+            day = localdate(oldest.timestamp)
+            start, end = start_of_day(day), min(start_of_day(day + timedelta(days=1)), cutoff)
+            compacted += self.compact_day(day, start, end)
+            oldest = MemberRFIDCheck.objects.filter(timestamp__gte=end, timestamp__lt=cutoff).order_by("timestamp").first()
+
+        return compacted
+
+    @transaction.atomic
+    def compact_day(self, day, start, end):
+        """Move the checks made between start and end into the counts of the given day"""
+        checks = MemberRFIDCheck.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        counts = checks.values("rfid_checked").annotate(
+            num_valid=Count("pk", filter=Q(was_valid=True)), num_invalid=Count("pk", filter=Q(was_valid=False))
+        )
+
+        existing = {rollup.rfid_checked: rollup for rollup in self.select_for_update().filter(date=day)}
+        new_rollups = []
+        for row in counts:
+            rollup = existing.get(row["rfid_checked"])
+            if rollup is None:
+                new_rollups.append(self.model(date=day, **row))
+            else:
+                rollup.num_valid += row["num_valid"]
+                rollup.num_invalid += row["num_invalid"]
+
+        self.bulk_create(new_rollups, batch_size=1000)
+        self.bulk_update(existing.values(), ["num_valid", "num_invalid"], batch_size=1000)
+        deleted, _ = checks.delete()
+        return deleted
+
+
+class MemberRFIDCheckDay(models.Model):
+    """How often an rfid was checked on one day. Checks older than the retention period are only kept as these counts"""
+
+    objects = RfidCheckDayManager()
+
+    date = models.DateField()
+    rfid_checked = models.CharField(max_length=12)
+    num_valid = models.PositiveIntegerField(default=0, verbose_name="Valid checks")
+    num_invalid = models.PositiveIntegerField(default=0, verbose_name="Invalid checks")
+
+    class Meta:
+        verbose_name = "daily RFID check count"
+        unique_together = ("date", "rfid_checked")
+        indexes = [models.Index(fields=["rfid_checked", "date"])]
+
+    def __str__(self):
+        return f"{self.rfid_checked} on {self.date}"
@@ -0,0 +1,31 @@
+"""Signal receivers that keep the cached door access of members consistent with the database"""
+from api.models import door_access_cache
+from core.models.MemberModels import Member, members_moved
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+
+@receiver(post_save, sender=Member)
+@receiver(post_delete, sender=Member)
+def member_changed(sender, update_fields=None, **kwargs):
+    """A member's rfid, group or membership may have changed. Logging in only updates last_login, which can be ignored"""
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    door_access_cache.invalidate()
+
+
+@receiver(members_moved, sender=Member)
+def members_moved_to_group(sender, **kwargs):
+    """Members were moved to another group in bulk, without being saved one by one"""
+    door_access_cache.invalidate()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(m2m_changed, sender=Member.user_permissions.through)
+def permissions_changed(sender, action=None, **kwargs):
+    """Which groups are let in depends on their permissions"""
+    if action is None or action in ("post_add", "post_remove", "post_clear"):
+        door_access_cache.invalidate()
@@ -1,12 +1,27 @@
 from random import randint
 
 from helper_scripts.build_basic_data import *
-from core.models.MemberModels import Member
+from api.models import MemberRFIDCheck, MemberRFIDCheckDay, door_access_cache, rfid_check_log
+from core.models.MemberModels import Member, permission_cache
 from django.test import Client, TestCase
-from django.utils.timezone import timedelta
+from django.utils.timezone import localdate, now, timedelta
 
 
-class MemberRFIDCheckTest(TestCase):
+class RFIDCheckTestCase(TestCase):
+    """Saves the rfid checks right away instead of in a background thread, so they end up in the test's transaction"""
+
+    def setUp(self):
+        # Rolling back the changes of a previous test does not send any signals, so the caches must be reset manually
+        door_access_cache.clear()
+        permission_cache.clear()
+        self.flush_interval = rfid_check_log.flush_interval
+        rfid_check_log.flush_interval = 0
+
+    def tearDown(self):
+        rfid_check_log.flush_interval = self.flush_interval
+
+
+class MemberRFIDCheckTest(RFIDCheckTestCase):
 
     base_url = "/api/memberRFIDcheck"
     used_rfids = []
@@ -80,3 +95,133 @@ class MemberRFIDCheckTest(TestCase):
         self.make_test_member(rfid, "Board")
         was_validated = self.is_valid_member_rfid(rfid)
         self.assertTrue(was_validated, "Board members should be valid members!")
+
+    def test_checks_are_logged(self):
+        rfid = self.gen_rfid()
+        self.make_test_member(rfid, "Member")
+        self.is_valid_member_rfid(rfid)
+        check = MemberRFIDCheck.objects.get(rfid_checked=rfid)
+        self.assertTrue(check.was_valid)
+        self.assertEqual(check.message, "New Member: Member")
+
+    def test_check_is_cached(self):
+        rfid = str(self.gen_rfid())
+        self.make_test_member(rfid, "Member")
+        rfid_check_log.flush_interval = 60
+        MemberRFIDCheck.objects.check_rfid(rfid)
+        with self.assertNumQueries(0):
+            self.assertTrue(MemberRFIDCheck.objects.check_rfid(rfid))
+        with self.assertNumQueries(1):
+            rfid_check_log.flush()
+
+    def test_group_change_invalidates(self):
+        rfid = str(self.gen_rfid())
+        self.make_test_member(rfid, "Member")
+        self.assertTrue(self.is_valid_member_rfid(rfid))
+        Member.objects.get(rfid=rfid).move_to_group("Expired")
+        self.assertFalse(self.is_valid_member_rfid(rfid))
+
+    def test_expired_membership_not_valid(self):
+        rfid = str(self.gen_rfid())
+        self.make_test_member(rfid, "Member")
+        Member.objects.filter(rfid=rfid).update(date_expires=now().date() - timedelta(days=1))
+        door_access_cache.clear()
+        self.assertFalse(self.is_valid_member_rfid(rfid))
+
+    def test_batch_check(self):
+        active, new = str(self.gen_rfid()), str(self.gen_rfid())
+        self.make_test_member(active, "Member")
+        Member.objects.create_member("new@email.lol", new, timedelta(days=7), password="admin")
+
+        response = self.client.post(
+            f"{self.base_url}/batch", {"rfids": [active, new, "1"]}, content_type="application/json"
+        )
+        self.assertEqual(response.json(), {"results": {active: True, new: False, "1": False}})
+        self.assertEqual(MemberRFIDCheck.objects.count(), 3)
+
+    def test_batch_check_bad_request(self):
+        response = self.client.post(f"{self.base_url}/batch", {"rfid": "1"}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class ActiveMemberExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_site()
+        build_permissions()
+        Member.objects.create_superuser("admin@bro.com", "0000000000", "pass")
+
+        for i, group_name in enumerate(["Just Joined", "Expired", "Member", "Staff"]):
+            member = Member.objects.create_member(f"member{i}@bro.com", f"100000000{i}", timedelta(days=7), "pass")
+            member.move_to_group(group_name)
+
+        # Their group wasn't updated yet, but the membership already ran out
+        member = Member.objects.create_member("late@bro.com", "1000000009", timedelta(days=-1), "pass")
+        member.move_to_group("Member")
+
+    def setUp(self):
+        self.client.login(email="admin@bro.com", password="pass")
+
+    def test_active_members(self):
+        emails = set(Member.objects.active().values_list("email", flat=True))
+        self.assertEqual(emails, {"admin@bro.com", "member2@bro.com", "member3@bro.com"})
+        for member in Member.objects.active():
+            self.assertTrue(member.is_active_member)
+
+    def test_active_superuser_in_any_group(self):
+        """Superusers have every permission, so they stay active members whatever their group is"""
+        admin = Member.objects.get(email="admin@bro.com")
+        admin.is_superuser = True
+        admin.save()
+        admin.move_to_group("Just Joined")
+        self.assertTrue(admin.is_active_member)
+        self.assertTrue(Member.objects.active().filter(pk=admin.pk).exists())
+
+    def test_export_text(self):
+        response = self.client.get("/api/active_members.txt")
+        content = b"".join(response.streaming_content).decode()
+        self.assertEqual(content, "admin@bro.com\nmember2@bro.com\nmember3@bro.com\n")
+
+    def test_export_csv(self):
+        response = self.client.get("/api/active_members.csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "email,first_name,last_name,group,date_expires")
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith("admin@bro.com,Master,Admin,Admin,"))
+
+    def test_export_unknown_format(self):
+        self.assertEqual(self.client.get("/api/active_members.pdf").status_code, 404)
+
+
+class RFIDCheckCompactionTest(TestCase):
+    def add_check(self, rfid, was_valid, days_ago):
+        check = MemberRFIDCheck(rfid_checked=rfid, was_valid=was_valid, timestamp=now() - timedelta(days=days_ago))
+        check.save()
+
+    def test_compact(self):
+        for was_valid in [True, True, False]:
+            self.add_check("1234", was_valid, 100)
+        self.add_check("5678", False, 100)
+        self.add_check("1234", True, 120)
+        self.add_check("1234", True, 1)
+
+        self.assertEqual(MemberRFIDCheckDay.objects.compact(), 5)
+        self.assertEqual(MemberRFIDCheck.objects.count(), 1)
+
+        counts = {
+            (rollup.rfid_checked, rollup.date): (rollup.num_valid, rollup.num_invalid)
+            for rollup in MemberRFIDCheckDay.objects.all()
+        }
+        day = localdate(now() - timedelta(days=100))
+        self.assertEqual(counts[("1234", day)], (2, 1))
+        self.assertEqual(counts[("5678", day)], (0, 1))
+        self.assertEqual(len(counts), 3)
+
+    def test_late_checks_are_added(self):
+        self.add_check("1234", True, 100)
+        MemberRFIDCheckDay.objects.compact()
+        self.add_check("1234", False, 100)
+        MemberRFIDCheckDay.objects.compact()
+
+        rollup = MemberRFIDCheckDay.objects.get()
+        self.assertEqual((rollup.num_valid, rollup.num_invalid), (1, 1))
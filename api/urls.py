@@ -1,8 +1,13 @@
-from api.views import CheckIfActiveMemberView, ActiveMemberView
+from api.views import CheckIfActiveMemberView, CheckIfActiveMembersView, ActiveMemberView, ActiveMemberExportView
 from django.urls import include, path
 
 app_name = "api"
 urlpatterns = [
+    path(
+        "memberRFIDcheck/batch",
+        CheckIfActiveMembersView.as_view(),
+        name="memberRFIDcheck_batch",
+    ),
     path(
         "memberRFIDcheck/<str:rfid>",
         CheckIfActiveMemberView.as_view(),
@@ -12,5 +17,10 @@ urlpatterns = [
         "active_members",
         ActiveMemberView.as_view(),
         name="all_active_members"
-    )
+    ),
+    path(
+        "active_members.<str:file_format>",
+        ActiveMemberExportView.as_view(),
+        name="export_active_members"
+    ),
 ]
@@ -1,15 +1,34 @@
-from api.models import MemberRFIDCheck
+import csv
+import json
+
+from api.models import MemberRFIDCheck, MemberRFIDCheckDay
 from core.models.MemberModels import Member
 from core.views.common import ModelDetailView
-from core.views.ViewList import RestrictedViewList
+from core.views.ViewList import KeysetViewList
 from django.contrib.auth.mixins import UserPassesTestMixin, LoginRequiredMixin
 from django.urls import reverse
 from django.views.generic import TemplateView
-from django.http.response import HttpResponse
+from django.http import Http404
+from django.http.response import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
 from django.views.generic.base import View
 
 # Create your views here.
 
+#: How many members to fetch from the database cursor at a time when exporting
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_COLUMNS = ("email", "first_name", "last_name", "group", "date_expires")
+#: The most rfids a door controller may check in one request
+MAX_BATCH_RFIDS = 100
+
+
+class EchoBuffer:
+    """A file-like object which just returns what is written to it, so csv.writer can produce the rows of a stream"""
+
+    def write(self, value):
+        return value
+
 
 class ActiveMemberView(LoginRequiredMixin, UserPassesTestMixin,TemplateView):
 
@@ -21,17 +40,51 @@ class ActiveMemberView(LoginRequiredMixin, UserPassesTestMixin,TemplateView):
     def get_context_data(self, **kwargs):
         context = super(ActiveMemberView, self).get_context_data(**kwargs)
 
-        members = Member.objects.all().exclude(group='Expired')
-        emails = [f"{member.email}\n" for member in members if member.is_active_member]
+        emails = Member.objects.active().order_by("email").values_list("email", flat=True)
 
-        context['emails'] = emails
+        context['emails'] = emails.iterator(chunk_size=EXPORT_CHUNK_SIZE)
         return context
 
 
+class ActiveMemberExportView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """
+    Stream the active members as plain text (one email per line) or csv
+
+    The rows are streamed straight from a database cursor, so the export doesn't need to hold every member in memory
+    """
+
+    def test_func(self):
+        return self.request.user.has_permission('core.view_all_members')
+
+    def get(self, request, file_format, *args, **kwargs):
+        members = Member.objects.active().order_by("email")
+
+        if file_format == "txt":
+            emails = members.values_list("email", flat=True).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+            rows = (f"{email}\n" for email in emails)
+            content_type = "text/plain"
+        elif file_format == "csv":
+            writer = csv.writer(EchoBuffer())
+            members = members.values_list(*EXPORT_COLUMNS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+            rows = (writer.writerow(row) for row in _with_header(EXPORT_COLUMNS, members))
+            content_type = "text/csv"
+        else:
+            raise Http404(f"Can't export active members as {file_format}")
+
+        response = StreamingHttpResponse(rows, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="active_members.{file_format}"'
+        return response
+
+
+def _with_header(header, rows):
+    yield header
+    yield from rows
+
+
 class CheckIfActiveMemberView(View):
     def get(self, request, rfid, *args, **kwargs):
 
-        valid_member = MemberRFIDCheck.objects.create(rfid=rfid)
+        valid_member = MemberRFIDCheck.objects.check_rfid(rfid)
 
         if valid_member:
             response = HttpResponse(status=200)
@@ -41,10 +94,41 @@ class CheckIfActiveMemberView(View):
         return response
 
 
-class RFIDCheckLogViewList(RestrictedViewList):
+@method_decorator(csrf_exempt, name="dispatch")
+class CheckIfActiveMembersView(View):
+    """
+    Check several rfids in one request, for door controllers that collect a few taps at once
+
+    Expects a JSON body like {"rfids": ["1234567890", ...]} and answers with {"results": {"1234567890": true, ...}}
+    """
+
+    def post(self, request, *args, **kwargs):
+        try:
+            rfids = json.loads(request.body)["rfids"]
+        except (ValueError, KeyError, TypeError):
+            return HttpResponseBadRequest('Expected a JSON object like {"rfids": [...]}')
+
+        if not isinstance(rfids, list) or not all(isinstance(rfid, str) for rfid in rfids):
+            return HttpResponseBadRequest("rfids must be a list of strings")
+        if len(rfids) > MAX_BATCH_RFIDS:
+            return HttpResponseBadRequest(f"Can't check more than {MAX_BATCH_RFIDS} rfids at once")
+
+        return JsonResponse({"results": MemberRFIDCheck.objects.check_rfids(rfids)})
+
+
+class RFIDCheckLogViewList(KeysetViewList):
     def test_func(self):
-        return self.request.user.has_permission("core.view_rfid_check_log")
+        return self.request.user.has_permission("api.view_memberrfidcheck")
 
 
 class RFIDCheckLogDetailView(ModelDetailView):
     model = MemberRFIDCheck
+
+
+class RFIDCheckDayViewList(KeysetViewList):
+    def test_func(self):
+        return self.request.user.has_permission("api.view_memberrfidcheckday")
+
+
+class RFIDCheckDayDetailView(ModelDetailView):
+    model = MemberRFIDCheckDay
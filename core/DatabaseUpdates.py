@@ -19,12 +19,7 @@ def expire_members():
 
 def identify_missing_gear():
     """Loops through all the checked out gear and sets as missing any that is checked out past the due date"""
-    checked_out = Gear.objects.filter(status=1)
-    right_now = now()
-    for gear in checked_out:
-        if right_now > gear.due_date:
-            # Make the gear missing and create the associated transaction
-            Transaction.objects.missing_gear("1111111111", gear.rfid)
+    Transaction.objects.batch_missing_gear("1111111111", now().date())
 
 
 def expire_gear():
@@ -33,11 +28,8 @@ def expire_gear():
 
     # TODO: What should this time frame be for missing gear?
     expiration_threshold = timedelta(days=3 * 30)  # 3 months
-    # Get all the missing gear and check if it is expired
-    missing_gear = Gear.objects.filter(status=3)
-    for gear in missing_gear:
-        if right_now > gear.due_date + expiration_threshold:
-            Transaction.objects.expire_gear("1111111111", gear.rfid)
+    # Expire all the missing gear that has been due for longer than that
+    Transaction.objects.batch_expire_gear("1111111111", right_now.date() - expiration_threshold)
 
     # TODO: What should this time frame be for broken gear?
     expiration_threshold = timedelta(days=5 * 30)  # 5 months
@@ -1,8 +1,16 @@
+import hashlib
+
+from core.caching import SharedCache, get_cache_stats
 from django.apps import apps
 from django.contrib.admin import AdminSite
-from django.urls import NoReverseMatch, reverse
+from django.core.exceptions import PermissionDenied
+from django.http import JsonResponse
+from django.urls import NoReverseMatch, path, reverse
 from django.utils.text import capfirst
 
+#: The models shown in the admin index, by the permissions of the user
+app_list_cache = SharedCache("admin_app_list")
+
 
 class ExcursionAdmin(AdminSite):
     index_template = "admin_index.html"
@@ -11,7 +19,29 @@ class ExcursionAdmin(AdminSite):
     site_title = "Climbing Club Admin"
     index_title = "Admin Home"
 
+    def get_urls(self):
+        urls = [path("cache_stats/", self.admin_view(self.cache_stats_view), name="cache_stats")]
+        return urls + super().get_urls()
+
+    @staticmethod
+    def cache_stats_view(request):
+        """How often the shared caches of the process that handled this request had the data asked for, for admins"""
+        if not request.user.is_admin:
+            raise PermissionDenied
+        return JsonResponse(get_cache_stats())
+
     def _build_app_dict(self, request, label=None):
+        """
+        Get the models shown to the user, which only depend on their permissions and are therefore cached by those
+
+        Changing the permissions of a user changes the key, so the cache never needs to be invalidated
+        """
+        user = request.user
+        perms = "superuser" if user.is_superuser else ",".join(sorted(user.get_permission_names()))
+        key = (label or "", hashlib.md5(perms.encode()).hexdigest())
+        return app_list_cache.get(key, lambda: self._load_app_dict(request, label))
+
+    def _load_app_dict(self, request, label=None):
         """
         Ensure that each model with view permissions is viewable in the admin
 
@@ -49,7 +79,7 @@ class ExcursionAdmin(AdminSite):
                 continue
 
             model_dict = {
-                "name": capfirst(meta_data.verbose_name_plural),
+                "name": str(capfirst(meta_data.verbose_name_plural)),
                 "object_name": meta_data.object_name,
                 "perms": perms,
             }
@@ -78,7 +108,7 @@ class ExcursionAdmin(AdminSite):
             # If this is the first model in this app, must add the app data in addition to the model data
             else:
                 app_dict[app_label] = {
-                    "name": apps.get_app_config(app_label).verbose_name,
+                    "name": str(apps.get_app_config(app_label).verbose_name),
                     "app_label": app_label,
                     "app_url": reverse(
                         "admin:app_list",
@@ -1,18 +1,23 @@
-import json
 from collections import OrderedDict
 
 from core.admin.ViewableAdmin import ViewableModelAdmin
-from core.forms.GearForms import GearAddForm, GearChangeForm
+from core.convinience import read_table_rows
+from core.forms.GearForms import GearAddForm, GearChangeForm, GearImportForm
+from core.models.GearModels import GearType
+from core.models.TransactionModels import Transaction
 from core.views.GearViews import GearDetailView, GearTypeDetailView, GearViewList
 from django.contrib.admin import ModelAdmin
 from django.contrib.admin.utils import quote
+from django.core.exceptions import PermissionDenied
 from django.http import HttpResponseRedirect
-from django.urls import reverse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 
 
 class GearAdmin(ViewableModelAdmin):
     # Make all the data about a certification be shown in the list display
-    list_display = ("name", "status", "get_department", "checked_out_to", "due_date")
+    list_display = ("display_name", "status", "get_department", "checked_out_to", "due_date")
+    list_select_related = ("geartype__department", "checked_out_to")
 
     # Choose which fields appear on the side as filters
     list_filter = ("status", "geartype__department", "geartype")
@@ -20,7 +25,7 @@ class GearAdmin(ViewableModelAdmin):
     # Choose which fields can be searched for
     search_fields = (
         "geartype__name",
-        "gear_data",
+        "display_name",
         "rfid",
         "checked_out_to__first_name",
         "checked_out_to__last_name",
@@ -40,6 +45,54 @@ class GearAdmin(ViewableModelAdmin):
     list_view = GearViewList
     detail_view_class = GearDetailView
 
+    def prefetch_list_results(self, results):
+        """Gear without a stored name needs the data fields of its gear type to build one"""
+        GearType.prefetch_schemas({gear.geartype_id for gear in results})
+
+    def get_urls(self):
+        """Add the url of the page to import many pieces of gear at once"""
+        import_url = [
+            path("import/", self.admin_site.admin_view(self.import_view), name="core_gear_import")
+        ]
+
+        # Must be in front, otherwise import/ is taken to be the id of a piece of gear
+        return import_url + super(GearAdmin, self).get_urls()
+
+    def import_view(self, request):
+        """Upload a file of gear, which is all added through Transaction.objects.bulk_add_gear"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        created = None
+        import_errors = []
+        if request.method == "POST":
+            form = GearImportForm(request.POST, request.FILES)
+            if form.is_valid():
+                gear_file = form.cleaned_data["gear_file"]
+                try:
+                    rows = read_table_rows(gear_file, gear_file.name)
+                except ValueError as error:
+                    form.add_error("gear_file", str(error))
+                else:
+                    created, import_errors = Transaction.objects.bulk_add_gear(
+                        request.user.rfid,
+                        rows,
+                        default_image=form.cleaned_data["image"],
+                        is_new=form.cleaned_data["is_new"],
+                    )
+        else:
+            form = GearImportForm()
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title="Import Gear",
+            opts=self.model._meta,
+            form=form,
+            created=created,
+            import_errors=import_errors,
+        )
+        return TemplateResponse(request, "admin/core/gear/gear_import.html", context)
+
     def get_fieldsets(self, request, obj=None):
         """Add in the dynamic fields defined by geartype into the fieldsets (so django knows how to display them)"""
         fieldsets = super(GearAdmin, self).get_fieldsets(request, obj=obj)
@@ -63,8 +116,8 @@ class GearAdmin(ViewableModelAdmin):
             extended_form.authorizer_rfid = request.user.rfid
 
             # Load all the fields that need to be added dynamically from the geartype
-            gear_data = json.loads(obj.gear_data)
-            extra_fields = obj.geartype.data_fields.all()
+            gear_data = obj.get_gear_data()
+            extra_fields = GearType.get_data_fields_for(obj.geartype_id).values()
 
             # For each dynamic field, add it to declared fields and the fields list (returned here)
             for field in extra_fields:
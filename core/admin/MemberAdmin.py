@@ -198,6 +198,7 @@ class StafferAdmin(ViewableModelAdmin):
     staffer_readonly = ('member', 'nickname', 'exc_email', 'title', 'is_active')
     search_fields = ('nickname', 'member__first_name', 'member__last_name', 'title', 'exc_email')
     list_display = ('nickname', 'full_name', 'title', 'exc_email', 'is_active')
+    list_select_related = ('member',)
 
     def get_form(self, request, obj=None, **kwargs):
         """
@@ -1,8 +1,11 @@
 """This file is intended to contain only the admin classes for models that do not require much admin functionality"""
 
 from core.admin.ViewableAdmin import ViewableModelAdmin
+from core.models.CampaignModels import EmailCampaign
+from core.models.EmailModels import OutboxEmail
 from core.views.OtherModelViews import CertificationDetailView, DepartmentDetailView
 from django.contrib.admin import ModelAdmin
+from django.utils.timezone import now
 
 
 class CertificationAdmin(ViewableModelAdmin):
@@ -16,9 +19,64 @@ class DepartmentAdmin(ViewableModelAdmin):
 
     # Make all the data about a department be shown in the list display
     list_display = ("name", "description", "stl_names")
+    list_prefetch_related = ("stls__member",)
     detail_view_class = DepartmentDetailView
 
 
+class OutboxEmailAdmin(ModelAdmin):
+
+    list_display = ("title", "to_emails", "status", "attempts", "next_attempt_at", "created_at", "sent_at")
+    list_filter = ("status", "credentials")
+    search_fields = ("to_emails", "title")
+    readonly_fields = ("status", "attempts", "next_attempt_at", "last_error", "created_at", "sent_at")
+    actions = ["send_again"]
+
+    def send_again(self, request, queryset):
+        """Put the selected emails back in the outbox, i.e. dead emails after fixing the problem"""
+        queryset.update(status=OutboxEmail.PENDING, attempts=0, next_attempt_at=now())
+
+    send_again.short_description = "Send the selected emails again"
+
+
+class EmailCampaignAdmin(ModelAdmin):
+
+    list_display = ("name", "title", "status", "num_recipients", "created_by", "started_at", "finished_at")
+    list_filter = ("status",)
+    search_fields = ("name", "title")
+    filter_horizontal = ("groups", "certifications")
+    readonly_fields = ("status", "recipient_count", "progress", "created_at", "started_at", "finished_at")
+    actions = ["start_sending"]
+
+    def save_model(self, request, obj, form, change):
+        if obj.created_by is None:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+    def recipient_count(self, campaign):
+        """How many members are in the segment right now, to check the filters before sending"""
+        if campaign.pk is None:
+            return "-"
+        return campaign.get_recipients().count()
+
+    recipient_count.short_description = "Members in the segment"
+
+    def progress(self, campaign):
+        if campaign.pk is None:
+            return "-"
+        counts = campaign.get_progress()
+        return f"{counts['queued']} queued, {counts['sent']} sent, {counts['waiting']} waiting, {counts['failed']} failed"
+
+    def start_sending(self, request, queryset):
+        """Queue the selected campaigns, the send_emails task then sends them in the background"""
+        started = 0
+        for campaign in queryset.filter(status=EmailCampaign.DRAFT):
+            campaign.start()
+            started += 1
+        self.message_user(request, f"Started sending {started} campaigns")
+
+    start_sending.short_description = "Start sending the selected campaigns"
+
+
 class AlreadyUploadedImageAdmin(ModelAdmin):
 
     list_display = ("image_tag", "name", "image_type", "sub_type", "upload_date")
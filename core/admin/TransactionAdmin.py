@@ -1,13 +1,36 @@
+from datetime import timedelta
+
 from core.admin.ViewableAdmin import ViewableModelAdmin
 from core.views.TransactionViews import TransactionDetailView, TransactionListView
+from django.contrib.admin import SimpleListFilter
+from django.utils.timezone import localdate
+
+
+class CreatedFilter(SimpleListFilter):
+    """Filter transactions by when they were created, using their ids instead of the timestamp (see created_between)"""
+
+    title = "created"
+    parameter_name = "created"
+    days = {"today": 0, "week": 7, "month": 30, "year": 365}
+
+    def lookups(self, request, model_admin):
+        return (("today", "Today"), ("week", "Past 7 days"), ("month", "Past 30 days"), ("year", "Past year"))
+
+    def queryset(self, request, queryset):
+        if self.value() in self.days:
+            return queryset.filter(pk__created_after=localdate() - timedelta(days=self.days[self.value()]))
+        return queryset
 
 
 class TransactionAdmin(ViewableModelAdmin):
     list_display = ("type", "timestamp", "gear", "member", "authorizer", "comments")
-    list_filter = ("type",)
+    list_select_related = ("gear", "member", "authorizer")
+    list_filter = ("type", CreatedFilter)
+    # Newest first, in the order of the primary key index
+    ordering = ("-pk",)
     search_fields = (
         "gear__geartype__name",
-        "gear__gear_data",
+        "gear__display_name",
         "member__first_name",
         "member__last_name",
         "authorizer__first_name",
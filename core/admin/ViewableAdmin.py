@@ -1,21 +1,49 @@
-from functools import update_wrapper
+from collections import Counter
+from functools import partial, update_wrapper
 from core.views.common import ModelDetailView
 from core.views.ViewList import RestrictedViewList
 from django.contrib.admin import ModelAdmin
 from django.contrib.admin.options import IncorrectLookupParameters, csrf_protect_m
 from django.contrib.admin.views.main import ERROR_FLAG
+from django.conf import settings
 from django.contrib.auth import get_permission_codename
 from django.core.exceptions import PermissionDenied
+from django.db import connections, router
 from django.http import HttpResponseRedirect
 from django.template.response import SimpleTemplateResponse, TemplateResponse
 from django.urls import path
 from django.utils.translation import gettext as _
 from django.utils.translation import ngettext
+from uwccsystem.settings import LIST_QUERY_BUDGET
+
+
+class QueryBudgetExceeded(Exception):
+    """A page of a list made more queries than its list_query_budget, most likely some for every row"""
+
+
+class QueryCounter:
+    """A database execute wrapper that counts the queries made, and how often each SQL statement was run"""
+
+    def __init__(self):
+        self.statements = Counter()
+
+    def __len__(self):
+        return sum(self.statements.values())
+
+    def __call__(self, execute, sql, params, many, context):
+        self.statements[sql] += 1
+        return execute(sql, params, many, context)
 
 
 class ViewableModelAdmin(ModelAdmin):
     """
     A model admin that has an additional view_<model> permission, that allows viewing without editing
+
+    Everything the list shows for each row should be loaded along with the page: related objects through
+    list_select_related (foreign keys) or list_prefetch_related (many to many and reverse relations), anything else in
+    prefetch_list_results. With DEBUG on, a page that makes more than list_query_budget queries raises
+    QueryBudgetExceeded, so a column that makes queries for every row is noticed right away. Only pages that are shown
+    (GET requests) are checked, since actions and list edits (POST requests) have already saved their changes by then.
     """
 
     list_view = RestrictedViewList
@@ -23,6 +51,38 @@ class ViewableModelAdmin(ModelAdmin):
 
     show_full_result_count = False
 
+    #: Passed to prefetch_related for every page of the list
+    list_prefetch_related = ()
+
+    #: The most queries a page of the list may make, however many rows it has
+    list_query_budget = LIST_QUERY_BUDGET
+
+    def prefetch_list_results(self, results):
+        """Override this to load anything else the rows of a page need at once, before the page is shown"""
+        pass
+
+    def check_query_budget(self, view):
+        """
+        Call the view, and in DEBUG render it and raise QueryBudgetExceeded if that made more than list_query_budget
+        queries
+        """
+        if not settings.DEBUG:
+            return view()
+
+        counter = QueryCounter()
+        with connections[router.db_for_read(self.model)].execute_wrapper(counter):
+            response = view()
+            if hasattr(response, "render"):
+                response.render()
+
+        if len(counter) > self.list_query_budget:
+            sql, times = counter.statements.most_common(1)[0]
+            raise QueryBudgetExceeded(
+                f"A page of the {self.opts.verbose_name} list made {len(counter)} queries, but may only make "
+                f"{self.list_query_budget}. This query was made {times} times: {sql}"
+            )
+        return response
+
     def get_detail_view(self):
         """Get the detail view as a view (function) wrapped to automatically check permissions"""
 
@@ -131,11 +191,12 @@ class ViewableModelAdmin(ModelAdmin):
         The 'change list' admin view for this model.
         """
         if self.has_change_permission(request):
-            return super(ViewableModelAdmin, self).changelist_view(
-                request, extra_context=extra_context
-            )
+            view = partial(super(ViewableModelAdmin, self).changelist_view, request, extra_context=extra_context)
         else:
-            return self.viewlist_view(request)
+            view = partial(self.viewlist_view, request)
+        if request.method == "GET":
+            return self.check_query_budget(view)
+        return view()
 
     def get_urls(self):
         """Override that adds the url for the detail page of the model"""
@@ -7,11 +7,13 @@ from ..models.CertificationModels import Certification
 from ..models.DepartmentModels import Department
 from ..models.QuizModels import Question, Answer
 from ..models.FileModels import AlreadyUploadedImage
+from ..models.EmailModels import OutboxEmail
+from ..models.CampaignModels import EmailCampaign
 
 from .MemberAdmin import MemberAdmin, StafferAdmin
 from .GearAdmin import GearAdmin, GearTypeAdmin, CustomDataFieldAdmin
 from .TransactionAdmin import TransactionAdmin
-from .OtherAdmins import CertificationAdmin, DepartmentAdmin, AlreadyUploadedImageAdmin
+from .OtherAdmins import CertificationAdmin, DepartmentAdmin, AlreadyUploadedImageAdmin, OutboxEmailAdmin, EmailCampaignAdmin
 
 from core.admin.ExcAdminSite import ExcursionAdmin
 
@@ -26,6 +28,8 @@ admin_site.register(Transaction, TransactionAdmin)
 admin_site.register(Certification, CertificationAdmin)
 admin_site.register(Department, DepartmentAdmin)
 admin_site.register(AlreadyUploadedImage, AlreadyUploadedImageAdmin)
+admin_site.register(OutboxEmail, OutboxEmailAdmin)
+admin_site.register(EmailCampaign, EmailCampaignAdmin)
 admin_site.register(Staffer, StafferAdmin)
 admin_site.register(Question)
 admin_site.register(Answer)
@@ -0,0 +1,195 @@
+"""Caches of data that is read all the time, but changed very rarely"""
+import threading
+import time
+
+from core.models.CacheModels import CacheVersion
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from uwccsystem.settings import PROCESS_CACHE_CHECK_INTERVAL, SHARED_CACHE_TIMEOUT
+
+#: Every SharedCache by name, to report their hit rates
+shared_caches = {}
+
+_missing = object()
+
+
+class ProcessCache:
+    """
+    A dictionary kept in the memory of the current process, which is emptied when the data it holds is changed
+
+    The process that makes a change calls invalidate(), which empties its own copy immediately and increases the shared
+    CacheVersion stamp. All other processes compare their copy against that stamp at most once every check_interval
+    seconds, so they pick up the change within a few seconds without having to query anything on most reads.
+    """
+
+    def __init__(self, name, check_interval=PROCESS_CACHE_CHECK_INTERVAL):
+        self.name = name
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._data = {}
+        self._version = None
+        self._checked_at = None
+
+    def _check_version(self):
+        """Drop the cached data if another process has invalidated it since it was loaded"""
+        checked_at = self._checked_at
+        if checked_at is not None and time.monotonic() - checked_at < self.check_interval:
+            return
+
+        version = CacheVersion.objects.get_version(self.name)
+        with self._lock:
+            if version != self._version:
+                self._data = {}
+                self._version = version
+            self._checked_at = time.monotonic()
+
+    def get(self, key, load):
+        """
+        Get the cached value for key, calling load() to compute (and cache) it if it isn't cached yet
+
+        The version is always read before anything is loaded, so data loaded during an invalidation in another process is
+        at worst stored under the old version and dropped at the next check.
+        """
+        self._check_version()
+        data = self._data
+        try:
+            return data[key]
+        except KeyError:
+            value = load()
+            with self._lock:
+                if data is self._data:
+                    data[key] = value
+            return value
+
+    def get_many(self, keys, load_many):
+        """
+        Get the cached values for several keys, calling load_many(missing keys) once for all the keys that aren't cached
+
+        :param load_many: function returning a dict of key: value for the given keys
+        :return: dict of key: value
+        """
+        self._check_version()
+        data = self._data
+        values = {key: data[key] for key in keys if key in data}
+        missing = [key for key in keys if key not in values]
+        if missing:
+            loaded = load_many(missing)
+            with self._lock:
+                if data is self._data:
+                    data.update(loaded)
+            values.update(loaded)
+        return values
+
+    def clear(self):
+        """Empty the copy of this process only. The version is checked again on the next read"""
+        with self._lock:
+            self._data = {}
+            self._version = None
+            self._checked_at = None
+
+    def invalidate(self):
+        """Empty the cache in every process, by increasing the shared version"""
+        CacheVersion.objects.bump(self.name)
+        self.clear()
+
+
+class SharedCache:
+    """
+    A namespace in the django cache (settings.CACHES), which all processes share unless it is the local memory backend
+
+    Keys are stored under the current version of the namespace. invalidate() increases that version, so every process
+    stops seeing all the old entries at once, and they simply expire. Single entries can be dropped with delete(). Hits
+    and misses are counted per process, see get_cache_stats.
+
+    The version is also stamped with the CacheVersion of the namespace, which is checked like a ProcessCache does. With
+    the local memory backend every process has its own entries, which an invalidation in another process can't reach, so
+    there the stamp is what makes the other processes drop them, within check_interval seconds. For the same reason
+    delete() invalidates the whole namespace with that backend.
+    """
+
+    def __init__(self, name, timeout=SHARED_CACHE_TIMEOUT, check_interval=PROCESS_CACHE_CHECK_INTERVAL):
+        self.name = name
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self._stamp = None
+        self._checked_at = None
+        shared_caches[name] = self
+
+    @property
+    def version_key(self):
+        return f"{self.name}:version"
+
+    def make_key(self, key):
+        """The key in the django cache, for a string or a tuple of parts"""
+        parts = key if isinstance(key, tuple) else (key,)
+        return ":".join([self.name, *map(str, parts)])
+
+    def get_stamp(self):
+        """The CacheVersion of the namespace, read from the database at most once every check_interval seconds"""
+        checked_at = self._checked_at
+        if checked_at is None or time.monotonic() - checked_at >= self.check_interval:
+            self._stamp = CacheVersion.objects.get_version(self.name)
+            self._checked_at = time.monotonic()
+        return self._stamp
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            # The first process to get here decides the version, the others use the one it stored
+            cache.add(self.version_key, 1, timeout=None)
+            version = cache.get(self.version_key, 1)
+        return f"{self.get_stamp()}.{version}"
+
+    def get(self, key, load):
+        """Get the cached value for key, calling load() to compute (and cache) it if it isn't cached yet"""
+        version = self.get_version()
+        value = cache.get(self.make_key(key), _missing, version=version)
+        if value is not _missing:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = load()
+        cache.set(self.make_key(key), value, self.timeout, version=version)
+        return value
+
+    def set(self, key, value):
+        """Store a value for key, i.e. after adding to a value that was gotten with get()"""
+        cache.set(self.make_key(key), value, self.timeout, version=self.get_version())
+
+    def delete(self, *keys):
+        """Drop the entries for the given keys, or the whole namespace if the entries aren't shared between processes"""
+        if isinstance(caches["default"], LocMemCache):
+            self.invalidate()
+            return
+        version = self.get_version()
+        cache.delete_many([self.make_key(key) for key in keys], version=version)
+
+    def invalidate(self):
+        """Drop every entry in this namespace, in every process"""
+        CacheVersion.objects.bump(self.name)
+        self._checked_at = None
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            # Nothing was cached under a stored version yet, so anything cached was stored under the first version
+            cache.set(self.version_key, 2, timeout=None)
+
+
+def get_cache_stats():
+    """
+    Get how often each SharedCache had the data that was asked for, in this process
+
+    :return: dict of cache name: dict with the number of hits and misses and the hit rate
+    """
+    stats = {}
+    for name, shared_cache in sorted(shared_caches.items()):
+        lookups = shared_cache.hits + shared_cache.misses
+        stats[name] = {
+            "hits": shared_cache.hits,
+            "misses": shared_cache.misses,
+            "hit_rate": shared_cache.hits / lookups if lookups else None,
+        }
+    return stats
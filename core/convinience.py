@@ -1,23 +1,49 @@
+import csv
+import io
+import json
 import os
-from django.core.mail import send_mail
+from functools import lru_cache
 
 
 def get_all_rfids():
-    from core.models.MemberModels import Member
-    from core.models.GearModels import Gear
+    """
+    Return a list of all the RFIDs currently in use by the system
 
-    """Return a list of all the RFIDs currently in use by the system"""
-    # TODO: is there a better way to do this? This approach might get slow
-    member_rfids = [member.rfid for member in Member.objects.all()]
-    gear_rfids = [gear.rfid for gear in Gear.objects.all()]
-    # TODO: If any new types of RFIDs are added, make sure to add them here
+    To check whether a single RFID is in use, use RFIDTag.objects.is_in_use instead, which does not load every RFID
+    """
+    from core.models.RFIDModels import RFIDTag
 
-    all_rfids = member_rfids + gear_rfids
-    return all_rfids
+    return list(RFIDTag.objects.values_list("rfid", flat=True))
 
 
+def read_table_rows(file, file_name):
+    """
+    Read the rows of a CSV (with a header line) or JSON lines file as dicts
+
+    :param file: the open file, either in text or in binary mode (i.e. an uploaded file)
+    :param file_name: the name of the file, the extension determines how it is read
+    :return: list of dicts, one for each row
+    """
+    content = file.read()
+    if isinstance(content, bytes):
+        content = content.decode("utf-8-sig")
+    file = io.StringIO(content)
+
+    if file_name.lower().endswith(".csv"):
+        return list(csv.DictReader(file))
+    elif file_name.lower().endswith((".jsonl", ".json")):
+        return [json.loads(line) for line in file if line.strip()]
+    else:
+        raise ValueError(f"Can only read .csv and .jsonl files, not {file_name}")
+
+
+@lru_cache(maxsize=None)
 def get_email_template(name):
-    """Get the absolute path equivalent of going up one level and then into the templates directory"""
+    """
+    Get the text of an email template from the templates/emails directory
+
+    The templates only change with a deploy, so each one is read from disk once per process
+    """
     templates_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), 'templates'))
     f = open(os.path.join(templates_dir, 'emails', f'{name}.txt'))
     template = f.read()
@@ -27,13 +53,17 @@ def get_email_template(name):
 
 def notify_admin(title='No Title Provided', message='No message provided'):
     """Send a email notification to the system admins"""
+    from core.models.EmailModels import OutboxEmail
+
     from_email = "system-noreply@climbingclubuw.org"
     to_email = "admin@climbingclubuw.org"
-    send_mail(title, message, from_email, to_email)
+    OutboxEmail.objects.enqueue([to_email], title, message, from_email=from_email)
 
 
 def notify_info(title="No Title Provided", message="No message provided"):
     """Send a email notification to the board 'info' email"""
+    from core.models.EmailModels import OutboxEmail
+
     from_email = "system-noreply@climbingclubuw.org"
     to_email = "info@climbingclubuw.org"
-    send_mail(title, message, from_email, to_email)
+    OutboxEmail.objects.enqueue([to_email], title, message, from_email=from_email)
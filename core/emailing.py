@@ -1,44 +1,142 @@
+import logging
 import smtplib
 from uwccsystem import settings
 
+logger = logging.getLogger(__name__)
 
-def send_email(to_emails, title, body,
-               from_email=None, smtp_password=None, from_name='Excursion Club', receiver_names=None):
+#: Errors after which the connection can't be used anymore, so it is opened again before trying once more
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
 
-    # If SMTP credentials are not given, use defaults
-    if from_email is None:
-        from_email = settings.EMAIL_HOST_USER
-    if smtp_password is None:
-        smtp_password = settings.EMAIL_HOST_PASSWORD
 
-    # Prepare the list of recipients, optionally including names
+def format_email(to_emails, title, body, from_email, from_name, receiver_names=None):
+    """Build the message for the given recipients, optionally including their names"""
     if receiver_names is None:
         recipients = ", ".join([f'<{email}>' for email in to_emails])
     else:
         recipients = ", ".join([f'{receiver[0]} <{receiver[1]}>' for receiver in zip(receiver_names, to_emails)])
 
-    # Prepare the formatted email message ready to be sent
-    email = f"From: {from_name} <{from_email}> \n" \
+    return f"From: {from_name} <{from_email}> \n" \
         f"To: {recipients} \n" \
         f"Subject: {title} \n" \
         f"{body} \n"
 
-    smtp_obj = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT)
-    if settings.EMAIL_USE_TLS:
-        smtp_obj.starttls()
-        smtp_obj.login(from_email, smtp_password)
-    smtp_obj.sendmail(from_email, to_emails, email)
+
+class EmailBatch:
+    """
+    Sends many emails over one SMTP connection per sender account, instead of connecting and logging in for every email
+
+    Use it as a context manager so the connections are closed when done. A connection that drops is opened again, and
+    the email retried once. Emails that still fail don't stop the batch, instead every recipient's outcome is kept in
+    results, as a list of (email address, None if sent or the error)::
+
+        with EmailBatch() as batch:
+            for member in members:
+                member.send_expired_email(batch=batch)
+        failed = [email for email, error in batch.results if error is not None]
+    """
+
+    def __init__(self, host=None, port=None, use_tls=None):
+        self.host = settings.EMAIL_HOST if host is None else host
+        self.port = settings.EMAIL_PORT if port is None else port
+        self.use_tls = getattr(settings, "EMAIL_USE_TLS", False) if use_tls is None else use_tls
+        self.results = []
+        self._connections = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _connect(self, smtp_user, smtp_password):
+        connection = self._connections.get(smtp_user)
+        if connection is None:
+            connection = smtplib.SMTP(self.host, self.port)
+            if self.use_tls:
+                connection.starttls()
+                connection.login(smtp_user, smtp_password)
+            self._connections[smtp_user] = connection
+        return connection
+
+    def _disconnect(self, smtp_user):
+        connection = self._connections.pop(smtp_user, None)
+        if connection is not None:
+            try:
+                connection.quit()
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+
+    def send(self, to_emails, title, body,
+             from_email=None, smtp_password=None, from_name='Excursion Club', receiver_names=None, smtp_user=None):
+        """
+        Send an email over the open connection of its sender. See send_email for the arguments
+
+        :param smtp_user: the account to log in to the mail server with, if it isn't the from_email itself
+
+        :return: None if the email was sent to everyone, otherwise the error
+        """
+        # If SMTP credentials are not given, use defaults
+        if from_email is None:
+            from_email = settings.EMAIL_HOST_USER
+        if smtp_password is None:
+            smtp_password = settings.EMAIL_HOST_PASSWORD
+        if smtp_user is None:
+            smtp_user = from_email
+
+        email = format_email(to_emails, title, body, from_email, from_name, receiver_names)
+
+        refused = {}
+        error = None
+        for attempt in range(2):
+            try:
+                refused = self._connect(smtp_user, smtp_password).sendmail(from_email, to_emails, email)
+                error = None
+                break
+            except CONNECTION_ERRORS as connection_error:
+                error = connection_error
+                self._disconnect(smtp_user)
+            except smtplib.SMTPException as smtp_error:
+                error = smtp_error
+                break
+
+        if error is not None:
+            logger.warning(f"Could not send '{title}' to {to_emails}: {error}")
+        for to_email in to_emails:
+            self.results.append((to_email, error or refused.get(to_email)))
+        return error
+
+    def send_membership(self, to_emails, title, body, receiver_names=None):
+        """Send an email from the club membership email. See send_membership_email"""
+        return self.send(
+            to_emails,
+            title,
+            body,
+            receiver_names=receiver_names,
+            from_email=settings.MEMBERSHIP_EMAIL_HOST_USER,
+            from_name='UWCC Membership',
+            smtp_password=settings.MEMBERSHIP_EMAIL_HOST_PASSWORD,
+        )
+
+    def close(self):
+        """Close all the open connections"""
+        for smtp_user in list(self._connections):
+            self._disconnect(smtp_user)
+
+
+def send_email(to_emails, title, body,
+               from_email=None, smtp_password=None, from_name='Excursion Club', receiver_names=None):
+    """Send a single email. Use an EmailBatch instead to send many emails"""
+    with EmailBatch() as batch:
+        error = batch.send(to_emails, title, body, from_email, smtp_password, from_name, receiver_names)
+    if error is not None:
+        raise error
     print("Successfully sent email")
 
 
 def send_membership_email(to_emails, title, body, receiver_names=None):
     """Send an email from the club membership email. See send_email for more details"""
-    send_email(
-        to_emails,
-        title,
-        body,
-        receiver_names=receiver_names,
-        from_email=settings.MEMBERSHIP_EMAIL_HOST_USER,
-        from_name='UWCC Membership',
-        smtp_password=settings.MEMBERSHIP_EMAIL_HOST_PASSWORD,
-    )
+    with EmailBatch() as batch:
+        error = batch.send_membership(to_emails, title, body, receiver_names=receiver_names)
+    if error is not None:
+        raise error
+    print("Successfully sent email")
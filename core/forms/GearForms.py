@@ -4,7 +4,7 @@ from core.forms.widgets import GearImageWidget
 from core.models.FileModels import AlreadyUploadedImage
 from core.models.GearModels import Gear
 from core.models.TransactionModels import Transaction
-from django.forms import ModelChoiceField, ModelForm, ValidationError
+from django.forms import BooleanField, FileField, Form, ModelChoiceField, ModelForm, ValidationError
 
 
 class GearChangeForm(ModelForm):
@@ -100,3 +100,19 @@ class GearAddForm(ModelForm):
             **self.build_gear_data(),
         )
         return gear
+
+
+class GearImportForm(Form):
+    """Upload a file listing many pieces of gear, to be added all at once"""
+
+    gear_file = FileField(
+        label="Gear File",
+        help_text="A .csv or .jsonl file with an rfid, geartype and (optionally) image column, and a column for each data "
+        "field of the gear types",
+    )
+    image = ModelChoiceField(
+        AlreadyUploadedImage.objects.filter(image_type="gear"),
+        required=False,
+        help_text="The image to use for all rows that don't name an image",
+    )
+    is_new = BooleanField(label="Newly Acquired", initial=True, required=False)
@@ -1,11 +1,11 @@
 from collections import OrderedDict
 import json
 
-from core.convinience import get_all_rfids
 from core.forms.fields.RFIDField import RFIDField
 from core.forms.widgets import ExCEmailWidget
 from core.models import Member, Staffer
 from core.models.QuizModels import Question
+from core.models.RFIDModels import RFIDTag
 from django import forms
 from django.contrib.auth.forms import ReadOnlyPasswordHashField
 from django.urls import reverse
@@ -76,7 +76,7 @@ class MemberCreationForm(forms.ModelForm):
     def clean_rfid(self):
         rfid = self.cleaned_data["rfid"]
 
-        if rfid in get_all_rfids():
+        if RFIDTag.objects.is_in_use(rfid):
             raise forms.ValidationError(f"The RFID '{rfid}' is already in use!")
 
         # If a member is renewing, the RFID can either be a new rfid, or empty
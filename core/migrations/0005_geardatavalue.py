@@ -0,0 +1,66 @@
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_existing_gear_data(apps, schema_editor):
+    """Build the indexed copies of the custom data of all gear that already exists"""
+    Gear = apps.get_model("core", "Gear")
+    GearDataValue = apps.get_model("core", "GearDataValue")
+    type_columns = {"int": "number_value", "float": "number_value", "boolean": "bool_value"}
+
+    data_values = []
+    for gear in Gear.objects.all().iterator():
+        gear_data = json.loads(gear.gear_data)
+        for field in gear.geartype.data_fields.all():
+            if field.name not in gear_data:
+                continue
+            value = gear_data[field.name].get("initial")
+            column = type_columns.get(field.data_type, "text_value")
+            if value is not None:
+                if column == "number_value":
+                    value = float(value)
+                elif column == "bool_value":
+                    value = bool(value)
+                else:
+                    value = str(value)[:300]
+            data_values.append(GearDataValue(gear=gear, field=field, **{column: value}))
+    GearDataValue.objects.bulk_create(data_values, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_auto_add_staffer_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GearDataValue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text_value', models.CharField(blank=True, max_length=300, null=True)),
+                ('number_value', models.FloatField(blank=True, null=True)),
+                ('bool_value', models.BooleanField(blank=True, null=True)),
+                ('field', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.customdatafield')),
+                ('gear', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='data_values', to='core.gear')),
+            ],
+            options={
+                'unique_together': {('gear', 'field')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='geardatavalue',
+            index=models.Index(fields=['field', 'text_value'], name='core_gearda_field_i_3b9b64_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='geardatavalue',
+            index=models.Index(fields=['field', 'number_value'], name='core_gearda_field_i_9cf4fd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='geardatavalue',
+            index=models.Index(fields=['field', 'bool_value'], name='core_gearda_field_i_911c8e_idx'),
+        ),
+        migrations.RunPython(index_existing_gear_data, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+import json
+
+from django.db import migrations, models
+
+
+def get_str(field, data_dict):
+    """The string of one value, as CustomDataField.get_str builds it"""
+    value = data_dict.get("initial")
+    if value and field.data_type == "choice":
+        for name, description in data_dict.get("choices", ()):
+            if name == value:
+                return description
+        return str(value)
+    elif value:
+        return " ".join([str(value), field.suffix]).strip()
+    else:
+        return None
+
+
+def name_existing_gear(apps, schema_editor):
+    """Store the names and display data of all gear that already exists, as Gear.refresh_display_data does"""
+    Gear = apps.get_model("core", "Gear")
+    GearType = apps.get_model("core", "GearType")
+    geartypes = {
+        geartype.pk: (geartype.name, list(geartype.data_fields.order_by("pk")))
+        for geartype in GearType.objects.all()
+    }
+
+    batch = []
+    for gear in Gear.objects.all().iterator(chunk_size=500):
+        geartype_name, data_fields = geartypes[gear.geartype_id]
+        gear_data = json.loads(gear.gear_data)
+
+        display_data = {}
+        attributes = []
+        for field in data_fields:
+            if field.name not in gear_data:
+                continue
+            string = get_str(field, gear_data[field.name])
+            display_data[field.name] = string
+            if string and field.data_type != "rfid":
+                attributes.append(str(string))
+
+        name = f"{geartype_name} - {', '.join(attributes)}" if attributes else geartype_name
+        gear.display_name = name[:300]
+        gear.display_data = json.dumps(display_data)
+        batch.append(gear)
+        if len(batch) >= 500:
+            Gear.objects.bulk_update(batch, ["display_name", "display_data"])
+            batch = []
+    Gear.objects.bulk_update(batch, ["display_name", "display_data"])
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the stored names of gear, and names all the gear that already exists
+    """
+
+    dependencies = [
+        ('core', '0005_geardatavalue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gear',
+            name='display_data',
+            field=models.CharField(default='{}', editable=False, max_length=2000),
+        ),
+        migrations.AddField(
+            model_name='gear',
+            name='display_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=300, verbose_name='Name'),
+        ),
+        migrations.RunPython(name_existing_gear, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+def register_existing_rfids(apps, schema_editor):
+    """Fill the directory with the rfids of all existing members and gear"""
+    RFIDTag = apps.get_model('core', 'RFIDTag')
+    Member = apps.get_model('core', 'Member')
+    Gear = apps.get_model('core', 'Gear')
+
+    tags = [
+        RFIDTag(rfid=rfid, kind='member', object_id=pk)
+        for pk, rfid in Member.objects.exclude(rfid='').values_list('pk', 'rfid')
+    ]
+    tags += [RFIDTag(rfid=rfid, kind='gear', object_id=pk) for pk, rfid in Gear.objects.values_list('pk', 'rfid')]
+
+    # If a member and a piece of gear already share an rfid, the member keeps it
+    RFIDTag.objects.bulk_create(tags, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_cacheversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RFIDTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rfid', models.CharField(max_length=10, unique=True)),
+                ('kind', models.CharField(choices=[('member', 'Member'), ('gear', 'Gear')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(register_existing_rfids, migrations.RunPython.noop),
+    ]
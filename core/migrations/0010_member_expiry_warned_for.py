@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_member_group_date_expires_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='member',
+            name='expiry_warned_for',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_member_expiry_warned_for'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gear',
+            index=models.Index(fields=['status', 'due_date'], name='core_gear_status_fa6a4a_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_gear_status_due_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to_emails', models.TextField(help_text='JSON list of email addresses')),
+                ('receiver_names', models.TextField(blank=True, help_text='JSON list of the names of the receivers, if known')),
+                ('title', models.CharField(max_length=200)),
+                ('body', models.TextField()),
+                ('from_email', models.EmailField(blank=True, max_length=254)),
+                ('from_name', models.CharField(max_length=100)),
+                ('credentials', models.CharField(choices=[('default', 'Club email'), ('membership', 'Membership email')], default='default', max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Waiting to be sent'), ('sent', 'Sent'), ('dead', 'Failed, not retried anymore')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'outgoing email',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='outboxemail',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='core_outbox_status_b2f640_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0012_outboxemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailCampaign',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Only used to find the campaign again', max_length=100)),
+                ('title', models.CharField(max_length=200, verbose_name='Email subject')),
+                ('body', models.TextField(help_text='The email sent to each member. Can use {first_name}, {last_name}, {full_name}, {email}, {expiration_date}')),
+                ('expires_after', models.DateField(blank=True, help_text='Only members whose membership ends on or after', null=True)),
+                ('expires_before', models.DateField(blank=True, help_text='Only members whose membership ends on or before', null=True)),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('queued', 'Waiting to start'), ('sending', 'Being queued'), ('done', 'Queued')], default='draft', max_length=10)),
+                ('num_recipients', models.PositiveIntegerField(default=0, verbose_name='Emails queued')),
+                ('last_member_id', models.BigIntegerField(blank=True, editable=False, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('certifications', models.ManyToManyField(blank=True, help_text='Only members with at least one of these certifications', to='core.Certification')),
+                ('created_by', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('groups', models.ManyToManyField(blank=True, help_text='Only members in one of these groups', to='auth.Group')),
+                ('rented_from', models.ForeignKey(blank=True, help_text='Only members who have rented gear from this department', null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.department')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='outboxemail',
+            name='campaign',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='emails', to='core.emailcampaign'),
+        ),
+    ]
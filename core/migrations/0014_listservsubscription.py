@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_emailcampaign'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListservSubscription',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('subscribed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
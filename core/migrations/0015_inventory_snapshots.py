@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_listservsubscription'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('primary_key', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('taken_at', models.DateTimeField()),
+                ('num_gear', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='gear_due_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='gear_holder',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='gear_status',
+            field=models.IntegerField(choices=[(0, 'In Stock'), (1, 'Checked Out'), (2, 'Broken'), (3, 'Missing'), (4, 'Dormant'), (5, 'Removed')], editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_inventory_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionArchive',
+            fields=[
+                ('primary_key', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('last_id', models.BigIntegerField(unique=True)),
+                ('num_transactions', models.PositiveIntegerField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.BinaryField()),
+            ],
+            options={
+                'verbose_name': 'transaction archive segment',
+            },
+        ),
+        migrations.CreateModel(
+            name='TransactionArchiveIndex',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gear_id', models.BigIntegerField(null=True)),
+                ('member_id', models.BigIntegerField(null=True)),
+                ('segment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='index', to='core.transactionarchive')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transactionarchiveindex',
+            index=models.Index(fields=['gear_id'], name='core_transa_gear_id_10aec7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionarchiveindex',
+            index=models.Index(fields=['member_id'], name='core_transa_member__6fb691_idx'),
+        ),
+    ]
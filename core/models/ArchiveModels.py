@@ -0,0 +1,211 @@
+import json
+import zlib
+from datetime import date, datetime
+
+from django.db import models, transaction
+from django.utils.timezone import now
+from uwccsystem.settings import TRANSACTION_ARCHIVE_AFTER, TRANSACTION_ARCHIVE_SEGMENT_SIZE
+
+from .fields.PrimaryKeyField import time_to_id
+from .GearModels import Gear
+from .MemberModels import Member
+from .TransactionModels import Transaction
+
+#: The transaction fields that are kept in the archive, in the order they are stored in
+ARCHIVE_FIELDS = (
+    "primary_key",
+    "timestamp",
+    "type",
+    "gear_id",
+    "member_id",
+    "authorizer_id",
+    "comments",
+    "gear_status",
+    "gear_holder_id",
+    "gear_due_date",
+)
+
+
+def resolve_related(transactions):
+    """
+    Set the gear, member and authorizer of archived transactions with one query per model
+
+    Archived transactions don't protect what they refer to, so deleted members and gear are set to None
+    """
+    all_gear = Gear.objects.in_bulk({t.gear_id for t in transactions})
+    members = Member.objects.in_bulk(
+        {t.member_id for t in transactions if t.member_id is not None} | {t.authorizer_id for t in transactions}
+    )
+    for t in transactions:
+        t.gear = all_gear.get(t.gear_id)
+        t.member = members.get(t.member_id)
+        t.authorizer = members.get(t.authorizer_id)
+    return transactions
+
+
+class TransactionArchiveManager(models.Manager):
+    def archive(self, before=None, segment_size=TRANSACTION_ARCHIVE_SEGMENT_SIZE):
+        """
+        Move the transactions made before the given time (TRANSACTION_ARCHIVE_AFTER ago by default) into the archive
+
+        Each segment is saved and its transactions deleted in its own database transaction, so archiving can be stopped
+        and picked up again at any time.
+
+        :return: the number of transactions that were archived
+        """
+        if before is None:
+            before = now() - TRANSACTION_ARCHIVE_AFTER
+        archived = 0
+        while True:
+            num_archived = self.archive_segment(before, segment_size)
+            if not num_archived:
+                return archived
+            archived += num_archived
+
+    @transaction.atomic
+    def archive_segment(self, before, segment_size=TRANSACTION_ARCHIVE_SEGMENT_SIZE):
+        """Move the oldest segment_size transactions made before the given time into a new segment"""
+        old_transactions = Transaction.objects.created_between(end=before).order_by("pk")
+        rows = list(old_transactions.values_list(*ARCHIVE_FIELDS)[:segment_size])
+        if not rows:
+            return 0
+
+        first_id, last_id = rows[0][0], rows[-1][0]
+        segment = self.model(primary_key=first_id, last_id=last_id, num_transactions=len(rows))
+        segment.set_rows(rows)
+        segment.save(using=self._db)
+
+        gear_ids = {row[3] for row in rows}
+        member_ids = {row[4] for row in rows if row[4] is not None}
+        TransactionArchiveIndex.objects.bulk_create(
+            [TransactionArchiveIndex(segment=segment, gear_id=gear_id) for gear_id in gear_ids]
+            + [TransactionArchiveIndex(segment=segment, member_id=member_id) for member_id in member_ids],
+            batch_size=1000,
+        )
+
+        old_transactions.filter(pk__gte=first_id, pk__lte=last_id).delete()
+        return len(rows)
+
+    def get_transaction(self, pk):
+        """Get an archived transaction by its id, or None if it isn't in the archive"""
+        segment = self.filter(pk__lte=pk, last_id__gte=pk).first()
+        if segment is not None:
+            for t in segment.get_transactions():
+                if t.pk == pk:
+                    return resolve_related([t])[0]
+        return None
+
+    def rows_between(self, start=None, end=None):
+        """
+        Get the archived transactions created from start up to (not including) end, oldest first, see
+        TransactionManager.created_between
+
+        :return: iterator of dicts with the ARCHIVE_FIELDS
+        """
+        start_id = time_to_id(start) if start is not None else 0
+        end_id = time_to_id(end) if end is not None else None
+
+        segments = self.filter(last_id__gte=start_id)
+        if end_id is not None:
+            segments = segments.filter(pk__lt=end_id)
+        # Segments are big, so only one is loaded at a time
+        for segment in segments.order_by("pk").iterator(chunk_size=1):
+            for row in segment.get_rows():
+                if row["primary_key"] >= start_id and (end_id is None or row["primary_key"] < end_id):
+                    yield row
+
+    def history(self, gear=None, member=None):
+        """
+        Get every transaction of a piece of gear and/or member, newest first, from both the transactions and the archive
+
+        Only the archive segments that the index lists for the gear or member are read. The archived transactions are
+        returned as unsaved Transaction instances, so they can be shown the same way.
+
+        :return: list of Transaction
+        """
+        hot = Transaction.objects.select_related("gear", "member", "authorizer").order_by("-pk")
+        index = TransactionArchiveIndex.objects.all()
+        wanted = {}
+        if gear is not None:
+            hot = hot.filter(gear=gear)
+            index = index.filter(gear_id=gear.pk)
+            wanted["gear_id"] = gear.pk
+        if member is not None:
+            hot = hot.filter(member=member)
+            wanted["member_id"] = member.pk
+            if gear is None:
+                index = index.filter(member_id=member.pk)
+
+        archived = []
+        for segment in self.filter(pk__in=index.values("segment_id")).order_by("-pk"):
+            archived.extend(
+                t for t in reversed(segment.get_transactions())
+                if all(getattr(t, field) == value for field, value in wanted.items())
+            )
+        return list(hot) + resolve_related(archived)
+
+
+class TransactionArchive(models.Model):
+    """
+    A segment of old transactions, moved out of the transactions table by the archive_transactions task
+
+    Transactions are never deleted, so without this the table (and every query of it) would keep growing. Segments are
+    only ever added, never changed, and hold the transactions as compressed JSON. TransactionArchiveIndex lists which
+    segments have transactions of each piece of gear and member, so their history can still be read (see history).
+    """
+
+    objects = TransactionArchiveManager()
+
+    #: The id of the first transaction in the segment, so segments are ordered the same way as transactions
+    primary_key = models.BigIntegerField(primary_key=True)
+
+    #: The id of the last transaction in the segment
+    last_id = models.BigIntegerField(unique=True)
+
+    num_transactions = models.PositiveIntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    #: zlib compressed JSON of the ARCHIVE_FIELDS and the list of rows of those fields, oldest first
+    data = models.BinaryField()
+
+    class Meta:
+        verbose_name = "transaction archive segment"
+
+    def __str__(self):
+        return f"{self.num_transactions} transactions archived at {self.archived_at:%Y-%m-%d %H:%M}"
+
+    def set_rows(self, rows):
+        rows = [
+            [
+                value.isoformat() if isinstance(value, (date, datetime)) else value
+                for value in row
+            ]
+            for row in rows
+        ]
+        data = {"fields": ARCHIVE_FIELDS, "rows": rows}
+        self.data = zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+
+    def get_rows(self):
+        """:return: list of dicts with the archived fields of each transaction, oldest first"""
+        data = json.loads(zlib.decompress(self.data))
+        rows = [dict(zip(data["fields"], row)) for row in data["rows"]]
+        for row in rows:
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+            if row["gear_due_date"] is not None:
+                row["gear_due_date"] = date.fromisoformat(row["gear_due_date"])
+        return rows
+
+    def get_transactions(self):
+        """:return: list of unsaved Transaction, oldest first. Their related objects aren't loaded, see resolve_related"""
+        return [Transaction(**row) for row in self.get_rows()]
+
+
+class TransactionArchiveIndex(models.Model):
+    """Which archive segments have transactions of a piece of gear or a member, one row per segment and gear or member"""
+
+    segment = models.ForeignKey(TransactionArchive, on_delete=models.CASCADE, related_name="index")
+    gear_id = models.BigIntegerField(null=True)
+    member_id = models.BigIntegerField(null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["gear_id"]), models.Index(fields=["member_id"])]
@@ -0,0 +1,41 @@
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+
+class CacheVersionManager(models.Manager):
+    def get_version(self, name):
+        """Get the current version of the named cache, 0 if it has never been invalidated"""
+        version = self.filter(name=name).values_list("version", flat=True).first()
+        return version if version is not None else 0
+
+    def bump(self, name):
+        """Increase the version of the named cache, telling every process that their copy of it is out of date"""
+        if self.filter(name=name).update(version=F("version") + 1):
+            return
+        try:
+            with transaction.atomic():
+                self.create(name=name, version=1)
+        except IntegrityError:
+            # Another process created the row in the meantime
+            self.filter(name=name).update(version=F("version") + 1)
+
+
+class CacheVersion(models.Model):
+    """
+    Version stamp of a cache that is kept in the memory of each process (see core.caching.ProcessCache and SharedCache)
+
+    Every gunicorn worker has its own copy of the cached data, so clearing the cache in the worker that handled an edit is
+    not enough. Instead the edit increases the version stored here, and each worker drops its copy once it sees that the
+    version has changed.
+    """
+
+    objects = CacheVersionManager()
+
+    #: The name of the cache, as given to the ProcessCache
+    name = models.CharField(max_length=50, unique=True)
+
+    #: Increased by one every time the cached data is changed
+    version = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
@@ -0,0 +1,205 @@
+from string import Formatter
+
+from django.contrib.auth.models import Group
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Count, Q
+from django.utils.timezone import now
+
+from .CertificationModels import Certification
+from .DepartmentModels import Department
+from .EmailModels import OutboxEmail
+from .MemberModels import Member
+from .TransactionModels import Transaction
+
+#: The member data that can be used in the body of a campaign, i.e. "Hi {first_name}!"
+CAMPAIGN_FIELDS = ("first_name", "last_name", "full_name", "email", "expiration_date")
+
+
+def compile_template(template):
+    """
+    Check that a campaign body only uses known fields, and turn it into a function that renders it for one member
+
+    :raises ValidationError: if the template can't be rendered
+    :return: function taking a dict with the CAMPAIGN_FIELDS and returning the body for that member
+    """
+    try:
+        fields = {field for _, field, _, _ in Formatter().parse(template) if field is not None}
+    except ValueError as error:
+        raise ValidationError(f"The email can't be filled in: {error}")
+
+    unknown = fields - set(CAMPAIGN_FIELDS)
+    if unknown:
+        raise ValidationError(
+            f"Unknown fields {sorted(unknown)}, the email can only use: {', '.join(CAMPAIGN_FIELDS)}"
+        )
+    return template.format_map
+
+
+class EmailCampaignManager(models.Manager):
+    def queue_due(self, chunk_size=1000):
+        """
+        Queue the emails of every campaign that was started, see EmailCampaign.queue_emails
+
+        :return: the number of emails that were queued
+        """
+        queued = 0
+        for campaign in self.filter(status=EmailCampaign.QUEUED):
+            # Only one worker may claim each campaign
+            if self.filter(pk=campaign.pk, status=EmailCampaign.QUEUED).update(status=EmailCampaign.SENDING):
+                campaign.status = EmailCampaign.SENDING
+                queued += campaign.queue_emails(chunk_size)
+        return queued
+
+
+class EmailCampaign(models.Model):
+    """
+    An email sent to all members of a segment, like all expired members or everybody with a kayaking certification
+
+    The segment is turned into a single query of the members (see get_recipients), and the body is filled in for each
+    of them. Once started, the send_emails task adds one email per recipient to the outbox, which are then sent in the
+    background like all other emails.
+    """
+
+    objects = EmailCampaignManager()
+
+    DRAFT = "draft"
+    QUEUED = "queued"
+    SENDING = "sending"
+    DONE = "done"
+    status_choices = [(DRAFT, "Draft"), (QUEUED, "Waiting to start"), (SENDING, "Being queued"), (DONE, "Queued")]
+
+    name = models.CharField(max_length=100, help_text="Only used to find the campaign again")
+    title = models.CharField(max_length=200, verbose_name="Email subject")
+    body = models.TextField(
+        help_text=f"The email sent to each member. Can use {', '.join('{' + f + '}' for f in CAMPAIGN_FIELDS)}"
+    )
+
+    # The segment, members have to match all the filters that are set
+    groups = models.ManyToManyField(Group, blank=True, help_text="Only members in one of these groups")
+    certifications = models.ManyToManyField(
+        Certification, blank=True, help_text="Only members with at least one of these certifications"
+    )
+    rented_from = models.ForeignKey(
+        Department,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        help_text="Only members who have rented gear from this department",
+    )
+    expires_after = models.DateField(null=True, blank=True, help_text="Only members whose membership ends on or after")
+    expires_before = models.DateField(null=True, blank=True, help_text="Only members whose membership ends on or before")
+
+    status = models.CharField(max_length=10, choices=status_choices, default=DRAFT)
+    num_recipients = models.PositiveIntegerField(default=0, verbose_name="Emails queued")
+    #: The recipients are queued in order of pk, so a campaign that was interrupted can continue after this member
+    last_member_id = models.BigIntegerField(null=True, blank=True, editable=False)
+    created_by = models.ForeignKey(Member, null=True, blank=True, on_delete=models.SET_NULL, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        compile_template(self.body)
+
+    def get_recipients(self):
+        """Get all the members in the segment of this campaign, as a single query"""
+        recipients = Member.objects.filter(is_active=True)
+
+        group_names = [group.name for group in self.groups.all()]
+        if group_names:
+            recipients = recipients.filter(group__in=group_names)
+
+        cert_ids = [cert.pk for cert in self.certifications.all()]
+        if cert_ids:
+            recipients = recipients.filter(
+                pk__in=Member.certifications.through.objects.filter(certification_id__in=cert_ids).values("member_id")
+            )
+
+        if self.rented_from_id is not None:
+            rentals = Transaction.objects.filter(type="CheckOut", gear__geartype__department_id=self.rented_from_id)
+            recipients = recipients.filter(pk__in=rentals.values("member_id"))
+
+        if self.expires_after is not None:
+            recipients = recipients.filter(date_expires__gte=self.expires_after)
+        if self.expires_before is not None:
+            recipients = recipients.filter(date_expires__lte=self.expires_before)
+
+        return recipients
+
+    def start(self):
+        """Queue the campaign to be sent by the send_emails task. A campaign that was interrupted continues"""
+        compile_template(self.body)
+        self.status = self.QUEUED
+        if self.started_at is None:
+            self.started_at = now()
+        self.save(update_fields=["status", "started_at"])
+
+    def queue_emails(self, chunk_size=1000):
+        """
+        Add an email for every recipient to the outbox
+
+        The recipients are streamed in chunks, and each chunk is queued in one database transaction together with the
+        progress of the campaign, so no member gets the email twice if this is interrupted and started again.
+
+        :return: the number of emails that were queued
+        """
+        render = compile_template(self.body)
+        recipients = self.get_recipients().order_by("pk")
+        if self.last_member_id is not None:
+            recipients = recipients.filter(pk__gt=self.last_member_id)
+        recipients = recipients.values_list("pk", "email", "first_name", "last_name", "date_expires")
+
+        queued = 0
+        chunk = []
+        for recipient in recipients.iterator(chunk_size=chunk_size):
+            chunk.append(recipient)
+            if len(chunk) >= chunk_size:
+                queued += self.__queue_chunk(chunk, render)
+                chunk = []
+        if chunk:
+            queued += self.__queue_chunk(chunk, render)
+
+        self.status = self.DONE
+        self.finished_at = now()
+        self.save(update_fields=["status", "finished_at"])
+        return queued
+
+    def __queue_chunk(self, chunk, render):
+        emails = []
+        for pk, email, first_name, last_name, date_expires in chunk:
+            full_name = f"{first_name} {last_name}" if first_name and last_name else "Member"
+            body = render({
+                "first_name": first_name or "",
+                "last_name": last_name or "",
+                "full_name": full_name,
+                "email": email,
+                "expiration_date": date_expires,
+            })
+            outbox_email = OutboxEmail.objects.build_membership([email], self.title, body, receiver_names=[full_name])
+            outbox_email.campaign = self
+            emails.append(outbox_email)
+
+        with transaction.atomic():
+            OutboxEmail.objects.bulk_create(emails, batch_size=500)
+            self.last_member_id = chunk[-1][0]
+            self.num_recipients += len(emails)
+            self.save(update_fields=["last_member_id", "num_recipients"])
+        return len(emails)
+
+    def get_progress(self):
+        """
+        Count how many emails of this campaign were sent so far
+
+        :return: dict with the number of emails that were queued, sent, are still waiting and failed
+        """
+        counts = self.emails.aggregate(
+            sent=Count("pk", filter=Q(status=OutboxEmail.SENT)),
+            waiting=Count("pk", filter=Q(status=OutboxEmail.PENDING)),
+            failed=Count("pk", filter=Q(status=OutboxEmail.DEAD)),
+        )
+        counts["queued"] = self.num_recipients
+        return counts
@@ -1,8 +1,14 @@
+from core.caching import ProcessCache
 from django.db import models
 from django.urls import reverse
 from uwccsystem.settings import WEB_BASE
 
 
+#: The certifications required for each gear type and the certifications of each member, as sets of certification ids.
+#: Invalidated by the signals in core.signals whenever either of them changes
+rental_eligibility_cache = ProcessCache("rental_eligibility")
+
+
 class Certification(models.Model):
     """
     General class for all types of certifications for renting gear or going on trips
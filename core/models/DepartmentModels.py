@@ -1,6 +1,6 @@
-from django.core.mail import send_mail
 from django.db import models
 
+from .EmailModels import OutboxEmail
 from .MemberModels import Member, Staffer
 
 
@@ -60,7 +60,7 @@ class Department(models.Model):
 
         email_body += "From your dearest robot <3"
 
-        send_mail(title, email_body, department_email, stl_emails, fail_silently=False)
+        OutboxEmail.objects.enqueue(stl_emails, title, email_body, from_email=department_email)
 
     def notify_gear_removed(self, gear):
         """Sends an email to the STL that the piece of gear has been removed"""
@@ -0,0 +1,195 @@
+import json
+import logging
+
+from core import emailing
+from django.db import models, transaction
+from django.utils.timezone import now, timedelta
+from uwccsystem import settings
+from uwccsystem.settings import OUTBOX_BATCH_SIZE, OUTBOX_LEASE_TIME, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_DELAY
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxEmailManager(models.Manager):
+    def build(self, to_emails, title, body,
+              from_email=None, from_name='Excursion Club', receiver_names=None, credentials="default"):
+        """
+        Make an (unsaved) email. See emailing.send_email for the arguments
+
+        :param credentials: which account to log in to the mail server with, see OutboxEmail.CREDENTIALS
+        :return: OutboxEmail
+        """
+        return self.model(
+            to_emails=json.dumps(list(to_emails)),
+            receiver_names=json.dumps(list(receiver_names)) if receiver_names is not None else "",
+            title=title,
+            body=body,
+            from_email=from_email or settings.EMAIL_HOST_USER or "",
+            from_name=from_name,
+            credentials=credentials,
+        )
+
+    def build_membership(self, to_emails, title, body, receiver_names=None):
+        """Make an (unsaved) email from the club membership email, see build"""
+        return self.build(
+            to_emails,
+            title,
+            body,
+            from_email=settings.MEMBERSHIP_EMAIL_HOST_USER,
+            from_name='UWCC Membership',
+            receiver_names=receiver_names,
+            credentials=OutboxEmail.MEMBERSHIP,
+        )
+
+    def enqueue(self, *args, **kwargs):
+        """
+        Save an email to be sent by the send_emails task, instead of sending it right away
+
+        The email is saved in the current database transaction, so it is only sent if everything else is saved too, and
+        the request doesn't have to wait for the mail server. Takes the same arguments as build
+        """
+        email = self.build(*args, **kwargs)
+        email.save(using=self._db)
+        return email
+
+    def enqueue_membership(self, *args, **kwargs):
+        """Save an email from the club membership email to be sent, see enqueue"""
+        email = self.build_membership(*args, **kwargs)
+        email.save(using=self._db)
+        return email
+
+    def claim_due(self, limit=OUTBOX_BATCH_SIZE):
+        """
+        Claim up to limit emails that are due to be sent, so no other worker sends them at the same time
+
+        The claimed emails are given a lease, by moving their next attempt OUTBOX_LEASE_TIME seconds ahead. If the worker
+        dies while sending them, they are picked up again once the lease runs out.
+        """
+        with transaction.atomic():
+            due = (
+                self.select_for_update(skip_locked=True)
+                .filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now())
+                .order_by("next_attempt_at")[:limit]
+            )
+            emails = list(due)
+            self.filter(pk__in=[email.pk for email in emails]).update(
+                next_attempt_at=now() + timedelta(seconds=OUTBOX_LEASE_TIME)
+            )
+        return emails
+
+    def send_due(self, limit=OUTBOX_BATCH_SIZE):
+        """
+        Send the emails that are due, over one connection per sender
+
+        Emails that fail are tried again later, waiting twice as long after every attempt. After OUTBOX_MAX_ATTEMPTS
+        attempts they are given up on and kept as dead letters. Whatever goes wrong with one email, the statuses of the
+        whole batch are saved, so the emails that were already sent aren't sent again once their lease runs out.
+
+        :return: the number of emails that were sent, the number that failed
+        """
+        emails = self.claim_due(limit)
+        failed = 0
+        try:
+            with emailing.EmailBatch() as batch:
+                for email in emails:
+                    try:
+                        error = email.send(batch)
+                    except Exception as send_error:
+                        logger.exception(f"Could not send {email}")
+                        error = send_error
+
+                    if error is None:
+                        email.status = OutboxEmail.SENT
+                        email.sent_at = now()
+                        email.last_error = ""
+                    else:
+                        failed += 1
+                        email.attempts += 1
+                        email.last_error = str(error)[:1000]
+                        if email.attempts >= OUTBOX_MAX_ATTEMPTS:
+                            email.status = OutboxEmail.DEAD
+                            logger.error(f"Gave up on sending {email}: {error}")
+                        else:
+                            delay = OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1)
+                            email.next_attempt_at = now() + timedelta(seconds=delay)
+        finally:
+            self.bulk_update(emails, ["status", "sent_at", "attempts", "last_error", "next_attempt_at"])
+        return len(emails) - failed, failed
+
+    def retry_dead(self):
+        """Try sending all the emails that were given up on again"""
+        return self.filter(status=OutboxEmail.DEAD).update(status=OutboxEmail.PENDING, attempts=0, next_attempt_at=now())
+
+
+class OutboxEmail(models.Model):
+    """
+    An email waiting to be sent (or already sent) by the send_emails task
+
+    Emails are never sent while handling a request, since a slow or failing mail server would then hold up the kiosk.
+    Instead they are saved here, and one or more workers send them in the background, retrying them when they fail.
+    """
+
+    objects = OutboxEmailManager()
+
+    PENDING = "pending"
+    SENT = "sent"
+    DEAD = "dead"
+    status_choices = [(PENDING, "Waiting to be sent"), (SENT, "Sent"), (DEAD, "Failed, not retried anymore")]
+
+    DEFAULT = "default"
+    MEMBERSHIP = "membership"
+    #: The accounts that emails can be sent with. The passwords are never stored, only read from the settings
+    CREDENTIALS = [(DEFAULT, "Club email"), (MEMBERSHIP, "Membership email")]
+
+    to_emails = models.TextField(help_text="JSON list of email addresses")
+    receiver_names = models.TextField(blank=True, help_text="JSON list of the names of the receivers, if known")
+    title = models.CharField(max_length=200)
+    body = models.TextField()
+    from_email = models.EmailField(blank=True)
+    from_name = models.CharField(max_length=100)
+    credentials = models.CharField(max_length=20, choices=CREDENTIALS, default=DEFAULT)
+
+    status = models.CharField(max_length=10, choices=status_choices, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    campaign = models.ForeignKey(
+        "core.EmailCampaign", null=True, blank=True, on_delete=models.SET_NULL, related_name="emails", editable=False
+    )
+
+    class Meta:
+        verbose_name = "outgoing email"
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"'{self.title}' to {', '.join(self.get_to_emails())}"
+
+    def get_to_emails(self):
+        return json.loads(self.to_emails)
+
+    def get_receiver_names(self):
+        return json.loads(self.receiver_names) if self.receiver_names else None
+
+    def send(self, batch):
+        """
+        Send this email over the connections of an emailing.EmailBatch
+
+        :return: None if the email was sent, otherwise the error
+        """
+        if self.credentials == self.MEMBERSHIP:
+            smtp_user, smtp_password = self.from_email, settings.MEMBERSHIP_EMAIL_HOST_PASSWORD
+        else:
+            smtp_user, smtp_password = settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD
+
+        return batch.send(
+            self.get_to_emails(),
+            self.title,
+            self.body,
+            from_email=self.from_email,
+            smtp_password=smtp_password,
+            from_name=self.from_name,
+            receiver_names=self.get_receiver_names(),
+            smtp_user=smtp_user,
+        )
@@ -1,11 +1,16 @@
 import json
+from collections import OrderedDict
 from datetime import date
 
+from core.caching import ProcessCache
 from core.forms.fields.RFIDField import RFIDField
 from core.forms.widgets import ExistingImageWidget
 from core.models.fields.PrimaryKeyField import PrimaryKeyField
 from core.models.FileModels import AlreadyUploadedImage
-from django.db import models
+from django.core.exceptions import FieldError
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef
+from django.dispatch import Signal
 from django.forms.fields import (
     BooleanField,
     CharField,
@@ -17,11 +22,17 @@ from django.forms.widgets import CheckboxInput, NumberInput, Select, Textarea, T
 from django.urls import reverse
 from datetime import date
 
-from .CertificationModels import Certification
+from .CertificationModels import Certification, rental_eligibility_cache
 from .DepartmentModels import Department
 from .MemberModels import Member
+from .RFIDModels import RFIDTag
 from uwccsystem.settings import GEAR_EXPIRE_TIME
 
+#: Sent with the gear_ids when gear is updated in bulk, which doesn't send post_save, and renamed=True if their names
+#: were changed
+gear_changed = Signal()
+
+
 class CustomDataField(models.Model):
     data_types = (
         ("rfid", "10 digit RFID"),
@@ -102,14 +113,27 @@ class CustomDataField(models.Model):
     def serialize_float(self, value, min_value=-1000000, max_value=1000000, **kwargs):
         return {"initial": value, "min_value": min_value, "max_value": max_value}
 
-    def serialize_choice(self, value, choices=None, **kwargs):
-        # If a set of choices is not given, then try to parse out the choices from the choice field
-        if not choices:
+    def get_choices(self):
+        """
+        Parse the choices text into a tuple of (name, description) pairs
+
+        The parsed choices are kept on the instance, so the fields held by the gear schema cache only parse them once
+        """
+        cached = self.__dict__.get("_parsed_choices")
+        if cached is None or cached[0] != self.choices:
             choices = []
             choice_list = self.choices.split("\n")
             for choice_pair in choice_list:
                 choice = choice_pair.split(";")
                 choices.append((choice[0].strip(), choice[1].strip()))
+            cached = (self.choices, tuple(choices))
+            self._parsed_choices = cached
+        return cached[1]
+
+    def serialize_choice(self, value, choices=None, **kwargs):
+        # If a set of choices is not given, then try to parse out the choices from the choice field
+        if not choices:
+            choices = self.get_choices()
 
         return {"initial": value, "choices": tuple(choices)}
 
@@ -149,6 +173,10 @@ class CustomDataField(models.Model):
         else:
             return None
 
+    def get_field_class(self):
+        """Returns the FormField class and the widget class used for the current data type"""
+        return self.fields[self.data_type], self.widgets[self.data_type]
+
     def get_field(self, current=None, **init_data):
         """Returns the appropriate FormField for the current data type"""
 
@@ -161,13 +189,64 @@ class CustomDataField(models.Model):
         init_data.pop("data_type")
 
         # Make sure that the default widget for this data type is used
-        init_data["widget"] = self.widgets[self.data_type]
+        field_class, init_data["widget"] = self.get_field_class()
 
-        field = self.fields[self.data_type](**init_data)
+        field = field_class(**init_data)
 
         return field
 
 
+class GearTypeSchema:
+    """
+    Everything about the custom data of a gear type that is needed to create, read, display or edit its gear
+
+    Schemas are built once per process for each gear type and kept in gear_schema_cache, since gear types and their data
+    fields change maybe once a term, while gear is read all the time.
+    """
+
+    def __init__(self, data_fields):
+        #: The CustomDataFields of the gear type by name, in a fixed order
+        self.data_fields = OrderedDict((field.name, field) for field in data_fields)
+
+        #: The names of all the data fields, in the same order
+        self.field_names = list(self.data_fields)
+
+        #: The parsed (name, description) choices of each choice field
+        self.choices = {
+            field.name: field.get_choices() for field in data_fields if field.data_type == "choice"
+        }
+
+        #: The FormField and widget class used to edit each data field
+        self.field_classes = {field.name: field.get_field_class() for field in data_fields}
+
+    @classmethod
+    def load(cls, geartype_id):
+        data_fields = CustomDataField.objects.filter(geartype__pk=geartype_id).order_by("pk")
+        return cls(list(data_fields))
+
+    @classmethod
+    def load_many(cls, geartype_ids):
+        """Load the schemas of several gear types with a single query, as a dict of gear type id: GearTypeSchema"""
+        links = (
+            GearType.data_fields.through.objects.filter(geartype_id__in=geartype_ids)
+            .select_related("customdatafield")
+            .order_by("customdatafield_id")
+        )
+        data_fields = {geartype_id: [] for geartype_id in geartype_ids}
+        for link in links:
+            data_fields[link.geartype_id].append(link.customdatafield)
+        return {geartype_id: cls(fields) for geartype_id, fields in data_fields.items()}
+
+    def build_empty_data(self):
+        """Construct a empty gear data dict that contains no gear data"""
+        return {name: field.serialize() for name, field in self.data_fields.items()}
+
+
+#: The GearTypeSchema of each gear type, keyed by gear type id. Invalidated by the signals in core.signals whenever a gear
+#: type or custom data field is edited
+gear_schema_cache = ProcessCache("gear_schema")
+
+
 class GearType(models.Model):
 
     name = models.CharField(max_length=30)
@@ -190,21 +269,122 @@ class GearType(models.Model):
         return self.name
 
     def requires_certs(self):
-        return True if self.min_required_certs else False
+        return bool(self.get_required_cert_ids())
+
+    @staticmethod
+    def get_required_cert_table():
+        """
+        Get the name and the set of ids of the required certifications of every gear type, by gear type id
+
+        The whole table is loaded with two queries and cached, since it is needed for every checkout
+        """
+
+        def load():
+            table = {pk: (name, set()) for pk, name in GearType.objects.values_list("pk", "name")}
+            required = GearType.min_required_certs.through.objects.values_list("geartype_id", "certification_id")
+            for geartype_id, cert_id in required:
+                table[geartype_id][1].add(cert_id)
+            return {pk: (name, frozenset(cert_ids)) for pk, (name, cert_ids) in table.items()}
+
+        return rental_eligibility_cache.get("geartypes", load)
+
+    @staticmethod
+    def get_required_cert_ids_for(geartype_id):
+        table = GearType.get_required_cert_table()
+        if geartype_id not in table:
+            # The gear type was created by another process after the table was cached here
+            rental_eligibility_cache.clear()
+            table = GearType.get_required_cert_table()
+        return table.get(geartype_id, (None, frozenset()))[1]
+
+    def get_required_cert_ids(self):
+        return self.get_required_cert_ids_for(self.pk)
+
+    @staticmethod
+    def get_missing_cert_ids(member, geartype_id):
+        """Get the ids of the certifications the member needs, but doesn't have, to rent gear of this gear type"""
+        return GearType.get_required_cert_ids_for(geartype_id) - member.get_cert_ids()
+
+    @staticmethod
+    def split_by_eligibility(member):
+        """
+        Find out which gear types the member has the certifications to rent
+
+        :return: list of the names of the gear types they may rent, list of names of the gear types they may not rent
+        """
+        member_certs = member.get_cert_ids()
+        allowed = []
+        not_allowed = []
+        for name, required in sorted(GearType.get_required_cert_table().values()):
+            if required <= member_certs:
+                allowed.append(name)
+            else:
+                not_allowed.append(name)
+        return allowed, not_allowed
+
+    @staticmethod
+    def get_schema_for(geartype_id):
+        """
+        Get the GearTypeSchema of the gear type with the given id
+
+        The schema is only loaded from the database the first time a gear type is used in each process, so working with
+        the custom data of a piece of gear usually costs no queries at all.
+        """
+        return gear_schema_cache.get(geartype_id, lambda: GearTypeSchema.load(geartype_id))
+
+    @staticmethod
+    def prefetch_schemas(geartype_ids):
+        """Load the schemas of all the given gear types that aren't cached yet at once, i.e. for a list of gear"""
+        gear_schema_cache.get_many(set(geartype_ids), GearTypeSchema.load_many)
+
+    @staticmethod
+    def get_data_fields_for(geartype_id):
+        """Get the custom data fields of the gear type with the given id, as an ordered dict of name: CustomDataField"""
+        return GearType.get_schema_for(geartype_id).data_fields
+
+    def get_schema(self):
+        return self.get_schema_for(self.pk)
+
+    def get_data_fields(self):
+        return self.get_data_fields_for(self.pk)
 
     def get_field_names(self):
         """Return a list of the names of fields included in this gear type"""
-        field_names = []
-        for field in self.data_fields.all():
-            field_names.append(field.name)
-        return field_names
+        return list(self.get_schema().field_names)
 
     def build_empty_data(self):
         """Construct a empty gear data dict that contains no gear data"""
-        data_dict = {}
-        for field in self.data_fields.all():
-            data_dict[field.name] = field.serialize()
-        return data_dict
+        return self.get_schema().build_empty_data()
+
+
+class GearQuerySet(models.QuerySet):
+    def filter_data(self, **lookups):
+        """
+        Filter gear by the values stored in their custom data fields
+
+        Each keyword is the name of a CustomDataField, optionally followed by a lookup, for example:
+            Gear.objects.filter_data(size="M", length__gt=170)
+
+        The filtering is done on the indexed GearDataValue table, so it does not need to parse any gear_data
+        """
+        queryset = self
+        for key, value in lookups.items():
+            name, _, lookup = key.partition("__")
+            try:
+                field = CustomDataField.objects.get(name=name)
+            except CustomDataField.DoesNotExist:
+                raise FieldError(f"There is no custom data field named {name}!")
+
+            column = GearDataValue.get_column(field.data_type)
+            if lookup == "in" and isinstance(value, str):
+                value = [GearDataValue.coerce(field.data_type, v) for v in value.split(",")]
+            elif lookup != "isnull":
+                value = GearDataValue.coerce(field.data_type, value)
+
+            condition = {f"{column}__{lookup}" if lookup else column: value}
+            matching_values = GearDataValue.objects.filter(gear=OuterRef("pk"), field=field, **condition)
+            queryset = queryset.filter(Exists(matching_values))
+        return queryset
 
 
 class GearManager(models.Manager):
@@ -219,17 +399,47 @@ class GearManager(models.Manager):
         gear = Gear(rfid=rfid, status=0, geartype=geartype, image=image)
 
         # Filter out any passed data that is not referenced by the gear type
-        extra_fields = CustomDataField.objects.filter(geartype=geartype)
+        extra_fields = GearType.get_data_fields_for(geartype.pk).values()
         data_dict = {}
         for field in extra_fields:
             data_dict[field.name] = field.serialize(**gear_data[field.name])
 
-        # Add in the additional data as a string before saving the piece of gear
+        # Add in the additional data as a string before saving the piece of gear (this also sets the stored name)
         gear.gear_data = json.dumps(data_dict)
         gear.save()
 
         return gear
 
+    def refresh_display_data(self, queryset=None, batch_size=500):
+        """
+        Recompute the stored names and display data of the given gear (all gear by default)
+
+        This should be run whenever something that is shown in the name of gear changes, for example after a gear type
+        is renamed or its data fields are changed. It also serves to backfill the stored names of existing gear.
+
+        :return: the number of pieces of gear that were updated
+        """
+        if queryset is None:
+            queryset = self.all()
+
+        batch = []
+        updated = 0
+        for gear in queryset.select_related("geartype").iterator(chunk_size=batch_size):
+            gear.refresh_display_data()
+            batch.append(gear)
+            if len(batch) >= batch_size:
+                updated += self.__save_display_data(batch)
+                batch = []
+
+        if batch:
+            updated += self.__save_display_data(batch)
+        return updated
+
+    def __save_display_data(self, batch):
+        self.bulk_update(batch, ["display_name", "display_data"])
+        gear_changed.send(sender=Gear, gear_ids=[gear.pk for gear in batch], renamed=True)
+        return len(batch)
+
     def _add(self, rfid, name, geartype, **gear_data):
         """
         Alias for gear creation
@@ -245,10 +455,11 @@ class Gear(models.Model):
     The base model for a piece of gear
     """
 
-    objects = GearManager()
+    objects = GearManager.from_queryset(GearQuerySet)()
 
     class Meta:
         verbose_name_plural = "Gear"
+        indexes = [models.Index(fields=["status", "due_date"])]
 
     primary_key = PrimaryKeyField()
     rfid = models.CharField(max_length=10, unique=True)
@@ -288,32 +499,105 @@ class Gear(models.Model):
 
     gear_data = models.CharField(max_length=2000)
 
+    #: The name of the gear (see build_name), stored so that lists can show and sort by name without any extra queries
+    display_name = models.CharField(
+        max_length=300, default="", db_index=True, editable=False, verbose_name="Name"
+    )
+
+    #: The JSON encoded result of build_display_gear_data, stored for the same reason as display_name
+    display_data = models.CharField(max_length=2000, default="{}", editable=False)
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        gear = super().from_db(db, field_names, values)
+        gear._indexed_gear_data = gear.__dict__.get("gear_data")
+        gear._registered_rfid = gear.__dict__.get("rfid")
+        return gear
+
+    def save(self, *args, **kwargs):
+        """
+        Save the gear, keeping the stored name and the indexed copies of the custom data up to date with gear_data, and
+        registering the rfid in the RFIDTag directory whenever it changes
+        """
+        update_fields = kwargs.get("update_fields")
+        gear_data_saved = update_fields is None or "gear_data" in update_fields
+        gear_data_changed = gear_data_saved and self.gear_data != self.__dict__.get("_indexed_gear_data")
+        rfid_saved = update_fields is None or "rfid" in update_fields
+        rfid_changed = rfid_saved and self.rfid != self.__dict__.get("_registered_rfid")
+
+        # The name of gear is shown on other pages too, see core.signals.gear_saved
+        self._name_changed = gear_data_changed
+        if gear_data_changed:
+            self.refresh_display_data()
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields) | {"display_name", "display_data"}
+
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+
+            if rfid_changed:
+                RFIDTag.objects.register(RFIDTag.GEAR, self.pk, self.rfid)
+            if gear_data_changed:
+                GearDataValue.objects.sync(self)
+
+        if rfid_changed:
+            self._registered_rfid = self.rfid
+        if gear_data_changed:
+            self._indexed_gear_data = self.gear_data
+        self.__dict__.pop("_decoded_gear_data", None)
+
+    def refresh_display_data(self):
+        """Recompute the stored name and display data. Does not save the gear"""
+        self.display_name = self.build_name()
+        self.display_data = json.dumps(self.build_display_gear_data())
+
     def __getattr__(self, item):
         """
         Allows the values of CustomDataFields stored in GearType to be accessed as if they were attributes of Gear
+
+        This gets called by django and the templates for all sorts of attributes that gear doesn't have, so it must
+        fail fast: private names are never data fields, and the fields of the gear type are cached per gear type.
         """
+        if item.startswith("_") or "gear_data" not in self.__dict__:
+            raise AttributeError(f"Gear has no attribute {item}!")
 
-        gear_data = json.loads(self.__getattribute__("gear_data"))
+        geartype_id = self.__dict__.get("geartype_id")
+        data_fields = GearType.get_data_fields_for(geartype_id) if geartype_id else {}
+        if item in data_fields:
+            gear_data = self.get_gear_data()
+            if item in gear_data:
+                return data_fields[item].get_value(gear_data[item])
 
-        if item is None:
-            return self
-        elif item in gear_data.keys():
-            geartype = self.__getattribute__("geartype")
-            field = geartype.data_fields.get(name=item)
-            return field.get_value(gear_data[item])
-        else:
-            raise AttributeError(f"No attribute {item} for {repr(self)}!")
+        # Don't use repr(self) in the message, building the name of the gear might need extra queries
+        raise AttributeError(f"Gear has no attribute {item}!")
+
+    def get_gear_data(self):
+        """
+        Get the decoded gear_data dict
+
+        The JSON is only parsed once per instance, and parsed again only if gear_data is changed. Don't modify the
+        returned dict in place, it is shared by all the callers.
+        """
+        cached = self.__dict__.get("_decoded_gear_data")
+        if cached is None or cached[0] != self.gear_data:
+            cached = (self.gear_data, json.loads(self.gear_data))
+            self._decoded_gear_data = cached
+        return cached[1]
 
     def get_display_gear_data(self):
-        """Return the gear data as a simple dict of field_name, field_value"""
+        """Return the gear data as a simple dict of field_name, field_value, as stored in display_data"""
+        return json.loads(self.display_data)
+
+    def build_display_gear_data(self):
+        """Build the simple dict of field_name, field_value from gear_data"""
         simple_data = {}
-        attr_fields = self.geartype.data_fields.all()
-        gear_data = json.loads(self.gear_data)
-        for field in attr_fields:
-            simple_data[field.name] = field.get_str(gear_data[field.name])
+        gear_data = self.get_gear_data()
+        for field in GearType.get_data_fields_for(self.geartype_id).values():
+            if field.name in gear_data:
+                simple_data[field.name] = field.get_str(gear_data[field.name])
         return simple_data
 
     @property
@@ -332,7 +616,7 @@ class Gear(models.Model):
         """Get a fieldset that contains data on how to represent the extra data fields contained in geartype"""
         fieldset = (
             name,
-            {"classes": classes, "fields": self.geartype.get_field_names()},
+            {"classes": classes, "fields": GearType.get_schema_for(self.geartype_id).field_names},
         )
         return fieldset
 
@@ -346,6 +630,10 @@ class Gear(models.Model):
 
     @property
     def name(self):
+        """The name of this gear, as stored in display_name. See build_name"""
+        return self.display_name or self.build_name()
+
+    def build_name(self):
         """
         Auto-generate a name that can (semi-uniquely) identify this piece of gear
 
@@ -353,10 +641,12 @@ class Gear(models.Model):
         """
 
         # Get all custom data fields for this data_type, except those that contain a rfid
-        attr_fields = self.geartype.data_fields.exclude(data_type="rfid")
+        attr_fields = GearType.get_data_fields_for(self.geartype_id).values()
         attributes = []
-        gear_data = json.loads(self.gear_data)
+        gear_data = self.get_gear_data()
         for field in attr_fields:
+            if field.data_type == "rfid" or field.name not in gear_data:
+                continue
             string = field.get_str(gear_data[field.name])
             if string:
                 attributes.append(str(string))
@@ -367,7 +657,7 @@ class Gear(models.Model):
         else:
             name = self.geartype.name
 
-        return name
+        return name[:300]
 
     def get_department(self):
         return self.geartype.department
@@ -394,3 +684,88 @@ class Gear(models.Model):
             return True
         else:
             return False
+
+
+class GearDataValueManager(models.Manager):
+    def build_for(self, gear, data_fields=None):
+        """Construct (but do not save) the indexed values for all the custom data of a piece of gear"""
+        if data_fields is None:
+            data_fields = GearType.get_data_fields_for(gear.geartype_id).values()
+        gear_data = gear.get_gear_data()
+
+        data_values = []
+        for field in data_fields:
+            if field.name not in gear_data:
+                continue
+            data_value = self.model(gear=gear, field=field)
+            data_value.set_value(field.data_type, field.get_value(gear_data[field.name]))
+            data_values.append(data_value)
+        return data_values
+
+    def sync(self, gear):
+        """Replace the indexed values of a piece of gear with those currently stored in its gear_data"""
+        self.filter(gear=gear).delete()
+        self.bulk_create(self.build_for(gear))
+
+
+class GearDataValue(models.Model):
+    """
+    Indexed copy of the value of a single CustomDataField for one piece of gear
+
+    The gear_data JSON on Gear remains the source of truth, but it cannot be searched without scanning and parsing every
+    piece of gear. Each value is additionally stored here, in the column matching its data type, so that questions like
+    "which wetsuits are size M" or "which skis are longer than 170cm" are answered with an indexed query.
+    """
+
+    objects = GearDataValueManager()
+
+    #: Which column each data type of CustomDataField is stored in. Any type not listed here is stored as text
+    type_columns = {
+        "int": "number_value",
+        "float": "number_value",
+        "boolean": "bool_value",
+    }
+
+    gear = models.ForeignKey(Gear, on_delete=models.CASCADE, related_name="data_values")
+    field = models.ForeignKey(CustomDataField, on_delete=models.CASCADE)
+
+    text_value = models.CharField(max_length=300, null=True, blank=True)
+    number_value = models.FloatField(null=True, blank=True)
+    bool_value = models.BooleanField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("gear", "field")
+        indexes = [
+            models.Index(fields=["field", "text_value"]),
+            models.Index(fields=["field", "number_value"]),
+            models.Index(fields=["field", "bool_value"]),
+        ]
+
+    def __str__(self):
+        return f"{self.field}: {self.value}"
+
+    @classmethod
+    def get_column(cls, data_type):
+        """Get the name of the column that values of the given data type are stored in"""
+        return cls.type_columns.get(data_type, "text_value")
+
+    @staticmethod
+    def coerce(data_type, value):
+        """Convert a value (possibly a string from a form or url) into the python type stored for the data type"""
+        if value is None:
+            return None
+        elif data_type in ("int", "float"):
+            return float(value)
+        elif data_type == "boolean":
+            if isinstance(value, str):
+                return value.lower() in ("true", "1", "yes", "on")
+            return bool(value)
+        else:
+            return str(value)[:300]
+
+    @property
+    def value(self):
+        return getattr(self, self.get_column(self.field.data_type))
+
+    def set_value(self, data_type, value):
+        setattr(self, self.get_column(data_type), self.coerce(data_type, value))
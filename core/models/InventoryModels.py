@@ -0,0 +1,132 @@
+import json
+import re
+import zlib
+from datetime import date
+from itertools import chain
+
+from django.db import models
+from django.utils.timezone import now
+from uwccsystem.settings import INVENTORY_SNAPSHOT_LAG
+
+from .ArchiveModels import TransactionArchive
+from .fields.PrimaryKeyField import time_to_id
+from .TransactionModels import Transaction
+
+#: The status the gear has after transactions that did not record the state of the gear yet, None if it is unchanged
+LEGACY_STATUS = {
+    "Create": 0,
+    "CheckOut": 1,
+    "CheckIn": 0,
+    "Inventory": 0,
+    "Fix": 0,
+    "Break": 2,
+    "Missing": 3,
+    "Dormant": 4,
+    "Delete": 5,
+}
+
+RETURN_DATE = re.compile(r"Return date = (\d{4}-\d{2}-\d{2})")
+
+
+def apply_transaction(inventory, gear_id, type, member_id, comments, status, holder_id, due_date):
+    """
+    Change the inventory by one transaction
+
+    Transactions record the state of their gear, older transactions only have their type, member and comments. The
+    state after those is guessed from the type, like the transaction manager would have changed the gear.
+    """
+    if status is not None:
+        inventory[gear_id] = (status, holder_id, due_date)
+        return
+
+    _, last_holder_id, last_due_date = inventory.get(gear_id, (0, None, None))
+    status = LEGACY_STATUS.get(type)
+    if type == "CheckOut":
+        match = RETURN_DATE.search(comments)
+        inventory[gear_id] = (status, member_id, date.fromisoformat(match.group(1)) if match else None)
+    elif type in ("CheckIn", "Delete"):
+        inventory[gear_id] = (status, None, None)
+    elif status is not None:
+        inventory[gear_id] = (status, last_holder_id, last_due_date)
+    elif gear_id not in inventory:
+        # A retag or an override of gear created before any transaction was kept, the state is unknown
+        inventory[gear_id] = (None, None, None)
+
+
+class InventorySnapshotManager(models.Manager):
+    def inventory_at(self, moment):
+        """
+        Get the state of all gear at a point in time, for audits and insurance claims
+
+        Starts from the last snapshot taken before that time, and only replays the transactions made since. With a
+        snapshot every day, that is at most a day of transactions.
+
+        :param moment: datetime, or a date for the start of that day
+        :return: dict of gear id: (status, id of the member who had it, due date)
+        """
+        snapshot = self.filter(pk__lte=time_to_id(moment)).order_by("-pk").first()
+        if snapshot is None:
+            inventory, start = {}, None
+        else:
+            inventory, start = snapshot.get_inventory(), snapshot.taken_at
+
+        # Archived transactions are all older than the ones still in the transactions table
+        fields = ("gear_id", "type", "member_id", "comments", "gear_status", "gear_holder_id", "gear_due_date")
+        archived = ([row[field] for field in fields] for row in TransactionArchive.objects.rows_between(start, moment))
+        rows = Transaction.objects.created_between(start, moment).order_by("pk").values_list(*fields)
+        for row in chain(archived, rows.iterator(chunk_size=2000)):
+            apply_transaction(inventory, *row)
+        return inventory
+
+    def take(self):
+        """
+        Save a snapshot of the inventory as of INVENTORY_SNAPSHOT_LAG ago
+
+        Transactions that are still being saved can have slightly older ids than ones that are already saved, so the
+        snapshot stays a little behind to never leave one out.
+        """
+        taken_at = now() - INVENTORY_SNAPSHOT_LAG
+        inventory = self.inventory_at(taken_at)
+        snapshot = self.model(primary_key=time_to_id(taken_at), taken_at=taken_at, num_gear=len(inventory))
+        snapshot.set_inventory(inventory)
+        snapshot.save(using=self._db)
+        return snapshot
+
+
+class InventorySnapshot(models.Model):
+    """
+    The state of all gear at one point in time, as replayed from the transactions (see Transaction)
+
+    Snapshots are taken by the snapshot_inventory task, so the inventory at any time can be found by replaying only the
+    transactions since the last snapshot before it. The state is stored as compressed JSON to keep the snapshots small.
+    """
+
+    objects = InventorySnapshotManager()
+
+    #: The id of the first transaction that is not included, so snapshots are ordered the same way as transactions
+    primary_key = models.BigIntegerField(primary_key=True)
+
+    #: The snapshot includes all the transactions made before this time
+    taken_at = models.DateTimeField()
+
+    num_gear = models.PositiveIntegerField()
+
+    #: zlib compressed JSON list of [gear id, status, member id, due date] of every piece of gear
+    data = models.BinaryField()
+
+    def __str__(self):
+        return f"Inventory of {self.num_gear} pieces of gear at {self.taken_at:%Y-%m-%d %H:%M}"
+
+    def set_inventory(self, inventory):
+        rows = [
+            [gear_id, status, holder_id, due_date.isoformat() if due_date else None]
+            for gear_id, (status, holder_id, due_date) in inventory.items()
+        ]
+        self.data = zlib.compress(json.dumps(rows, separators=(",", ":")).encode())
+
+    def get_inventory(self):
+        rows = json.loads(zlib.decompress(self.data))
+        return {
+            gear_id: (status, holder_id, date.fromisoformat(due_date) if due_date else None)
+            for gear_id, status, holder_id, due_date in rows
+        }
@@ -0,0 +1,40 @@
+from django.db import models, transaction
+
+from .MemberModels import Member
+
+
+class ListservSubscriptionManager(models.Manager):
+    def get_changes(self):
+        """
+        Compare the active members with the emails that were last pushed to the listserv
+
+        :return: set of emails to add to the listserv, set of emails to remove from it, set of all active emails
+        """
+        active = set(Member.objects.active().values_list("email", flat=True).iterator(chunk_size=2000))
+        subscribed = set(self.values_list("email", flat=True).iterator(chunk_size=2000))
+        return active - subscribed, subscribed - active, active
+
+    @transaction.atomic
+    def record(self, added, removed):
+        """Remember that the given emails were added to and removed from the listserv"""
+        removed = list(removed)
+        for start in range(0, len(removed), 1000):
+            self.filter(email__in=removed[start:start + 1000]).delete()
+        self.bulk_create([self.model(email=email) for email in added], batch_size=1000, ignore_conflicts=True)
+
+
+class ListservSubscription(models.Model):
+    """
+    An email that is on the listserv, as far as the last update_listserv knows
+
+    The listserv can't be asked who is on it, so the emails that were pushed to it are kept here. That way an update only
+    has to send the members that joined or expired since the last one, instead of the whole list.
+    """
+
+    objects = ListservSubscriptionManager()
+
+    email = models.EmailField(unique=True)
+    subscribed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.email
@@ -1,3 +1,4 @@
+from core.caching import ProcessCache
 from core.models.fields.PrimaryKeyField import PrimaryKeyField
 from django.contrib.auth.models import (
     AbstractBaseUser,
@@ -7,16 +8,62 @@ from django.contrib.auth.models import (
     PermissionsMixin,
 )
 from django.core.mail import send_mail
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
 from django.urls import reverse
 from django.utils.timezone import datetime, now, timedelta
 from uwccsystem import settings
 from phonenumber_field.modelfields import PhoneNumberField
 from core.convinience import get_email_template
 
-from .CertificationModels import Certification
+from .CertificationModels import Certification, rental_eligibility_cache
+from .EmailModels import OutboxEmail
 from .fields.RFIDField import RFIDField
-from core import emailing
+from .RFIDModels import RFIDTag
+
+
+#: Sent with the member_ids and group_name when members are moved to a group in bulk, which doesn't send post_save
+members_moved = Signal()
+
+#: The permissions of every group and the extra permissions of individual members, see Member.get_permission_names.
+#: Invalidated by the signals in core.signals whenever any permissions are changed
+permission_cache = ProcessCache("permissions")
+
+
+def load_permission_matrix():
+    """
+    Load the names ("app_label.codename") of the permissions of all groups and members
+
+    :return: dict of group name: frozenset of permission names, dict of member id: frozenset of permission names
+    """
+    group_perms = {}
+    for group, app_label, codename in Group.permissions.through.objects.values_list(
+        "group__name", "permission__content_type__app_label", "permission__codename"
+    ):
+        group_perms.setdefault(group, set()).add(f"{app_label}.{codename}")
+
+    member_perms = {}
+    for member_id, app_label, codename in Member.user_permissions.through.objects.values_list(
+        "member_id", "permission__content_type__app_label", "permission__codename"
+    ):
+        member_perms.setdefault(member_id, set()).add(f"{app_label}.{codename}")
+
+    return (
+        {group: frozenset(perms) for group, perms in group_perms.items()},
+        {member_id: frozenset(perms) for member_id, perms in member_perms.items()},
+    )
+
+
+def get_permission_holders(permission_name):
+    """
+    Find who has a permission, using the cached permission matrix
+
+    :return: list of group names with the permission, list of ids of members who were given the permission directly
+    """
+    group_perms, member_perms = permission_cache.get("matrix", load_permission_matrix)
+    groups = [group for group, perms in group_perms.items() if permission_name in perms]
+    member_ids = [member_id for member_id, perms in member_perms.items() if permission_name in perms]
+    return groups, member_ids
 
 
 def get_profile_pic_upload_location(instance, filename):
@@ -33,7 +80,46 @@ def get_profile_pic_upload_location(instance, filename):
     return location
 
 
-class MemberManager(BaseUserManager):
+class MemberQuerySet(models.QuerySet):
+    def active(self):
+        """
+        Filter to the members with a valid membership: is_active_member is true and the membership has not run out yet
+
+        This is done in SQL over the group shortcut field and the expiration date, so it doesn't need a permission check
+        for every member. Superusers have every permission, so they are included whatever their group is
+        """
+        groups, member_ids = get_permission_holders("core.is_active_member")
+        has_permission = models.Q(group__in=groups) | models.Q(is_superuser=True)
+        if member_ids:
+            has_permission |= models.Q(pk__in=member_ids)
+        return self.filter(has_permission, is_active=True, date_expires__gte=now().date())
+
+    def move_to_group(self, group_name):
+        """
+        Move all these members to a group, like Member.move_to_group does for one member
+
+        This is one UPDATE of the group shortcut field and a bulk replace of the group memberships, so no member is
+        loaded or saved, and the members_moved signal is sent instead of post_save
+
+        :return: the ids of the members that were moved
+        """
+        group = Group.objects.get(name=group_name)
+        member_ids = list(self.values_list("pk", flat=True))
+        if not member_ids:
+            return member_ids
+
+        memberships = Member.groups.through
+        with transaction.atomic():
+            Member.objects.filter(pk__in=member_ids).update(group=group.name)
+            memberships.objects.filter(member_id__in=member_ids).delete()
+            memberships.objects.bulk_create(
+                [memberships(member_id=member_id, group_id=group.pk) for member_id in member_ids]
+            )
+        members_moved.send(sender=Member, member_ids=member_ids, group_name=group.name)
+        return member_ids
+
+
+class MemberManager(BaseUserManager.from_queryset(MemberQuerySet)):
     def create_member(self, email, rfid, membership_duration, password=None):
         """
         Creates and saves a Member with the given email, date of
@@ -109,6 +195,10 @@ class Member(AbstractBaseUser, PermissionsMixin):
     """This is the base model for all members (this includes staffers)"""
 
     objects = MemberManager()
+
+    class Meta:
+        indexes = [models.Index(fields=["group", "date_expires"])]
+
     primary_key = PrimaryKeyField()
 
     # Personal contact information
@@ -133,6 +223,8 @@ class Member(AbstractBaseUser, PermissionsMixin):
     # Membership data
     date_joined = models.DateField(auto_now_add=True)
     date_expires = models.DateField(null=False)
+    #: The expiration date the member was last warned about, so they are only warned once for every membership
+    expiry_warned_for = models.DateField(null=True, blank=True, editable=False)
     rfid = RFIDField(verbose_name="RFID")
     group = models.CharField(default="Unset", max_length=30)
     is_admin = models.BooleanField(default=False)
@@ -196,9 +288,34 @@ class Member(AbstractBaseUser, PermissionsMixin):
         all_certs = self.certifications.all()
         return all_certs
 
+    def get_cert_ids(self):
+        """Get the ids of all the certifications of this member as a set, cached so that checkouts need no queries"""
+        return rental_eligibility_cache.get(
+            ("member", self.pk), lambda: frozenset(self.certifications.values_list("pk", flat=True))
+        )
+
     def has_no_certifications(self):
         return len(self.certifications.all()) == 0
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        member = super().from_db(db, field_names, values)
+        member._registered_rfid = member.__dict__.get("rfid")
+        return member
+
+    def save(self, *args, **kwargs):
+        """Save the member, registering their rfid in the RFIDTag directory whenever it changes"""
+        update_fields = kwargs.get("update_fields")
+        rfid_saved = update_fields is None or "rfid" in update_fields
+        if not rfid_saved or self.rfid == self.__dict__.get("_registered_rfid"):
+            super().save(*args, **kwargs)
+            return
+
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+            RFIDTag.objects.register(RFIDTag.MEMBER, self.pk, self.rfid)
+        self._registered_rfid = self.rfid
+
     def __str__(self):
         """
         If we know the name of the user, then display their name, otherwise use their email
@@ -241,49 +358,71 @@ class Member(AbstractBaseUser, PermissionsMixin):
 
         return self
 
-    def send_email(self, title, body, from_email, email_host_password):
-        """Sends an email to the member"""
-        emailing.send_email(
+    def send_email(self, title, body, from_email, credentials=OutboxEmail.DEFAULT, batch=None):
+        """
+        Sends an email to the member
+
+        The email is saved to the outbox and sent in the background by the send_emails task. To send it right away
+        instead, pass an emailing.EmailBatch to send it over.
+        """
+        email = OutboxEmail.objects.build(
             [self.email],
             title,
             body,
             from_email=from_email,
-            smtp_password=email_host_password,
             from_name='Excursion Club',
-            receiver_names=[self.get_full_name()]
+            receiver_names=[self.get_full_name()],
+            credentials=credentials,
         )
-
-    def send_membership_email(self, title, body):
-        """Send an email to the member from the membership email"""
-        emailing.send_membership_email(
-            [self.email],
-            title,
-            body,
-            receiver_names=[self.get_full_name()]
-        )
-
-    def send_intro_email(self, finish_signup_url):
+        self._send_or_enqueue(email, batch)
+
+    def send_membership_email(self, title, body, batch=None):
+        """Send an email to the member from the membership email, see send_email for the batch"""
+        self._send_or_enqueue(self.build_membership_email(title, body), batch)
+
+    @staticmethod
+    def _send_or_enqueue(email, batch):
+        if batch is None:
+            email.save()
+            return
+        error = email.send(batch)
+        if error is not None:
+            raise error
+
+    def send_intro_email(self, finish_signup_url, batch=None):
         """Send the introduction email with the link to finish signing up to the member"""
         title = "Finish Signing Up"
         template = get_email_template('intro_email')
         body = template.format(finish_signup_url=finish_signup_url)
-        self.send_membership_email(title, body)
+        self.send_membership_email(title, body, batch=batch)
 
-    def send_expires_soon_email(self):
-        """Send an email warning the member that their membership will soon expire"""
+    def build_membership_email(self, title, body):
+        """Make the (unsaved) OutboxEmail of send_membership_email, i.e. to save the emails of many members at once"""
+        return OutboxEmail.objects.build_membership([self.email], title, body, receiver_names=[self.get_full_name()])
+
+    def build_expires_soon_email(self):
+        """Make the (unsaved) email warning the member that their membership will soon expire"""
         title = "Climbing Club Membership Expiring Soon!"
         template = get_email_template('expire_soon_email')
         body = template.format(member_name=self.get_full_name(), expiration_date=self.date_expires)
-        self.send_membership_email(title, body)
+        return self.build_membership_email(title, body)
 
-    def send_expired_email(self):
-        """Send an email warning the member that their membership will soon expire"""
+    def build_expired_email(self):
+        """Make the (unsaved) email telling the member that their membership has expired"""
         title = "Climbing Club Membership Expired!"
         template = get_email_template('expired_email')
         body = template.format(member_name=self.get_full_name(), today=self.date_expires)
-        self.send_membership_email(title, body)
+        return self.build_membership_email(title, body)
+
+    def send_expires_soon_email(self, batch=None):
+        """Send an email warning the member that their membership will soon expire"""
+        self._send_or_enqueue(self.build_expires_soon_email(), batch)
+
+    def send_expired_email(self, batch=None):
+        """Send an email telling the member that their membership has expired"""
+        self._send_or_enqueue(self.build_expired_email(), batch)
 
-    def send_missing_gear_email(self, all_gear):
+    def send_missing_gear_email(self, all_gear, batch=None):
         """Send an email to member that they have gear to return"""
         gear_rows = []
         for gear in all_gear:
@@ -295,10 +434,11 @@ class Member(AbstractBaseUser, PermissionsMixin):
             title,
             body,
             'info@excursionclubucsb.org',
-            settings.MEMBERSHIP_EMAIL_HOST_PASSWORD,
+            credentials=OutboxEmail.MEMBERSHIP,
+            batch=batch,
         )
 
-    def send_new_staff_email(self, staffer):
+    def send_new_staff_email(self, staffer, batch=None):
         """Sen an email welcoming the member to staff"""
         title = "Welcome to staff!"
         template = get_email_template('new_staffer')
@@ -307,14 +447,37 @@ class Member(AbstractBaseUser, PermissionsMixin):
             finish_url=settings.WEB_BASE+staffer.edit_profile_url,
             staffer_email=staffer.exc_email
         )
-        self.send_membership_email(title, body)
+        self.send_membership_email(title, body, batch=batch)
 
     def has_module_perms(self, app_label):
         """This is required by django, determine whether the user is allowed to view the app"""
         return True
 
+    def get_permission_names(self):
+        """
+        Get the names of all the permissions of this member, those of their group (see the group shortcut field) and any
+        permissions given to them directly
+        """
+        group_perms, member_perms = permission_cache.get("matrix", load_permission_matrix)
+        perms = group_perms.get(self.group, frozenset())
+        if self.pk in member_perms:
+            perms = perms | member_perms[self.pk]
+        return perms
+
+    def has_perm(self, perm, obj=None):
+        """
+        Check the permission against the cached permissions of the member's group, without any queries
+
+        Object permissions are not used by this system, so those are still left to the authentication backends
+        """
+        if obj is not None:
+            return super().has_perm(perm, obj=obj)
+        if not self.is_active:
+            return False
+        return self.is_superuser or perm in self.get_permission_names()
+
     def has_permission(self, permission_name):
-        """Loop through all the permissions of the group associated with this member to see if they have this one"""
+        """Check whether the group associated with this member (or the member themselves) has this permission"""
         return self.has_perm(permission_name)
 
     def move_to_group(self, group_name):
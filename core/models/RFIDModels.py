@@ -0,0 +1,103 @@
+from core.caching import SharedCache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+
+#: What each scanned rfid belongs to, see RFIDTagManager.resolve
+rfid_tag_cache = SharedCache("rfid_tags")
+
+
+class RFIDTagManager(models.Manager):
+    def is_in_use(self, rfid):
+        """Returns True if the rfid already belongs to a member or a piece of gear"""
+        return self.filter(rfid=rfid).exists()
+
+    def in_use(self, rfids):
+        """Of the given rfids, get the set of those that already belong to a member or a piece of gear"""
+        return set(self.filter(rfid__in=rfids).values_list("rfid", flat=True))
+
+    def resolve(self, rfid):
+        """
+        Find out what the rfid belongs to
+
+        The answer is cached for every scanned rfid, and dropped by register and release when the rfid changes owner
+
+        :return: (kind, object_id), where kind is one of the kinds of RFIDTag, or (None, None) if the rfid is not in use
+        """
+
+        def load():
+            tag = self.filter(rfid=rfid).values_list("kind", "object_id").first()
+            return tuple(tag) if tag else (None, None)
+
+        return rfid_tag_cache.get(rfid, load)
+
+    def register(self, kind, object_id, rfid):
+        """
+        Record that the object now has the given rfid, replacing any rfid it had before
+
+        :raises ValidationError: if the rfid already belongs to something else
+        """
+        tags = self.filter(kind=kind, object_id=object_id)
+        old_rfids = list(tags.values_list("rfid", flat=True))
+        if old_rfids == [rfid] or (not old_rfids and not rfid):
+            return
+
+        try:
+            with transaction.atomic(using=self.db):
+                if not rfid:
+                    tags.delete()
+                elif not tags.update(rfid=rfid):
+                    self.create(kind=kind, object_id=object_id, rfid=rfid)
+        except IntegrityError:
+            raise ValidationError(f"The rfid {rfid} is already in use!")
+        changed = [*old_rfids, *([rfid] if rfid else [])]
+        # Only once the change is saved, or another request could cache the old owner again in the meantime
+        transaction.on_commit(lambda: rfid_tag_cache.delete(*changed), using=self.db)
+
+    def register_new(self, kind, rfids):
+        """
+        Record the rfids of many objects that didn't have one yet at once, i.e. gear that was just imported
+
+        Unknown rfids are cached too, so the cached entries are dropped as well once the rfids are saved
+
+        :param rfids: dict of object id: rfid
+        """
+        self.bulk_create([self.model(kind=kind, object_id=object_id, rfid=rfid) for object_id, rfid in rfids.items()])
+        new_rfids = list(rfids.values())
+        transaction.on_commit(lambda: rfid_tag_cache.delete(*new_rfids), using=self.db)
+
+    def release(self, kind, object_id):
+        """Forget the rfid of an object, i.e. because it was deleted"""
+        tags = self.filter(kind=kind, object_id=object_id)
+        old_rfids = list(tags.values_list("rfid", flat=True))
+        tags.delete()
+        transaction.on_commit(lambda: rfid_tag_cache.delete(*old_rfids), using=self.db)
+
+
+class RFIDTag(models.Model):
+    """
+    Directory of every rfid in use, by members and gear alike
+
+    Members and gear each store their own rfid, but an rfid must never be used by both a member and a piece of gear. The
+    unique index on this table enforces that in the database, and lets any scanned tag be resolved in a single lookup.
+    Tags are kept up to date by Member.save and Gear.save, so they should never need to be edited directly.
+    """
+
+    objects = RFIDTagManager()
+
+    MEMBER = "member"
+    GEAR = "gear"
+    kinds = ((MEMBER, "Member"), (GEAR, "Gear"))
+
+    rfid = models.CharField(max_length=10, unique=True)
+
+    #: What the rfid belongs to
+    kind = models.CharField(max_length=10, choices=kinds)
+
+    #: The primary key of the member or gear the rfid belongs to
+    object_id = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ("kind", "object_id")
+
+    def __str__(self):
+        return f"{self.rfid} ({self.kind})"
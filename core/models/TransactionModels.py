@@ -2,12 +2,14 @@ import json
 import logging
 
 from datetime import date
-from core.convinience import get_all_rfids
 from core.models.fields.PrimaryKeyField import PrimaryKeyField
-from core.models.GearModels import Gear
+from core.models.CertificationModels import Certification
+from core.models.FileModels import AlreadyUploadedImage
+from core.models.GearModels import Gear, GearDataValue, GearType, gear_changed
 from core.models.MemberModels import Member
+from core.models.RFIDModels import RFIDTag
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import IntegrityError, models, transaction as db_transaction
 from django.urls import reverse
 
 logger = logging.getLogger(__name__)
@@ -44,21 +46,40 @@ def validate_available(gear):
         raise ValidationError(msg)
 
 
+def validate_rented_out(gear):
+    """Ensure that the piece of gear is checked out (or missing or dormant), so it can be checked in"""
+    if not gear.is_rented_out():
+        msg = f"The {gear.name} with [{gear.rfid}] is not checked out, it is {gear.get_status()}"
+        logger.info(msg)
+        raise ValidationError(msg)
+
+
+def validate_status(gear, status):
+    """Ensure that the piece of gear still has the expected status, i.e. that it was not changed in the meantime"""
+    if gear.status != status:
+        msg = f"The {gear.name} with [{gear.rfid}] is no longer {dict(Gear.status_choices)[status]}"
+        logger.info(msg)
+        raise ValidationError(msg)
+
+
 def validate_rfid(rfid):
     """Ensure that the given rfid is unique across all tables containing rfids."""
-    if rfid in get_all_rfids():
+    if RFIDTag.objects.is_in_use(rfid):
         msg = "This rfid is already in use!"
         logger.info(msg)
         raise ValidationError(msg)
 
 
 def validate_required_certs(member, gear):
-    """Validate that the member has all the certifications required to check out this piece of gear."""
-    missing_certs = []
-    for cert_required in gear.geartype.min_required_certs.all():
-        if cert_required not in member.certifications.all():
-            missing_certs.append(cert_required)
-    if missing_certs:
+    """
+    Validate that the member has all the certifications required to check out this piece of gear.
+
+    The required certifications and those of the member are both cached as sets of ids (see GearType.get_missing_cert_ids)
+    so this usually needs no queries at all.
+    """
+    missing_cert_ids = GearType.get_missing_cert_ids(member, gear.geartype_id)
+    if missing_cert_ids:
+        missing_certs = Certification.objects.filter(pk__in=missing_cert_ids).order_by("title")
         cert_names = [cert.title for cert in missing_certs]
         msg = f"{member.get_full_name()} is missing the following certifications: {cert_names}"
         logger.info(msg)
@@ -72,12 +93,41 @@ class TransactionManager(models.Manager):
     Every modification to any piece of gear should be done through a TransactionManager function, since transactions are
     intended to track any and all state changes of any piece of gear. The transaction creation functions also
     immediately implement the changes described by the transaction.
+
+    Each of these functions runs in a single database transaction and locks the gear it changes, so the transaction and
+    the change to the gear are either both saved or both discarded, even with several kiosks and tasks running at once.
     """
 
+    def created_between(self, start=None, end=None):
+        """
+        Get the transactions created from start up to (not including) end, either of which may be left open
+
+        The ids of transactions start with their creation time, so this is a range scan of the primary key index. Takes
+        dates or datetimes, i.e. created_between(date.today() - timedelta(days=7)) for the transactions of the last week
+        """
+        transactions = self.all()
+        if start is not None:
+            transactions = transactions.filter(pk__created_after=start)
+        if end is not None:
+            transactions = transactions.filter(pk__created_before=end)
+        return transactions
+
+    def __get_locked_gear(self, gear_rfid):
+        """
+        Get a piece of gear, locking it until the end of the current transaction
+
+        Every state change must lock the gear before validating it. Then a second kiosk (or a background task) that
+        tries to change the same piece of gear at the same time waits for the first change to be done, and validates
+        against the new state instead of the old one, instead of i.e. checking out the same gear twice.
+        """
+        return Gear.objects.select_for_update().get(rfid=gear_rfid)
+
     def __make_transaction(self, authorizer_rfid, type, gear, member=None, comments=""):
         """
         Make a transaction of any type in a safe and centralized way.
 
+        The gear must already be changed (but not necessarily saved), since the transaction records its new state.
+
         :param authorizer_rfid: string, the rfid of the entity authorizing the transaction
         :param type: the type of the transaction
         :param gear: a gear model instance, the piece of gear that is being referred to
@@ -94,6 +144,7 @@ class TransactionManager(models.Manager):
             member=member,
             authorizer=authorizer,
             comments=comments,
+            **self.model.gear_state(gear),
         )
         transaction.save(using=self._db)
 
@@ -103,6 +154,7 @@ class TransactionManager(models.Manager):
 
         return transaction
 
+    @db_transaction.atomic
     def make_checkout(self, authorizer_rfid, gear_rfid, member_rfid, return_date):
         """
         Check out a piece of gear to a member and create a transaction logging the checkout.
@@ -118,7 +170,7 @@ class TransactionManager(models.Manager):
         :return: transaction
         """
         # First, get the objects we are concerned with
-        gear = Gear.objects.get(rfid=gear_rfid)
+        gear = self.__get_locked_gear(gear_rfid)
         member = Member.objects.get(rfid=member_rfid)
 
         # Run all the necessary validations
@@ -126,20 +178,228 @@ class TransactionManager(models.Manager):
         validate_can_rent(member)
         validate_required_certs(member, gear)
 
+        gear.status = 1
+        gear.checked_out_to = member
+        gear.due_date = return_date
+
         # If everything validated, we can try to make the transaction
-        comment = f"Return date = {return_date.date}"
+        comment = f"Return date = {return_date:%Y-%m-%d}"
         transaction = self.__make_transaction(
             authorizer_rfid, "CheckOut", gear, member=member, comments=comment
         )
 
-        # If the transaction was validated, then we can actually change the gear status
-        gear.status = 1
-        gear.checked_out_to = member
-        gear.due_date = return_date
+        # If the transaction was validated, then we can actually save the gear status
         gear.save()
 
         return transaction, gear
 
+    def __get_locked_gear_batch(self, gear_rfids):
+        """
+        Get all the pieces of gear with the given rfids by rfid, locking them until the end of the current transaction
+
+        The rows are locked in a fixed order, so two batches that share some gear can't deadlock each other
+        """
+        locked = (
+            Gear.objects.select_for_update(of=("self",))
+            .filter(rfid__in=gear_rfids)
+            .select_related("geartype")
+            .order_by("pk")
+        )
+        return {gear.rfid: gear for gear in locked}
+
+    def __save_batch(self, authorizer, type, changed, member=None, comments=""):
+        """Save the changed rental state of a batch of gear, and a transaction of the given type for each piece of gear"""
+        Gear.objects.bulk_update(changed, ["status", "checked_out_to", "due_date"])
+        gear_changed.send(sender=Gear, gear_ids=[gear.pk for gear in changed])
+        transactions = self.bulk_create(
+            [
+                self.model(
+                    type=type,
+                    gear=gear,
+                    member=member,
+                    authorizer=authorizer,
+                    comments=comments,
+                    **self.model.gear_state(gear),
+                )
+                for gear in changed
+            ]
+        )
+        logger.info(f"{len(changed)} pieces of gear were {type} authorized by {authorizer} {comments}")
+        return transactions
+
+    @db_transaction.atomic
+    def batch_checkout(self, authorizer_rfid, member_rfid, gear_rfids, return_date):
+        """
+        Check out many pieces of gear to one member at once, i.e. a whole climbing rack
+
+        The authorizer and member are loaded and validated only once, and all the gear is locked and checked out in the
+        same database transaction. Each piece of gear is validated just like in make_checkout. Gear that fails
+        validation is not checked out, but the rest of the batch still is.
+
+        :param authorizer_rfid: string, the 10-digit rfid of entity authorizing the transaction (should be staffer)
+        :param member_rfid: string, the 10-digit rfid of the member checking out the gear
+        :param gear_rfids: list of the 10-digit rfids of the gear being checked out
+        :param return_date: the date by which the gear should be returned
+        :return: list of (gear rfid, transaction, error), where transaction is None and error a message if the piece of
+            gear was not checked out
+        """
+        authorizer = Member.objects.get(rfid=authorizer_rfid)
+        validate_auth(authorizer)
+        member = Member.objects.get(rfid=member_rfid)
+        validate_can_rent(member)
+
+        gear_rfids = list(dict.fromkeys(gear_rfids))
+        all_gear = self.__get_locked_gear_batch(gear_rfids)
+        errors = {}
+        changed = []
+        for gear_rfid in gear_rfids:
+            gear = all_gear.get(gear_rfid)
+            try:
+                if gear is None:
+                    raise ValidationError(f"The RFID {gear_rfid} is not registered to a piece of gear")
+                validate_available(gear)
+                validate_required_certs(member, gear)
+            except ValidationError as error:
+                errors[gear_rfid] = error.message
+                continue
+
+            gear.status = 1
+            gear.checked_out_to = member
+            gear.due_date = return_date
+            changed.append(gear)
+
+        comment = f"Return date = {return_date:%Y-%m-%d}"
+        transactions = self.__save_batch(authorizer, "CheckOut", changed, member=member, comments=comment)
+        return self.__batch_results(gear_rfids, transactions, errors)
+
+    @db_transaction.atomic
+    def batch_check_in(self, authorizer_rfid, gear_rfids):
+        """
+        Check in many pieces of gear at once, in the same database transaction
+
+        Gear that isn't checked out (i.e. in stock, broken or removed) is reported as an error, like unknown rfids
+
+        :param authorizer_rfid: string, the 10-digit rfid of the entity authorizing the transaction
+        :param gear_rfids: list of the 10-digit rfids of the gear being checked in
+        :return: list of (gear rfid, transaction, error), see batch_checkout
+        """
+        authorizer = Member.objects.get(rfid=authorizer_rfid)
+        validate_auth(authorizer)
+
+        gear_rfids = list(dict.fromkeys(gear_rfids))
+        all_gear = self.__get_locked_gear_batch(gear_rfids)
+        errors = {}
+        changed = []
+        for gear_rfid in gear_rfids:
+            gear = all_gear.get(gear_rfid)
+            if gear is None:
+                errors[gear_rfid] = f"The RFID {gear_rfid} is not registered to a piece of gear"
+                continue
+            try:
+                validate_rented_out(gear)
+            except ValidationError as error:
+                errors[gear_rfid] = error.message
+                continue
+
+            gear.status = 0
+            gear.checked_out_to = None
+            gear.due_date = None
+            changed.append(gear)
+
+        transactions = self.__save_batch(authorizer, "CheckIn", changed)
+        return self.__batch_results(gear_rfids, transactions, errors)
+
+    def return_all_gear(self, authorizer_rfid, member_rfid):
+        """
+        Check in all the gear that is currently checked out to a member (including gear that is missing)
+
+        :return: list of (gear rfid, transaction, error), see batch_checkout
+        :raises Member.DoesNotExist: if no member has the given rfid, like batch_checkout
+        """
+        member = Member.objects.get(rfid=member_rfid)
+        gear_rfids = list(
+            Gear.objects.filter(checked_out_to=member).order_by("due_date").values_list("rfid", flat=True)
+        )
+        return self.batch_check_in(authorizer_rfid, gear_rfids)
+
+    @staticmethod
+    def __batch_results(gear_rfids, transactions, errors):
+        """Combine the transactions that were made and the errors of a batch into one result per rfid, in order"""
+        transactions = {transaction.gear.rfid: transaction for transaction in transactions}
+        return [(gear_rfid, transactions.get(gear_rfid), errors.get(gear_rfid)) for gear_rfid in gear_rfids]
+
+    def __sweep_gear(self, authorizer_rfid, from_status, to_status, type, due_before, chunk_size):
+        """
+        Move all the gear with from_status that was due before a date to to_status, with a transaction for each
+
+        The gear is handled in chunks in order of pk, in one pass over the (status, due_date) index. Each chunk is
+        locked, updated with a single UPDATE and logged with a bulk insert in its own database transaction. Gear that
+        changes status in the meantime (i.e. it is checked in at a kiosk) is simply no longer selected.
+
+        :return: the number of pieces of gear that were moved
+        """
+        authorizer = Member.objects.get(rfid=authorizer_rfid)
+        validate_auth(authorizer)
+
+        today = date.today()
+        overdue = Gear.objects.filter(status=from_status, due_date__lt=due_before).order_by("pk")
+        moved = 0
+        last_pk = None
+        while True:
+            with db_transaction.atomic():
+                chunk = overdue if last_pk is None else overdue.filter(pk__gt=last_pk)
+                chunk = list(
+                    chunk.select_for_update().values_list("pk", "checked_out_to_id", "due_date")[:chunk_size]
+                )
+                if not chunk:
+                    break
+
+                gear_ids = [pk for pk, _, _ in chunk]
+                Gear.objects.filter(pk__in=gear_ids).update(status=to_status)
+                gear_changed.send(sender=Gear, gear_ids=gear_ids)
+                self.bulk_create(
+                    [
+                        self.model(
+                            type=type,
+                            gear_id=pk,
+                            member_id=member_id,
+                            authorizer=authorizer,
+                            comments=f"Gear has been checked out for {(today - due_date).days} days",
+                            gear_status=to_status,
+                            gear_holder_id=member_id,
+                            gear_due_date=due_date,
+                        )
+                        for pk, member_id, due_date in chunk
+                    ]
+                )
+
+            moved += len(chunk)
+            last_pk = chunk[-1][0]
+
+        logger.info(f"{moved} pieces of gear were {type} authorized by {authorizer}")
+        return moved
+
+    def batch_missing_gear(self, authorizer_rfid, due_before, chunk_size=500):
+        """
+        Note all the checked out gear that was due back before a date as missing, see missing_gear
+
+        :param authorizer_rfid: string, the 10-digit rfid of the entity authorizing the transactions
+        :param due_before: date, gear that was due back before this date is missing
+        :return: the number of pieces of gear that were noted as missing
+        """
+        return self.__sweep_gear(authorizer_rfid, 1, 3, "Missing", due_before, chunk_size)
+
+    def batch_expire_gear(self, authorizer_rfid, due_before, chunk_size=500):
+        """
+        Note all the missing gear that was due back before a date as probably lost for good, see expire_gear
+
+        :param authorizer_rfid: string, the 10-digit rfid of the entity authorizing the transactions
+        :param due_before: date, missing gear that was due back before this date is expired
+        :return: the number of pieces of gear that were expired
+        """
+        return self.__sweep_gear(authorizer_rfid, 3, 4, "Dormant", due_before, chunk_size)
+
+    @db_transaction.atomic
     def add_gear(
         self,
         authorizer_rfid,
@@ -186,9 +446,8 @@ class TransactionManager(models.Manager):
                 authorizer_rfid, "Create", gear, comments=comment
             )
             logger.info("Gear was created")
-        # If any validation failed, we need to undo the gear creation before aborting
+        # If any validation failed, the gear creation is rolled back along with the rest of the database transaction
         except ValidationError:
-            gear.delete()
             msg = "This was not a valid gear creation. No gear was created"
             logger.info(msg)
             print(msg)
@@ -197,6 +456,126 @@ class TransactionManager(models.Manager):
         # If everything went smoothly to this point, we can return the transaction logging the addition and the gear
         return transaction, gear
 
+    def bulk_add_gear(self, authorizer_rfid, rows, default_image=None, is_new=True, chunk_size=500):
+        """
+        Create many new pieces of gear at once, each with a transaction logging its addition
+
+        Every row is validated like add_gear would, but against a single set of all RFIDs in use and the cached schema
+        of its gear type, so a whole department can be imported without loading everything once per piece of gear.
+        Rows that fail validation are skipped and reported, all other rows are created. The gear, its indexed data and
+        the "Create" transactions are inserted in bulk, in one database transaction per chunk.
+
+        Each row is a dict with the keys:
+            rfid: the 10-digit rfid of the gear
+            geartype: the name (or id) of the gear type
+            image: (optional) the name of an AlreadyUploadedImage, otherwise default_image is used
+            <field name>: the value of each custom data field of the gear type
+
+        :param authorizer_rfid: string, the 10-digit rfid of entity authorizing the transactions (should be staffer)
+        :param rows: iterable of dicts, the gear to import
+        :param default_image: AlreadyUploadedImage to use for rows that don't name an image
+        :param is_new: bool, whether this gear was just acquired by the club (see add_gear)
+        :param chunk_size: the number of pieces of gear to insert per database transaction
+        :return: the number of pieces of gear created, list of (row number, error message) of the rows that were skipped
+        """
+        authorizer = Member.objects.get(rfid=authorizer_rfid)
+        validate_auth(authorizer)
+
+        comment = "Newly Acquired" if is_new else "Old Gear"
+        rows = [{key.strip(): value for key, value in row.items() if key} for row in rows]
+        rfids_in_use = set()
+        all_rfids = [str(row.get("rfid") or "").strip() for row in rows]
+        for start in range(0, len(all_rfids), chunk_size):
+            rfids_in_use |= RFIDTag.objects.in_use(all_rfids[start:start + chunk_size])
+        schemas = GearImportSchemas()
+
+        created = 0
+        errors = []
+        chunk = []
+        for row_number, row in enumerate(rows, start=1):
+            try:
+                gear = self.__build_imported_gear(row, rfids_in_use, schemas, default_image)
+            except ValidationError as error:
+                errors.append((row_number, "; ".join(error.messages)))
+                continue
+
+            rfids_in_use.add(gear.rfid)
+            chunk.append((row_number, gear))
+            if len(chunk) >= chunk_size:
+                created += self.__insert_imported_gear(chunk, authorizer, comment, errors)
+                chunk = []
+
+        if chunk:
+            created += self.__insert_imported_gear(chunk, authorizer, comment, errors)
+
+        logger.info(f"{created} pieces of gear were imported authorized by {authorizer}, {len(errors)} rows failed")
+        return created, errors
+
+    def __build_imported_gear(self, row, rfids_in_use, schemas, default_image):
+        """Validate a single row of a gear import, and construct (but do not save) the piece of gear it describes"""
+        rfid = str(row.get("rfid") or "").strip()
+        if len(rfid) != 10 or not rfid.isdigit():
+            raise ValidationError(f"The rfid '{rfid}' is not a 10 digit number")
+        if rfid in rfids_in_use:
+            raise ValidationError(f"The rfid {rfid} is already in use!")
+
+        geartype = schemas.get_geartype(row.get("geartype"))
+        image = schemas.get_image(row.get("image")) or default_image
+        if image is None:
+            raise ValidationError("No image was given for this gear")
+
+        # Clean each value with the form field of its data field, exactly as if it was entered in the gear admin
+        data_dict = {}
+        field_errors = []
+        for name, (data_field, form_field) in schemas.get_form_fields(geartype).items():
+            try:
+                value = form_field.clean(row.get(name))
+            except ValidationError as error:
+                field_errors.append(f"{name}: {' '.join(error.messages)}")
+                continue
+            data_dict[name] = data_field.serialize(initial=value)
+        if field_errors:
+            raise ValidationError(field_errors)
+
+        gear = Gear(rfid=rfid, status=0, geartype=geartype, image=image, gear_data=json.dumps(data_dict))
+        gear.refresh_display_data()
+        return gear
+
+    def __insert_imported_gear(self, chunk, authorizer, comment, errors):
+        """Insert one chunk of imported gear along with its indexed data and creation transactions"""
+        all_gear = [gear for _, gear in chunk]
+        try:
+            with db_transaction.atomic(using=self._db):
+                Gear.objects.bulk_create(all_gear)
+                RFIDTag.objects.register_new(RFIDTag.GEAR, {gear.pk: gear.rfid for gear in all_gear})
+
+                data_values = []
+                for gear in all_gear:
+                    data_fields = GearType.get_data_fields_for(gear.geartype_id).values()
+                    data_values.extend(GearDataValue.objects.build_for(gear, data_fields))
+                GearDataValue.objects.bulk_create(data_values)
+
+                self.bulk_create(
+                    [
+                        self.model(
+                            type="Create",
+                            gear=gear,
+                            authorizer=authorizer,
+                            comments=comment,
+                            **self.model.gear_state(gear),
+                        )
+                        for gear in all_gear
+                    ]
+                )
+        except IntegrityError as error:
+            # Most likely some of the rfids were taken while the import was running, none of this chunk was saved
+            logger.info(f"Failed to import a chunk of gear: {error}")
+            errors.extend((row_number, f"Not saved, the chunk failed to import: {error}") for row_number, _ in chunk)
+            return 0
+
+        return len(all_gear)
+
+    @db_transaction.atomic
     def check_in_gear(self, authorizer_rfid, gear_rfid):
         """
         Check in a piece of gear and create a transaction logging the return.
@@ -207,21 +586,25 @@ class TransactionManager(models.Manager):
         :param authorizer_rfid: string, the 10-digit rfid of the entity authorizing the transaction
         :param gear_rfid: string, 10-digit rfid of the gear being checked in
         :return: Check-in type Transaction
+        :raises ValidationError: if the gear isn't checked out, i.e. because another kiosk just checked it in
         """
         # First, retrieve the piece of gear we are concerned with
-        gear = Gear.objects.get(rfid=gear_rfid)
+        gear = self.__get_locked_gear(gear_rfid)
+        validate_rented_out(gear)
+
+        gear.status = 0
+        gear.checked_out_to = None
+        gear.due_date = None
 
         # Create a transaction to ensure everything is authorized
         transaction = self.__make_transaction(authorizer_rfid, "CheckIn", gear)
 
         # If the transaction went through, we can go ahead and check in the gear
-        gear.status = 0
-        gear.checked_out_to = None
-        gear.due_date = None
         gear.save()
 
         return transaction, gear
 
+    @db_transaction.atomic
     def retag_gear(self, authorizer_rfid, old_rfid, new_rfid):
         """
         Change the RFID of a piece of gear, and create a transaction logging the change.
@@ -235,7 +618,7 @@ class TransactionManager(models.Manager):
         :return: ReTag Transaction
         """
         validate_rfid(new_rfid)
-        gear = Gear.objects.get(rfid=old_rfid)
+        gear = self.__get_locked_gear(old_rfid)
 
         # Create a transaction to ensure everything is authorized
         details = "Changed RFID from {} to {}".format(old_rfid, new_rfid)
@@ -249,6 +632,7 @@ class TransactionManager(models.Manager):
 
         return transaction, gear
 
+    @db_transaction.atomic
     def fix_gear(
         self, authorizer_rfid, gear_rfid, repairs_description, person_repairing
     ):
@@ -264,19 +648,20 @@ class TransactionManager(models.Manager):
         :param person_repairing: the name of the person who preformed the repairs
         :return: Fix Transaction
         """
-        gear = Gear.objects.get(rfid=gear_rfid)
+        gear = self.__get_locked_gear(gear_rfid)
 
         comment = "{} {}".format(person_repairing, repairs_description)
+        gear.status = 0
 
         # Create a transaction to ensure everything is authorized
         transaction = self.__make_transaction(
             authorizer_rfid, "Fix", gear, comments=comment
         )
 
-        gear.set_status = 0
         gear.save()
         return transaction, gear
 
+    @db_transaction.atomic
     def break_gear(self, authorizer_rfid, gear_rfid, damage_description):
         """
         Note that a piece of gear is damaged and has been removed from circulation
@@ -290,18 +675,20 @@ class TransactionManager(models.Manager):
         :param damage_description: a description of the damage and (if known) repairs needed
         :return: Break Transaction
         """
-        gear = Gear.objects.get(rfid=gear_rfid)
+        gear = self.__get_locked_gear(gear_rfid)
+
+        gear.status = 2
 
         # Create a transaction to ensure everything is authorized
         transaction = self.__make_transaction(
             authorizer_rfid, "Break", gear, comments=damage_description
         )
 
-        gear.set_status = 2
         gear.save()
 
         return transaction, gear
 
+    @db_transaction.atomic
     def missing_gear(self, authorizer_rfid, gear_rfid):
         """
         Note that a piece of gear has been missing for a while and should be searched for
@@ -313,20 +700,22 @@ class TransactionManager(models.Manager):
         :param gear_rfid: string, 10-digit rfid of the gear that got broken
         :return: Fix Transaction
         """
-        gear = Gear.objects.get(rfid=gear_rfid)
+        gear = self.__get_locked_gear(gear_rfid)
+        validate_status(gear, 1)
         last_owner = gear.checked_out_to
         time_out = date.today()-gear.due_date
         details = f"Gear has been checked out for {time_out.days} days"
+        gear.status = 3
 
         # Create a transaction to ensure everything is authorized
         transaction = self.__make_transaction(
             authorizer_rfid, "Missing", gear, member=last_owner, comments=details
         )
 
-        gear.status = 3
         gear.save()
         return transaction, gear
 
+    @db_transaction.atomic
     def expire_gear(self, authorizer_rfid, gear_rfid):
         """
         Note that a piece of gear has been missing for a very long time and is probably permanently lost
@@ -339,20 +728,22 @@ class TransactionManager(models.Manager):
         :param gear_rfid: string, 10-digit rfid of the gear that got broken
         :return: Fix Transaction
         """
-        gear = Gear.objects.get(rfid=gear_rfid)
+        gear = self.__get_locked_gear(gear_rfid)
+        validate_status(gear, 3)
         last_owner = gear.checked_out_to
         time_out = date.today()-gear.due_date
         details = f"Gear has been checked out for {time_out.days} days"
+        gear.status = 4
 
         # Create a transaction to ensure everything is authorized
         transaction = self.__make_transaction(
             authorizer_rfid, "Dormant", gear, member=last_owner, comments=details
         )
 
-        gear.status = 4
         gear.save()
         return transaction, gear
 
+    @db_transaction.atomic
     def delete_gear(self, authorizer_rfid, gear_rfid, reason):
         """
         Permanently remove a piece of gear from circulation
@@ -365,7 +756,10 @@ class TransactionManager(models.Manager):
         :param reason: string explaining why this piece of gear is being removed
         :return: transaction
         """
-        gear = Gear.objects.get(rfid=gear_rfid)
+        gear = self.__get_locked_gear(gear_rfid)
+
+        gear.status = 5
+        gear.checked_out_to = None
 
         # Create a transaction to ensure everything is authorized
         transaction = self.__make_transaction(
@@ -373,12 +767,11 @@ class TransactionManager(models.Manager):
         )
 
         # If the transaction went through, we can go ahead and remove the gear
-        gear.status = 5
-        gear.checked_out_to = None
         gear.department.notify_gear_removed()
 
         return transaction, gear
 
+    @db_transaction.atomic
     def override(self, authorizer_rfid, gear_rfid, **kwargs):
         """
         Allows the admin to override the settings on any piece of gear
@@ -395,7 +788,7 @@ class TransactionManager(models.Manager):
 
         :return: Admin Override Transaction
         """
-        gear = Gear.objects.get(rfid=gear_rfid)
+        gear = self.__get_locked_gear(gear_rfid)
 
         member = Member.objects.get(rfid=authorizer_rfid)
         if not member.has_permission("core.change_gear"):
@@ -405,7 +798,7 @@ class TransactionManager(models.Manager):
         action = f"Admin override on {gear} [{gear_rfid}]: \n"
 
         # Remove the fields that were appended from the geartype, they will be saved in gear_data
-        for field_name in gear.geartype.get_field_names():
+        for field_name in GearType.get_schema_for(gear.geartype_id).field_names:
             kwargs.pop(field_name)
 
         # Set each of the available kwargs to their desired value if they are not none
@@ -435,9 +828,58 @@ class TransactionManager(models.Manager):
         transaction = self.__make_transaction(
             authorizer_rfid, "Override", gear, comments=action
         )
+
+        # The changes might affect the name of the gear, so make sure the stored name is refreshed
+        gear.refresh_display_data()
+        gear.save()
         return transaction, gear
 
 
+class GearImportSchemas:
+    """The gear types, images and data field validators needed during one bulk gear import, each loaded only once"""
+
+    def __init__(self):
+        self.geartypes_by_name = {}
+        self.geartypes_by_id = {}
+        for geartype in GearType.objects.all():
+            self.geartypes_by_name.setdefault(geartype.name.lower(), []).append(geartype)
+            self.geartypes_by_id[str(geartype.pk)] = geartype
+        self.images = {}
+        self.form_fields = {}
+
+    def get_geartype(self, name):
+        name = str(name or "").strip()
+        if name in self.geartypes_by_id:
+            return self.geartypes_by_id[name]
+
+        geartypes = self.geartypes_by_name.get(name.lower(), [])
+        if not geartypes:
+            raise ValidationError(f"There is no gear type named '{name}'")
+        if len(geartypes) > 1:
+            raise ValidationError(f"There are several gear types named '{name}', use the id of the gear type instead")
+        return geartypes[0]
+
+    def get_image(self, name):
+        """Get the image with the given name, None if no name is given"""
+        name = str(name or "").strip()
+        if not name:
+            return None
+        if name not in self.images:
+            self.images[name] = AlreadyUploadedImage.objects.filter(name=name).first()
+        if self.images[name] is None:
+            raise ValidationError(f"There is no image named '{name}'")
+        return self.images[name]
+
+    def get_form_fields(self, geartype):
+        """Get the data fields of the gear type with the form field used to clean each of their values, by name"""
+        if geartype.pk not in self.form_fields:
+            self.form_fields[geartype.pk] = {
+                name: (data_field, data_field.get_field(**data_field.serialize()))
+                for name, data_field in GearType.get_data_fields_for(geartype.pk).items()
+            }
+        return self.form_fields[geartype.pk]
+
+
 class Transaction(models.Model):
     """
     Model that stores the data for every transaction, to allow better monitoring of the status of the whole system.
@@ -506,9 +948,26 @@ class Transaction(models.Model):
     #: Any additional notes to be saved about this transaction
     comments = models.TextField(default="")
 
+    #: The state of the gear right after this transaction, so the inventory at any time can be replayed (see
+    #: InventorySnapshot). Null for transactions made before the state was recorded
+    gear_status = models.IntegerField(choices=Gear.status_choices, null=True, editable=False)
+    gear_holder = models.ForeignKey(
+        Member, null=True, on_delete=models.SET_NULL, related_name="+", editable=False
+    )
+    gear_due_date = models.DateField(null=True, editable=False)
+
     def __str__(self):
         return "{} Transaction for a {}".format(self.type, self.gear.name)
 
+    @staticmethod
+    def gear_state(gear):
+        """The state of a piece of gear that is recorded on each transaction, as keyword arguments for the Transaction"""
+        return {
+            "gear_status": gear.status,
+            "gear_holder_id": gear.checked_out_to_id,
+            "gear_due_date": gear.due_date,
+        }
+
     @property
     def detail_url(self):
         return reverse("admin:core_transaction_detail", kwargs={"pk": self.pk})
@@ -3,3 +3,7 @@ from .MemberModels import MemberManager, Member, Staffer
 from .GearModels import Gear
 from .TransactionModels import Transaction
 from .DepartmentModels import Department
+from .CampaignModels import EmailCampaign
+from .ListservModels import ListservSubscription
+from .InventoryModels import InventorySnapshot
+from .ArchiveModels import TransactionArchive
@@ -0,0 +1,136 @@
+"""Signal receivers that keep the caches and denormalized data of the core models consistent with the database"""
+from core.models.CertificationModels import Certification, rental_eligibility_cache
+from core.models.DepartmentModels import Department
+from core.models.GearModels import CustomDataField, Gear, GearType, gear_changed, gear_schema_cache
+from core.models.MemberModels import Member, Staffer, members_moved, permission_cache
+from core.models.RFIDModels import RFIDTag
+from core.views.common import detail_page_cache, drop_detail_pages
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+
+@receiver(post_save, sender=GearType)
+@receiver(post_delete, sender=GearType)
+@receiver(post_save, sender=CustomDataField)
+@receiver(post_delete, sender=CustomDataField)
+def gear_schema_changed(sender, **kwargs):
+    """A gear type or one of the fields it uses was edited, so the cached schemas may be out of date in every process"""
+    gear_schema_cache.invalidate()
+
+
+@receiver(post_save, sender=GearType)
+def gear_type_saved(sender, instance, created, **kwargs):
+    """The name of the gear type is part of the name of all its gear"""
+    if not created:
+        Gear.objects.refresh_display_data(Gear.objects.filter(geartype=instance))
+
+
+@receiver(post_save, sender=CustomDataField)
+def custom_data_field_saved(sender, instance, created, **kwargs):
+    """Changing the suffix or choices of a field changes how the values are displayed in the name of the gear"""
+    if not created:
+        Gear.objects.refresh_display_data(Gear.objects.filter(geartype__data_fields=instance))
+
+
+@receiver(m2m_changed, sender=GearType.data_fields.through)
+def gear_type_fields_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Data fields were added to or removed from a gear type, so the data displayed for its gear changed"""
+    if action == "pre_clear" and reverse:
+        # Once a data field is cleared from all gear types, they can't be found through it anymore
+        instance._cleared_geartype_ids = list(GearType.objects.filter(data_fields=instance).values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove", "post_clear"):
+        gear_schema_cache.invalidate()
+
+        if reverse:
+            geartype_ids = pk_set if pk_set is not None else instance.__dict__.pop("_cleared_geartype_ids", [])
+            changed_gear = Gear.objects.filter(geartype__pk__in=geartype_ids)
+        else:
+            changed_gear = Gear.objects.filter(geartype=instance)
+        Gear.objects.refresh_display_data(changed_gear)
+
+
+@receiver(post_save, sender=GearType)
+@receiver(post_delete, sender=GearType)
+@receiver(post_delete, sender=Certification)
+@receiver(m2m_changed, sender=GearType.min_required_certs.through)
+@receiver(m2m_changed, sender=Member.certifications.through)
+def certifications_changed(sender, action=None, **kwargs):
+    """The certifications required for a gear type or held by a member changed, so who may rent what changed"""
+    if action is None or action in ("post_add", "post_remove", "post_clear"):
+        rental_eligibility_cache.invalidate()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(m2m_changed, sender=Member.user_permissions.through)
+def permissions_changed(sender, action=None, **kwargs):
+    """The permissions of a group or member changed, so the cached permission matrix is out of date in every process"""
+    if action is None or action in ("post_add", "post_remove", "post_clear"):
+        permission_cache.invalidate()
+
+
+@receiver(post_delete, sender=Member)
+def member_deleted(sender, instance, **kwargs):
+    """The rfid of a deleted member can be given out again"""
+    RFIDTag.objects.release(RFIDTag.MEMBER, instance.pk)
+
+
+@receiver(post_delete, sender=Gear)
+def gear_deleted(sender, instance, **kwargs):
+    """The rfid of deleted gear can be given out again"""
+    RFIDTag.objects.release(RFIDTag.GEAR, instance.pk)
+
+
+@receiver(post_save, sender=Member)
+@receiver(post_delete, sender=Member)
+@receiver(post_save, sender=Staffer)
+@receiver(post_delete, sender=Staffer)
+@receiver(post_delete, sender=Gear)
+@receiver(post_save, sender=GearType)
+@receiver(post_delete, sender=GearType)
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+@receiver(post_save, sender=Certification)
+@receiver(post_delete, sender=Certification)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def detail_data_changed(sender, update_fields=None, **kwargs):
+    """
+    Detail pages also show the names of related objects, so any change can show up on other pages as well. Logging in
+    only updates last_login, which isn't shown anywhere
+    """
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    detail_page_cache.invalidate()
+
+
+@receiver(post_save, sender=Gear)
+def gear_saved(sender, instance, **kwargs):
+    """
+    Checking gear in and out only changes the page of the gear (and its holder and type), so only those are dropped.
+    The name of gear is also shown on the pages of its transactions though, so renaming it drops every page
+    """
+    if instance.__dict__.get("_name_changed", True) and not kwargs.get("created"):
+        detail_page_cache.invalidate()
+        return
+    drop_detail_pages(Gear, instance.pk)
+    drop_detail_pages(Member, instance.checked_out_to_id)
+    drop_detail_pages(GearType, instance.geartype_id)
+
+
+@receiver(gear_changed, sender=Gear)
+def gear_changed_in_bulk(sender, gear_ids, renamed=False, **kwargs):
+    """Gear was updated without being saved one by one, see gear_saved"""
+    if renamed:
+        detail_page_cache.invalidate()
+    else:
+        drop_detail_pages(Gear, *gear_ids)
+
+
+@receiver(members_moved, sender=Member)
+def members_moved_to_group(sender, member_ids, **kwargs):
+    """The group of a member is only shown on their own page"""
+    drop_detail_pages(Member, *member_ids)
@@ -1,14 +1,24 @@
 from helper_scripts import setup_django
 
+import csv
+import time
 from sys import argv
 
 from django.utils.timezone import datetime, timedelta
 from datetime import date
 
-from excsystem.settings import GEAR_EXPIRE_TIME
+from django.db import transaction
+from django.db.models import F
+from uwccsystem.settings import GEAR_EXPIRE_TIME, OUTBOX_POLL_INTERVAL
+from core.convinience import read_table_rows
 from core.models.MemberModels import Member
 from core.models.GearModels import Gear
 from core.models.TransactionModels import Transaction
+from core.models.EmailModels import OutboxEmail
+from core.models.CampaignModels import EmailCampaign
+from core.models.InventoryModels import InventorySnapshot
+from core.models.ArchiveModels import TransactionArchive
+from api.models import MemberRFIDCheckDay
 
 
 def test_task():
@@ -21,57 +31,166 @@ def update_listserv():
     listserv_interface.run_update()
 
 
-def expire_members():
+def refresh_gear_display():
+    """Recompute the stored names of all gear, i.e. to backfill them or after editing gear types by hand"""
+    updated = Gear.objects.refresh_display_data()
+    print(f"Refreshed the names of {updated} pieces of gear")
+
+
+def import_gear(file_path, authorizer_rfid=None):
+    """
+    Import all the gear listed in a .csv or .jsonl file (see TransactionManager.bulk_add_gear for the columns)
+
+    The import is authorized by the system member unless the rfid of another authorizer is given
+    """
+    if authorizer_rfid is None:
+        authorizer_rfid = Member.objects.get(email='system@excursionclubucsb.org').rfid
+
+    with open(file_path, newline="") as gear_file:
+        rows = read_table_rows(gear_file, file_path)
+
+    created, errors = Transaction.objects.bulk_add_gear(authorizer_rfid, rows)
+    for row_number, error in errors:
+        print(f"Row {row_number}: {error}")
+    print(f"Imported {created} pieces of gear, {len(errors)} rows failed")
+
+
+def compact_rfid_checks():
+    """Replace the door rfid checks older than RFID_CHECK_LOG_RETENTION with their daily counts"""
+    compacted = MemberRFIDCheckDay.objects.compact()
+    print(f"Compacted {compacted} rfid checks")
+
+
+def snapshot_inventory():
+    """Save the state of all gear, so the inventory at any later time only needs the transactions since then"""
+    snapshot = InventorySnapshot.objects.take()
+    print(f"Saved a snapshot of {snapshot.num_gear} pieces of gear")
 
-    now = datetime.date(datetime.now())
-    expires_in_week = now + timedelta(days=7)
 
-    for member in Member.objects.all():
+def export_inventory(day, file_path):
+    """Write the state of all gear at the start of a day (YYYY-MM-DD) to a .csv file, i.e. for an insurance claim"""
+    inventory = InventorySnapshot.objects.inventory_at(date.fromisoformat(day))
+    all_gear = Gear.objects.in_bulk(list(inventory))
+    members = Member.objects.in_bulk([holder_id for _, holder_id, _ in inventory.values() if holder_id is not None])
+    statuses = dict(Gear.status_choices)
 
-        # Only check if the member is expired if the are active.
-        if member.group == 'Member' or member.group == 'Just Joined':
+    with open(file_path, "w", newline="") as inventory_file:
+        writer = csv.writer(inventory_file)
+        writer.writerow(["rfid", "name", "status", "checked out to", "due date"])
+        for gear_id, (status, holder_id, due_date) in inventory.items():
+            gear = all_gear.get(gear_id)
+            holder = members.get(holder_id)
+            writer.writerow([
+                gear.rfid if gear else "",
+                gear.name if gear else f"Deleted gear {gear_id}",
+                statuses.get(status, "Unknown"),
+                holder.email if holder else "",
+                due_date or "",
+            ])
+    print(f"Wrote the state of {len(inventory)} pieces of gear on {day} to {file_path}")
 
-            # Expire members
-            if member.date_expires < now:
-                member.expire()
-                member.send_expired_email()
 
-            # If members will expire soon, send them an email
-            elif member.date_expires == expires_in_week:
-                member.send_expires_soon_email()
+def archive_transactions():
+    """Move the transactions older than TRANSACTION_ARCHIVE_AFTER into compressed archive segments"""
+    archived = TransactionArchive.objects.archive()
+    print(f"Archived {archived} transactions")
+
+
+#: How many members expire_members handles at once
+EXPIRE_CHUNK_SIZE = 1000
+#: The groups of members whose membership runs out. Staffers, board members and admins don't expire
+EXPIRING_GROUPS = ['Member', 'Just Joined']
+
+
+def expire_members():
+    """
+    Move all the members whose membership has run out to the 'Expired' group, and warn those who will expire within a
+    week. Both are emailed about it.
+
+    Members are handled in chunks that no longer match once they are done, so this can be run again at any time (i.e.
+    after a crash) without expiring or warning anyone twice.
+    """
+    today = date.today()
+    expiring = Member.objects.filter(group__in=EXPIRING_GROUPS)
+    email_fields = ('pk', 'email', 'first_name', 'last_name', 'date_expires')
+
+    num_expired = 0
+    to_expire = expiring.filter(date_expires__lt=today).order_by('pk').only(*email_fields)
+    while True:
+        members = list(to_expire[:EXPIRE_CHUNK_SIZE])
+        if not members:
+            break
+        # The emails are saved to the outbox together with the new group, so they are sent exactly when it is saved
+        with transaction.atomic():
+            Member.objects.filter(pk__in=[member.pk for member in members]).move_to_group('Expired')
+            OutboxEmail.objects.bulk_create([member.build_expired_email() for member in members])
+        num_expired += len(members)
+
+    num_warned = 0
+    to_warn = expiring.filter(date_expires__gte=today, date_expires__lte=today + timedelta(days=7)).exclude(
+        expiry_warned_for=F('date_expires')
+    )
+    to_warn = to_warn.order_by('pk').only(*email_fields)
+    while True:
+        members = list(to_warn[:EXPIRE_CHUNK_SIZE])
+        if not members:
+            break
+        with transaction.atomic():
+            OutboxEmail.objects.bulk_create([member.build_expires_soon_email() for member in members])
+            Member.objects.filter(pk__in=[member.pk for member in members]).update(
+                expiry_warned_for=F('date_expires')
+            )
+        num_warned += len(members)
+
+    print(f"Expired {num_expired} members, warned {num_warned} members")
 
 
 def expire_gear():
-    """"""
-    checked_out = Gear.objects.filter(status__in=[1, 3])
+    """Note all the gear that is past its due date as missing, and all the gear missing for a long time as expired"""
     sys_rfid = Member.objects.get(email='system@excursionclubucsb.org').rfid
     today = date.today()
-    for gear in checked_out:
-        if gear.status == 1 and today > gear.due_date:
-            Transaction.objects.missing_gear(sys_rfid, gear.rfid)
-        elif gear.status == 3 and today > gear.due_date + GEAR_EXPIRE_TIME:
-            Transaction.objects.expire_gear(sys_rfid, gear.rfid)
+
+    num_missing = Transaction.objects.batch_missing_gear(sys_rfid, today)
+    num_expired = Transaction.objects.batch_expire_gear(sys_rfid, today - GEAR_EXPIRE_TIME)
+    print(f"{num_missing} pieces of gear went missing, {num_expired} pieces of gear expired")
 
 
 def email_overdue_gear():
     """Send an email to all members with overdue gear listing all overdue gear"""
-    missing = Gear.objects.filter(status=3).order_by('checked_out_to__pk')
-
-    try:
-        current_member = missing[0].checked_out_to
-    except IndexError:
-        return
-    members_gear = []
+    missing = Gear.objects.filter(status=3).select_related('checked_out_to').order_by('checked_out_to__pk')
 
+    members_gear = {}
     for gear in missing:
-        if gear.checked_out_to.pk != current_member.pk:
-            current_member.send_missing_gear_email(members_gear)
-            current_member = gear.checked_out_to
-            members_gear = [gear]
+        members_gear.setdefault(gear.checked_out_to, []).append(gear)
+
+    for member, all_gear in members_gear.items():
+        member.send_missing_gear_email(all_gear)
+
+
+def send_emails(once=""):
+    """
+    Send the emails waiting in the outbox, see OutboxEmail
+
+    Keeps running and checking for new emails every few seconds, unless once is given. Several of these can run at the
+    same time to send emails faster, they will never send the same email twice. Campaigns that were started are added
+    to the outbox here too.
+    """
+    while True:
+        queued = EmailCampaign.objects.queue_due()
+        if queued:
+            print(f"Queued {queued} campaign emails")
+        sent, failed = OutboxEmail.objects.send_due()
+        if sent or failed:
+            print(f"Sent {sent} emails, {failed} failed")
+        elif once:
+            return
         else:
-            members_gear.append(gear)
+            time.sleep(OUTBOX_POLL_INTERVAL)
+
 
-    current_member.send_missing_gear_email(members_gear)
+def retry_dead_emails():
+    """Try sending all the emails that failed too often again, i.e. after the mail server was down for a while"""
+    print(f"Retrying {OutboxEmail.objects.retry_dead()} emails")
 
 
 if __name__ == "__main__":
@@ -86,5 +205,21 @@ if __name__ == "__main__":
         expire_gear()
     elif task_name == "email_overdue_gear":
         email_overdue_gear()
+    elif task_name == "refresh_gear_display":
+        refresh_gear_display()
+    elif task_name == "import_gear":
+        import_gear(*argv[2:])
+    elif task_name == "compact_rfid_checks":
+        compact_rfid_checks()
+    elif task_name == "snapshot_inventory":
+        snapshot_inventory()
+    elif task_name == "export_inventory":
+        export_inventory(*argv[2:])
+    elif task_name == "archive_transactions":
+        archive_transactions()
+    elif task_name == "send_emails":
+        send_emails(*argv[2:])
+    elif task_name == "retry_dead_emails":
+        retry_dead_emails()
     else:
         print(f"Invalid task name: '{task_name}'!")
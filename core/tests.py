@@ -1,3 +1,1115 @@
-from django.test import TestCase
+import smtplib
+from datetime import date, datetime, timedelta
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.models.CacheModels import CacheVersion
+from core.models.CampaignModels import EmailCampaign
+from core.models.CertificationModels import Certification, rental_eligibility_cache
+from core.models.DepartmentModels import Department
+from core.models.EmailModels import OutboxEmail
+from core.models.FileModels import AlreadyUploadedImage
+from core.models.ListservModels import ListservSubscription
+from core.models.InventoryModels import InventorySnapshot
+from core.models.ArchiveModels import TransactionArchive
+from core.models.GearModels import CustomDataField, Gear, GearDataValue, GearType, gear_schema_cache
+from core.models.fields.PrimaryKeyField import IdGenerator, id_to_time, time_to_id
+from core.models.MemberModels import Member, permission_cache
+from core.models.RFIDModels import RFIDTag, rfid_tag_cache
+from core.models.TransactionModels import Transaction
+from core.admin.GearAdmin import GearAdmin
+from core.admin.TransactionAdmin import TransactionAdmin
+from core.admin.ViewableAdmin import QueryBudgetExceeded
+from core.caching import SharedCache, get_cache_stats
+from core.emailing import EmailBatch
+from core.tasks import expire_members
+from core.views.ViewList import estimate_count
+from core.views.common import detail_page_cache
+from helper_scripts import listserv_interface
+from django.apps import apps
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.exceptions import FieldError, ImproperlyConfigured, ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from uwccsystem.settings import OUTBOX_MAX_ATTEMPTS, PROCESS_CACHE_CHECK_INTERVAL
+
+ADMIN_RFID = "0000000000"
+
+
+class GearDataTestCase(TestCase):
+    """Sets up a gear type with a few custom data fields, which most gear tests need"""
+
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+        Member.objects.create_superuser("john@bro.com", ADMIN_RFID, "pass")
+
+        department = Department.objects.create(name="Skiing", description="snow")
+        cls.size = CustomDataField.objects.create(
+            name="size", label="Size", data_type="choice", choices="S; Small\nM; Medium\nL; Large"
+        )
+        cls.length = CustomDataField.objects.create(
+            name="length", label="Length", data_type="int", suffix="cm"
+        )
+        cls.geartype = GearType.objects.create(name="Skis", department=department)
+        cls.geartype.data_fields.add(cls.size, cls.length)
+        cls.image = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+
+    def setUp(self):
+        # Rolling back the changes of a previous test does not send any signals, so the caches must be reset manually
+        gear_schema_cache.clear()
+        rental_eligibility_cache.clear()
+        permission_cache.clear()
+        cache.clear()
+
+    def add_gear(self, rfid, size, length):
+        gear_data = self.geartype.build_empty_data()
+        gear_data["size"]["initial"] = size
+        gear_data["length"]["initial"] = length
+        _, gear = Transaction.objects.add_gear(ADMIN_RFID, rfid, self.geartype, self.image, **gear_data)
+        return gear
+
+
+class GearDataFilterTest(GearDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.medium_short = self.add_gear("1000000001", "M", 160)
+        self.medium_long = self.add_gear("1000000002", "M", 180)
+        self.large_long = self.add_gear("1000000003", "L", 175)
+
+    def test_values_indexed_on_creation(self):
+        self.assertEqual(GearDataValue.objects.filter(gear=self.medium_short).count(), 2)
+
+    def test_filter_by_choice(self):
+        found = set(Gear.objects.filter_data(size="M"))
+        self.assertEqual(found, {self.medium_short, self.medium_long})
+
+    def test_filter_by_number_range(self):
+        found = set(Gear.objects.filter_data(length__gt=170))
+        self.assertEqual(found, {self.medium_long, self.large_long})
+
+    def test_filter_combined(self):
+        found = list(Gear.objects.filter_data(size="M", length__gt="170"))
+        self.assertEqual(found, [self.medium_long])
+
+    def test_filter_unknown_field(self):
+        with self.assertRaises(FieldError):
+            list(Gear.objects.filter_data(colour="red"))
+
+    def test_index_updated_on_change(self):
+        gear = Gear.objects.get(pk=self.large_long.pk)
+        gear.gear_data = Gear.objects.get(pk=self.large_long.pk).gear_data.replace('"L"', '"S"')
+        gear.save()
+        self.assertEqual(list(Gear.objects.filter_data(size="S")), [gear])
+        self.assertFalse(Gear.objects.filter_data(size="L").exists())
+
+    def test_kiosk_search(self):
+        self.client.login(email="john@bro.com", password="pass")
+        response = self.client.get(
+            "/kiosk/search/", {"geartype": self.geartype.pk, "data__size": "M", "data__length__gte": 170}
+        )
+        self.assertEqual(list(response.context["results"]), [self.medium_long])
+
+        response = self.client.get("/kiosk/search/", {"geartype": "nonsense", "data__size": "M"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["results"]), [])
+        self.assertIn("geartype", response.context["form"].errors)
+
+
+class GearDataAccessTest(GearDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_gear("1000000001", "M", 160)
+
+    def test_data_as_attributes(self):
+        gear = Gear.objects.get(rfid="1000000001")
+        self.assertEqual(gear.size, "M")
+        self.assertEqual(gear.length, 160)
+
+    def test_attribute_access_is_cached(self):
+        gear = Gear.objects.get(rfid="1000000001")
+        gear.size  # The first access may need to load the fields of the gear type
+        with self.assertNumQueries(0):
+            self.assertEqual(gear.length, 160)
+            self.assertFalse(hasattr(gear, "gear_type"))
+            self.assertFalse(hasattr(gear, "_prefetched_objects_cache"))
+
+    def test_cache_cleared_when_fields_change(self):
+        gear = Gear.objects.get(rfid="1000000001")
+        self.assertEqual(gear.size, "M")
+        self.geartype.data_fields.remove(self.size)
+        with self.assertRaises(AttributeError):
+            gear.size
+
+
+class GearSchemaCacheTest(GearDataTestCase):
+    def test_schema_is_cached(self):
+        self.geartype.build_empty_data()
+        with self.assertNumQueries(0):
+            empty_data = self.geartype.build_empty_data()
+            self.assertEqual(self.geartype.get_field_names(), ["size", "length"])
+        self.assertEqual(empty_data["size"]["choices"], (("S", "Small"), ("M", "Medium"), ("L", "Large")))
+
+    def test_choices_parsed_once(self):
+        field = self.geartype.get_data_fields()["size"]
+        self.assertIs(field.get_choices(), field.get_choices())
+        self.assertIs(self.geartype.get_schema().choices["size"], field.get_choices())
+
+    def test_invalidated_by_other_process(self):
+        schema = self.geartype.get_schema()
+        gear_schema_cache.check_interval = 0
+        try:
+            self.assertIs(self.geartype.get_schema(), schema)
+
+            # Another worker changing the schema only bumps the version stored in the database
+            CacheVersion.objects.bump(gear_schema_cache.name)
+            self.assertIsNot(self.geartype.get_schema(), schema)
+        finally:
+            gear_schema_cache.check_interval = PROCESS_CACHE_CHECK_INTERVAL
+
+    def test_invalidated_by_signals(self):
+        version = CacheVersion.objects.get_version(gear_schema_cache.name)
+        self.geartype.data_fields.remove(self.length)
+        self.assertGreater(CacheVersion.objects.get_version(gear_schema_cache.name), version)
+        self.assertEqual(self.geartype.get_field_names(), ["size"])
+
+
+class GearDisplayNameTest(GearDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.gear = self.add_gear("1000000001", "M", 160)
+
+    def test_name_stored(self):
+        gear = Gear.objects.get(rfid="1000000001")
+        with self.assertNumQueries(0):
+            self.assertEqual(str(gear), "Skis - Medium, 160 cm")
+            self.assertEqual(gear.get_display_gear_data(), {"size": "Medium", "length": "160 cm"})
+
+    def test_name_refreshed_when_gear_type_renamed(self):
+        self.geartype.name = "Downhill Skis"
+        self.geartype.save()
+        self.assertEqual(Gear.objects.get(rfid="1000000001").display_name, "Downhill Skis - Medium, 160 cm")
+
+    def test_name_refreshed_when_field_removed(self):
+        self.geartype.data_fields.remove(self.length)
+        self.assertEqual(Gear.objects.get(rfid="1000000001").display_name, "Skis - Medium")
+
+    def test_name_refreshed_when_field_cleared(self):
+        self.length.geartype_set.clear()
+        self.assertEqual(Gear.objects.get(rfid="1000000001").display_name, "Skis - Medium")
+
+    def test_migration_names_existing_gear(self):
+        name_existing_gear = import_module("core.migrations.0006_gear_display_name").name_existing_gear
+        Gear.objects.update(display_name="", display_data="{}")
+        name_existing_gear(apps, None)
+        gear = Gear.objects.get(rfid="1000000001")
+        self.assertEqual(gear.display_name, "Skis - Medium, 160 cm")
+        self.assertEqual(gear.get_display_gear_data(), {"size": "Medium", "length": "160 cm"})
+
+    def test_override_refreshes_name(self):
+        gear = Gear.objects.get(rfid="1000000001")
+        new_gear_data = gear.gear_data.replace("160", "150")
+        Transaction.objects.override(ADMIN_RFID, gear.rfid, gear_data=new_gear_data, size="M", length=150)
+        self.assertEqual(Gear.objects.get(rfid="1000000001").display_name, "Skis - Medium, 150 cm")
+
+
+class GearImportTest(GearDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.image.name = "skis"
+        self.image.save()
+
+    def test_import_rows(self):
+        rows = [
+            {"rfid": "2000000001", "geartype": "Skis", "image": "skis", "size": "M", "length": "160"},
+            {"rfid": "2000000002", "geartype": "skis", "image": "", "size": "L", "length": "175"},
+        ]
+        created, errors = Transaction.objects.bulk_add_gear(ADMIN_RFID, rows, default_image=self.image, chunk_size=1)
+
+        self.assertEqual((created, errors), (2, []))
+        gear = Gear.objects.get(rfid="2000000002")
+        self.assertEqual(gear.length, 175)
+        self.assertEqual(gear.display_name, "Skis - Large, 175 cm")
+        self.assertEqual(set(Gear.objects.filter_data(size="L")), {gear})
+        self.assertEqual(Transaction.objects.filter(type="Create", gear__rfid__startswith="2").count(), 2)
+
+    def test_scanned_before_import(self):
+        # A tag that was scanned before its gear was imported is cached as unknown
+        self.assertEqual(RFIDTag.objects.resolve("2000000001"), (None, None))
+        rows = [{"rfid": "2000000001", "geartype": "Skis", "size": "M", "length": "160"}]
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.bulk_add_gear(ADMIN_RFID, rows, default_image=self.image)
+        gear = Gear.objects.get(rfid="2000000001")
+        self.assertEqual(RFIDTag.objects.resolve("2000000001"), (RFIDTag.GEAR, gear.pk))
+
+    def test_invalid_rows_reported(self):
+        self.add_gear("2000000001", "M", 160)
+        rows = [
+            {"rfid": "2000000001", "geartype": "Skis", "size": "M", "length": "160"},
+            {"rfid": "2000000002", "geartype": "Snowshoes", "size": "M", "length": "160"},
+            {"rfid": "2000000003", "geartype": "Skis", "size": "XXL", "length": "long"},
+            {"rfid": "2000000004", "geartype": "Skis", "size": "S", "length": "150"},
+            {"rfid": "2000000004", "geartype": "Skis", "size": "S", "length": "150"},
+        ]
+        created, errors = Transaction.objects.bulk_add_gear(ADMIN_RFID, rows, default_image=self.image)
+
+        self.assertEqual(created, 1)
+        self.assertEqual([row_number for row_number, _ in errors], [1, 2, 3, 5])
+        self.assertIn("size", errors[2][1])
+        self.assertIn("length", errors[2][1])
+        self.assertTrue(Gear.objects.filter(rfid="2000000004").exists())
+
+    def test_admin_upload(self):
+        self.client.login(email="john@bro.com", password="pass")
+        gear_file = SimpleUploadedFile(
+            "skis.csv", b"rfid,geartype,size,length\n2000000001,Skis,M,160\n2000000002,Skis,Q,170\n"
+        )
+        response = self.client.post(
+            reverse("admin:core_gear_import"), {"gear_file": gear_file, "image": self.image.pk, "is_new": "on"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["created"], 1)
+        self.assertEqual(response.context["import_errors"][0][0], 2)
+        self.assertTrue(Gear.objects.filter(rfid="2000000001").exists())
+
+
+class RFIDTagTest(GearDataTestCase):
+    def test_tags_registered(self):
+        gear = self.add_gear("1000000001", "M", 160)
+        admin = Member.objects.get(rfid=ADMIN_RFID)
+        self.assertEqual(RFIDTag.objects.resolve("1000000001"), (RFIDTag.GEAR, gear.pk))
+        self.assertEqual(RFIDTag.objects.resolve(ADMIN_RFID), (RFIDTag.MEMBER, admin.pk))
+        self.assertEqual(RFIDTag.objects.resolve("9999999999"), (None, None))
+
+    def test_retag_moves_tag(self):
+        self.add_gear("1000000001", "M", 160)
+        Transaction.objects.retag_gear(ADMIN_RFID, "1000000001", "1000000002")
+        self.assertFalse(RFIDTag.objects.is_in_use("1000000001"))
+        self.assertEqual(RFIDTag.objects.resolve("1000000002")[0], RFIDTag.GEAR)
+
+    def test_rfid_unique_across_members_and_gear(self):
+        with self.assertRaises(ValidationError):
+            self.add_gear(ADMIN_RFID, "M", 160)
+        self.assertFalse(Gear.objects.filter(rfid=ADMIN_RFID).exists())
+
+        # Even when validation is skipped, the database refuses to give the tag out twice
+        gear = self.add_gear("1000000001", "M", 160)
+        gear.rfid = ADMIN_RFID
+        with self.assertRaises(ValidationError):
+            gear.save()
+        self.assertEqual(Gear.objects.get(pk=gear.pk).rfid, "1000000001")
+
+    def test_kiosk_resolves_tags(self):
+        self.add_gear("1000000001", "M", 160)
+        self.client.login(email="john@bro.com", password="pass")
+        response = self.client.post(reverse("kiosk:home"), {"rfid": "1000000001"})
+        self.assertRedirects(response, reverse("kiosk:gear", args=["1000000001"]), fetch_redirect_response=False)
+        response = self.client.post(reverse("kiosk:home"), {"rfid": ADMIN_RFID})
+        self.assertRedirects(response, reverse("kiosk:check_out", args=[ADMIN_RFID]), fetch_redirect_response=False)
+
+    def test_kiosk_batch_for_unknown_member(self):
+        self.add_gear("1000000001", "M", 160)
+        self.client.login(email="john@bro.com", password="pass")
+        for action in ("check_out", "return_all"):
+            response = self.client.post(
+                reverse("kiosk:batch", args=["9999999999"]), {"rfids": "1000000001", "action": action}
+            )
+            self.assertRedirects(response, reverse("kiosk:home"), fetch_redirect_response=False)
+        self.assertTrue(Gear.objects.get(rfid="1000000001").is_available())
+
+
+class GearTransitionTest(GearDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.gear = self.add_gear("1000000001", "M", 160)
+        self.return_date = datetime.now() + timedelta(days=7)
+
+    def test_checkout_is_validated_against_current_state(self):
+        # A second kiosk that loaded the gear before the first checkout must still be refused
+        Transaction.objects.make_checkout(ADMIN_RFID, "1000000001", ADMIN_RFID, self.return_date)
+        with self.assertRaises(ValidationError):
+            Transaction.objects.make_checkout(ADMIN_RFID, "1000000001", ADMIN_RFID, self.return_date)
+        self.assertEqual(Transaction.objects.filter(type="CheckOut").count(), 1)
+
+    def test_missing_refused_after_check_in(self):
+        Transaction.objects.make_checkout(ADMIN_RFID, "1000000001", ADMIN_RFID, self.return_date)
+        Transaction.objects.check_in_gear(ADMIN_RFID, "1000000001")
+        with self.assertRaises(ValidationError):
+            Transaction.objects.missing_gear(ADMIN_RFID, "1000000001")
+        self.assertEqual(Gear.objects.get(rfid="1000000001").status, 0)
+
+    def test_transaction_rolled_back_with_gear(self):
+        with mock.patch.object(Gear, "save", side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                Transaction.objects.make_checkout(ADMIN_RFID, "1000000001", ADMIN_RFID, self.return_date)
+        self.assertFalse(Transaction.objects.filter(type="CheckOut").exists())
+
+    def test_break_and_fix_change_status(self):
+        Transaction.objects.break_gear(ADMIN_RFID, "1000000001", "Snapped in half")
+        self.assertEqual(Gear.objects.get(rfid="1000000001").status, 2)
+        Transaction.objects.fix_gear(ADMIN_RFID, "1000000001", "Glued", "Bob")
+        self.assertEqual(Gear.objects.get(rfid="1000000001").status, 0)
+
+    def test_batch_missing_and_expire(self):
+        self.add_gear("1000000002", "S", 150)
+        self.add_gear("1000000003", "L", 170)
+        for rfid in ["1000000001", "1000000002", "1000000003"]:
+            Transaction.objects.make_checkout(ADMIN_RFID, rfid, ADMIN_RFID, self.return_date)
+        Gear.objects.filter(rfid__in=["1000000001", "1000000002"]).update(due_date=date.today() - timedelta(days=3))
+
+        self.assertEqual(Transaction.objects.batch_missing_gear(ADMIN_RFID, date.today(), chunk_size=1), 2)
+        self.assertEqual(list(Gear.objects.order_by("rfid").values_list("status", flat=True)), [3, 3, 1])
+        missing = Transaction.objects.filter(type="Missing").order_by("gear__rfid")
+        self.assertEqual([transaction.gear.rfid for transaction in missing], ["1000000001", "1000000002"])
+        self.assertEqual(missing[0].member.rfid, ADMIN_RFID)
+        self.assertEqual(missing[0].comments, "Gear has been checked out for 3 days")
+
+        # Running it again changes nothing
+        self.assertEqual(Transaction.objects.batch_missing_gear(ADMIN_RFID, date.today()), 0)
+
+        self.assertEqual(Transaction.objects.batch_expire_gear(ADMIN_RFID, date.today() - timedelta(days=2)), 2)
+        self.assertEqual(Gear.objects.filter(status=4).count(), 2)
+        self.assertEqual(Transaction.objects.filter(type="Dormant").count(), 2)
+
+    def test_batch_sweep_needs_authorizer(self):
+        member = Member.objects.create_member("jo@bro.com", "1000000009", timedelta(days=7), "pass")
+        with self.assertRaises(ValidationError):
+            Transaction.objects.batch_missing_gear(member.rfid, date.today())
+
+
+class RentalEligibilityTest(GearDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.gear = self.add_gear("1000000001", "M", 160)
+        self.member = Member.objects.create_member("jo@bro.com", "1000000009", timedelta(days=7), "pass")
+        self.member.promote_to_active()
+        self.avalanche = Certification.objects.create(title="Avalanche", requirements="Survive")
+        self.return_date = datetime.now() + timedelta(days=7)
+
+    def test_requires_certs(self):
+        self.assertFalse(self.geartype.requires_certs())
+        self.geartype.min_required_certs.add(self.avalanche)
+        self.assertTrue(self.geartype.requires_certs())
+
+    def test_checkout_needs_certs(self):
+        self.geartype.min_required_certs.add(self.avalanche)
+        with self.assertRaisesMessage(ValidationError, "Avalanche"):
+            Transaction.objects.make_checkout(ADMIN_RFID, "1000000001", "1000000009", self.return_date)
+
+        self.member.certifications.add(self.avalanche)
+        Transaction.objects.make_checkout(ADMIN_RFID, "1000000001", "1000000009", self.return_date)
+        self.assertTrue(Gear.objects.get(rfid="1000000001").is_rented_out())
+
+    def test_eligibility_is_cached(self):
+        GearType.get_missing_cert_ids(self.member, self.geartype.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(GearType.get_missing_cert_ids(self.member, self.geartype.pk), set())
+
+    def test_kiosk_lists_eligibility(self):
+        snowshoes = GearType.objects.create(name="Snowshoes", department=self.geartype.department)
+        snowshoes.min_required_certs.add(self.avalanche)
+        self.assertEqual(GearType.split_by_eligibility(self.member), (["Skis"], ["Snowshoes"]))
+
+        self.client.login(email="john@bro.com", password="pass")
+        response = self.client.get(reverse("kiosk:check_out", args=["1000000009"]))
+        self.assertContains(response, "Needs certifications for: Snowshoes")
+
+
+class PermissionMatrixTest(GearDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.member = Member.objects.create_member("jo@bro.com", "1000000009", timedelta(days=7), "pass")
+        self.member.promote_to_active()
+
+    def test_group_permissions(self):
+        self.assertTrue(self.member.has_permission("core.rent_gear"))
+        self.assertFalse(self.member.has_permission("core.authorize_transactions"))
+        self.assertTrue(Member.objects.get(rfid=ADMIN_RFID).has_permission("core.authorize_transactions"))
+
+    def test_permissions_are_cached(self):
+        self.member.has_permission("core.rent_gear")
+        with self.assertNumQueries(0):
+            self.assertTrue(self.member.has_permission("core.view_gear"))
+            self.assertFalse(self.member.has_permission("core.change_gear"))
+
+    def test_group_change_invalidates(self):
+        self.assertFalse(self.member.has_permission("core.change_gear"))
+        Group.objects.get(name="Member").permissions.add(Permission.objects.get(codename="change_gear"))
+        self.assertTrue(self.member.has_permission("core.change_gear"))
+
+    def test_member_permissions(self):
+        self.member.user_permissions.add(Permission.objects.get(codename="authorize_transactions"))
+        self.assertTrue(self.member.has_permission("core.authorize_transactions"))
+
+    def test_inactive_member_has_no_permissions(self):
+        self.member.is_active = False
+        self.assertFalse(self.member.has_permission("core.rent_gear"))
+
+
+class ExpireMembersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def add_member(self, email, expires_in, group="Member"):
+        member = Member.objects.create_member(email, str(1000000000 + Member.objects.count()), timedelta(days=1))
+        member.move_to_group(group)
+        Member.objects.filter(pk=member.pk).update(date_expires=datetime.now().date() + timedelta(days=expires_in))
+        return member
+
+    def sent_to(self):
+        return sorted(email.get_to_emails()[0] for email in OutboxEmail.objects.all())
+
+    def test_expire(self):
+        self.add_member("late@bro.com", -1)
+        self.add_member("new@bro.com", -30, group="Just Joined")
+        self.add_member("staff@bro.com", -1, group="Staff")
+        self.add_member("fine@bro.com", 30)
+
+        expire_members()
+
+        expired = Member.objects.filter(group="Expired")
+        self.assertEqual(sorted(expired.values_list("email", flat=True)), ["late@bro.com", "new@bro.com"])
+        for member in expired:
+            self.assertEqual(list(member.groups.values_list("name", flat=True)), ["Expired"])
+            self.assertFalse(member.is_active_member)
+        self.assertEqual(self.sent_to(), ["late@bro.com", "new@bro.com"])
+
+    def test_warn_within_a_week(self):
+        self.add_member("soon@bro.com", 3)
+        self.add_member("week@bro.com", 7)
+        self.add_member("later@bro.com", 8)
+
+        expire_members()
+        self.assertEqual(self.sent_to(), ["soon@bro.com", "week@bro.com"])
+
+    def test_rerun_sends_nothing(self):
+        self.add_member("late@bro.com", -1)
+        self.add_member("soon@bro.com", 3)
+
+        expire_members()
+        OutboxEmail.objects.all().delete()
+        expire_members()
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_emails_saved_in_bulk(self):
+        for i in range(3):
+            self.add_member(f"late{i}@bro.com", -1)
+            self.add_member(f"soon{i}@bro.com", 3)
+
+        with CaptureQueriesContext(connection) as context:
+            expire_members()
+        inserts = [query for query in context.captured_queries if 'INSERT INTO "core_outboxemail"' in query["sql"]]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(OutboxEmail.objects.count(), 6)
+
+    def test_warned_again_after_renewal(self):
+        member = self.add_member("soon@bro.com", 3)
+        expire_members()
+        Member.objects.filter(pk=member.pk).update(date_expires=datetime.now().date() + timedelta(days=6))
+        OutboxEmail.objects.all().delete()
+
+        expire_members()
+        self.assertEqual(self.sent_to(), ["soon@bro.com"])
+
+
+@mock.patch("core.emailing.smtplib.SMTP")
+class EmailBatchTest(TestCase):
+    def test_one_connection_per_sender(self, smtp):
+        smtp.return_value.sendmail.return_value = {}
+        with EmailBatch("localhost", 1025) as batch:
+            for i in range(3):
+                batch.send([f"member{i}@bro.com"], "Hi", "Hello", from_email="info@bro.com", smtp_password="")
+            batch.send(["member@bro.com"], "Hi", "Hello", from_email="membership@bro.com", smtp_password="")
+
+        self.assertEqual(smtp.call_count, 2)
+        self.assertEqual(smtp.return_value.sendmail.call_count, 4)
+        self.assertEqual(smtp.return_value.quit.call_count, 2)
+        self.assertTrue(all(error is None for _, error in batch.results))
+
+    def test_reconnect_after_disconnect(self, smtp):
+        smtp.return_value.sendmail.side_effect = [{}, smtplib.SMTPServerDisconnected(), {}]
+        with EmailBatch("localhost", 1025) as batch:
+            batch.send(["a@bro.com"], "Hi", "Hello", from_email="info@bro.com", smtp_password="")
+            error = batch.send(["b@bro.com"], "Hi", "Hello", from_email="info@bro.com", smtp_password="")
+
+        self.assertIsNone(error)
+        self.assertEqual(smtp.call_count, 2)
+        self.assertEqual(batch.results, [("a@bro.com", None), ("b@bro.com", None)])
+
+    def test_failures_are_reported(self, smtp):
+        refused = smtplib.SMTPRecipientsRefused({"a@bro.com": (550, b"No such user")})
+        smtp.return_value.sendmail.side_effect = [refused, {"c@bro.com": (550, b"No such user")}]
+        with EmailBatch("localhost", 1025) as batch:
+            batch.send(["a@bro.com"], "Hi", "Hello", from_email="info@bro.com", smtp_password="")
+            batch.send(["b@bro.com", "c@bro.com"], "Hi", "Hello", from_email="info@bro.com", smtp_password="")
+
+        self.assertEqual([email for email, error in batch.results if error is not None], ["a@bro.com", "c@bro.com"])
+        self.assertEqual(smtp.call_count, 1)
+
+
+@mock.patch("core.emailing.smtplib.SMTP")
+class OutboxEmailTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        self.member = Member.objects.create_member("jo@bro.com", "1000000009", timedelta(days=7))
+
+    def test_member_emails_are_queued(self, smtp):
+        self.member.send_intro_email("https://finish")
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.get_to_emails(), ["jo@bro.com"])
+        self.assertEqual(email.credentials, OutboxEmail.MEMBERSHIP)
+        smtp.assert_not_called()
+
+    def test_send_due(self, smtp):
+        smtp.return_value.sendmail.return_value = {}
+        for i in range(3):
+            OutboxEmail.objects.enqueue([f"member{i}@bro.com"], "Hi", "Hello", from_email="info@bro.com")
+
+        self.assertEqual(OutboxEmail.objects.send_due(), (3, 0))
+        smtp.assert_called_once()
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 3)
+        self.assertEqual(OutboxEmail.objects.send_due(), (0, 0))
+
+    def test_retry_with_backoff(self, smtp):
+        smtp.return_value.sendmail.side_effect = smtplib.SMTPDataError(451, b"Try again later")
+        email = OutboxEmail.objects.enqueue(["jo@bro.com"], "Hi", "Hello")
+
+        self.assertEqual(OutboxEmail.objects.send_due(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.PENDING, 1))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        # Not due yet, so nothing is sent
+        self.assertEqual(OutboxEmail.objects.send_due(), (0, 0))
+
+    def test_unexpected_error_saves_batch(self, smtp):
+        smtp.return_value.sendmail.side_effect = [{}, UnicodeEncodeError("ascii", "é", 0, 1, "no"), {}]
+        for i in range(3):
+            OutboxEmail.objects.enqueue([f"member{i}@bro.com"], "Hi", "Hello")
+
+        with self.assertLogs("core.models.EmailModels", "ERROR"):
+            self.assertEqual(OutboxEmail.objects.send_due(), (2, 1))
+        statuses = OutboxEmail.objects.order_by("pk").values_list("status", "attempts")
+        self.assertEqual(
+            list(statuses), [(OutboxEmail.SENT, 0), (OutboxEmail.PENDING, 1), (OutboxEmail.SENT, 0)]
+        )
+
+    def test_dead_letter(self, smtp):
+        smtp.return_value.sendmail.side_effect = smtplib.SMTPDataError(550, b"Rejected")
+        email = OutboxEmail.objects.enqueue(["jo@bro.com"], "Hi", "Hello")
+        OutboxEmail.objects.filter(pk=email.pk).update(attempts=OUTBOX_MAX_ATTEMPTS - 1)
+
+        OutboxEmail.objects.send_due()
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.DEAD)
+        self.assertIn("Rejected", email.last_error)
+
+        self.assertEqual(OutboxEmail.objects.retry_dead(), 1)
+        smtp.return_value.sendmail.side_effect = None
+        smtp.return_value.sendmail.return_value = {}
+        self.assertEqual(OutboxEmail.objects.send_due(), (1, 0))
+
+
+class EmailCampaignTest(GearDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.members = []
+        for i in range(3):
+            member = Member.objects.create_member(f"member{i}@bro.com", f"100000001{i}", timedelta(days=30 * (i + 1)))
+            member.first_name, member.last_name = f"Jo{i}", "Bro"
+            member.save()
+            self.members.append(member)
+        self.campaign = EmailCampaign.objects.create(name="Renewal", title="Renew!", body="Hi {first_name}, see you")
+
+    def test_segment(self):
+        self.campaign.groups.add(Group.objects.get(name="Just Joined"))
+        self.campaign.expires_before = (timezone.now() + timedelta(days=45)).date()
+        self.assertEqual(list(self.campaign.get_recipients()), [self.members[0]])
+
+        self.campaign.groups.clear()
+        self.campaign.expires_before = None
+        self.campaign.rented_from = self.geartype.department
+        self.assertFalse(self.campaign.get_recipients().exists())
+
+        self.add_gear("1000000001", "M", 160)
+        Transaction.objects.make_checkout(ADMIN_RFID, "1000000001", ADMIN_RFID, datetime.now() + timedelta(days=7))
+        self.assertEqual(list(self.campaign.get_recipients()), [Member.objects.get(rfid=ADMIN_RFID)])
+
+    def test_unknown_field_is_refused(self):
+        self.campaign.body = "Hi {first_name}, you owe {balance}"
+        with self.assertRaises(ValidationError):
+            self.campaign.full_clean()
+        with self.assertRaises(ValidationError):
+            self.campaign.start()
+
+    @mock.patch("core.emailing.smtplib.SMTP")
+    def test_queue_and_send(self, smtp):
+        smtp.return_value.sendmail.return_value = {}
+        self.campaign.groups.add(Group.objects.get(name="Just Joined"))
+
+        # Not started yet
+        self.assertEqual(EmailCampaign.objects.queue_due(), 0)
+
+        self.campaign.start()
+        self.assertEqual(EmailCampaign.objects.queue_due(chunk_size=2), 3)
+        self.campaign.refresh_from_db()
+        self.assertEqual((self.campaign.status, self.campaign.num_recipients), (EmailCampaign.DONE, 3))
+        self.assertEqual(self.campaign.last_member_id, self.members[2].pk)
+        self.assertEqual(self.campaign.emails.get(to_emails='["member1@bro.com"]').body, "Hi Jo1, see you")
+
+        OutboxEmail.objects.send_due()
+        self.assertEqual(self.campaign.get_progress(), {"queued": 3, "sent": 3, "waiting": 0, "failed": 0})
+
+    def test_resume(self):
+        # A worker that died after queueing the first member picks up after them
+        self.campaign.groups.add(Group.objects.get(name="Just Joined"))
+        self.campaign.start()
+        EmailCampaign.objects.filter(pk=self.campaign.pk).update(last_member_id=self.members[0].pk, num_recipients=1)
+
+        self.assertEqual(EmailCampaign.objects.queue_due(), 2)
+        self.assertFalse(OutboxEmail.objects.filter(to_emails='["member0@bro.com"]').exists())
+
+
+class ListservSyncTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        permission_cache.clear()
+        self.listserv = listserv_interface.FakeListserv()
+        self.members = {}
+        for email in ("a@bro.com", "b@bro.com", "c@bro.com"):
+            member = Member.objects.create_member(email, str(1000000000 + len(self.members)), timedelta(days=30))
+            member.move_to_group("Member")
+            self.members[email] = member
+
+    def test_only_changes_are_pushed(self):
+        self.assertEqual(listserv_interface.sync(self.listserv), "Added 3, removed 0")
+        self.assertEqual(self.listserv.emails, {"a@bro.com", "b@bro.com", "c@bro.com"})
+
+        # Nothing changed, so nothing is pushed
+        self.assertIsNone(listserv_interface.sync(self.listserv))
+
+        self.members["a@bro.com"].move_to_group("Expired")
+        new_member = Member.objects.create_member("d@bro.com", "1000000009", timedelta(days=30))
+        new_member.move_to_group("Member")
+
+        listserv_interface.sync(self.listserv)
+        self.assertEqual(self.listserv.pushes[-1], ({"d@bro.com"}, {"a@bro.com"}))
+        self.assertEqual(self.listserv.emails, {"b@bro.com", "c@bro.com", "d@bro.com"})
+        self.assertEqual(
+            set(ListservSubscription.objects.values_list("email", flat=True)), self.listserv.emails
+        )
+
+    def test_failed_push_is_retried(self):
+        with mock.patch.object(self.listserv, "push", side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                listserv_interface.sync(self.listserv)
+        self.assertFalse(ListservSubscription.objects.exists())
+
+        listserv_interface.sync(self.listserv)
+        self.assertEqual(len(self.listserv.emails), 3)
+
+    def test_email_commands(self):
+        ListservSubscription.objects.record(["a@bro.com", "gone@bro.com"], [])
+        listserv_settings = {
+            "LISTSERV_NAME": "UWCC-L", "LISTSERV_COMMAND_ADDRESS": "listserv@bro.com", "LISTSERV_PASSWORD": "secret"
+        }
+        with mock.patch.multiple(listserv_interface.settings, **listserv_settings):
+            with mock.patch.object(EmailBatch, "send", return_value=None) as send:
+                listserv_interface.sync(listserv_interface.EmailCommandTransport())
+
+        # The commands hold the list owner's password, so they are sent right away and never saved
+        self.assertFalse(OutboxEmail.objects.exists())
+        to_emails, title, body = send.call_args.args
+        self.assertEqual(to_emails, ["listserv@bro.com"])
+        self.assertEqual(
+            body.splitlines(),
+            [
+                "QUIET ADD UWCC-L b@bro.com PW=secret",
+                "QUIET ADD UWCC-L c@bro.com PW=secret",
+                "QUIET DELETE UWCC-L gone@bro.com PW=secret",
+            ],
+        )
+
+    def test_failed_email_commands_are_retried(self):
+        listserv_settings = {
+            "LISTSERV_NAME": "UWCC-L", "LISTSERV_COMMAND_ADDRESS": "listserv@bro.com", "LISTSERV_PASSWORD": "secret"
+        }
+        with mock.patch.multiple(listserv_interface.settings, **listserv_settings):
+            with mock.patch.object(EmailBatch, "send", return_value=smtplib.SMTPDataError(554, "No")):
+                with self.assertRaises(smtplib.SMTPDataError):
+                    listserv_interface.sync(listserv_interface.EmailCommandTransport())
+        self.assertFalse(ListservSubscription.objects.exists())
+
+    def test_transport_needs_settings(self):
+        listserv_settings = {
+            "LISTSERV_TRANSPORT": "email",
+            "LISTSERV_NAME": None,
+            "LISTSERV_COMMAND_ADDRESS": "listserv@bro.com",
+            "LISTSERV_USERNAME": "owner@bro.com",
+            "LISTSERV_PASSWORD": "secret",
+            "EMAIL_HOST_USER": "info@bro.com",
+        }
+        with mock.patch.multiple(listserv_interface.settings, **listserv_settings):
+            with self.assertRaisesMessage(ImproperlyConfigured, "LISTSERV_NAME"):
+                listserv_interface.get_transport()
+            with mock.patch.object(listserv_interface.settings, "LISTSERV_NAME", "UWCC-L"):
+                self.assertIsInstance(listserv_interface.get_transport(), listserv_interface.EmailCommandTransport)
+                # The commands are sent with the club email account
+                with mock.patch.object(listserv_interface.settings, "EMAIL_HOST_USER", None):
+                    with self.assertRaisesMessage(ImproperlyConfigured, "EMAIL_HOST_USER"):
+                        listserv_interface.get_transport()
+
+
+class SharedCacheTest(GearDataTestCase):
+    def test_versioned_keys(self):
+        shared_cache = SharedCache("test")
+        load = mock.Mock(return_value="value")
+
+        self.assertEqual(shared_cache.get(("a", 1), load), "value")
+        self.assertEqual(shared_cache.get(("a", 1), load), "value")
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(get_cache_stats()["test"], {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+        shared_cache.invalidate()
+        shared_cache.get(("a", 1), load)
+        shared_cache.delete(("a", 1))
+        shared_cache.get(("a", 1), load)
+        self.assertEqual(load.call_count, 3)
+
+    def test_invalidated_by_other_process(self):
+        shared_cache = SharedCache("test", check_interval=0)
+        load = mock.Mock(return_value="value")
+        shared_cache.get("a", load)
+        shared_cache.get("a", load)
+        self.assertEqual(load.call_count, 1)
+
+        # With the local memory backend, another worker can only bump the version stored in the database
+        CacheVersion.objects.bump(shared_cache.name)
+        shared_cache.get("a", load)
+        self.assertEqual(load.call_count, 2)
+
+        # Which is also how it drops single entries
+        with mock.patch.object(CacheVersion.objects, "bump") as bump:
+            shared_cache.delete("a")
+        bump.assert_called_once_with(shared_cache.name)
+
+    def test_rfid_lookups_are_cached(self):
+        gear = self.add_gear("1000000001", "M", 160)
+        self.assertEqual(RFIDTag.objects.resolve("1000000001"), (RFIDTag.GEAR, gear.pk))
+        self.assertEqual(RFIDTag.objects.resolve("1000000002"), (None, None))
+        with self.assertNumQueries(0):
+            RFIDTag.objects.resolve("1000000001")
+            RFIDTag.objects.resolve("1000000002")
+
+        # Changing the rfid drops both the old and the new rfid, once the change is committed
+        gear.rfid = "1000000002"
+        with self.captureOnCommitCallbacks(execute=True):
+            gear.save()
+            self.assertEqual(RFIDTag.objects.resolve("1000000001"), (RFIDTag.GEAR, gear.pk))
+        self.assertEqual(RFIDTag.objects.resolve("1000000001"), (None, None))
+        self.assertEqual(RFIDTag.objects.resolve("1000000002"), (RFIDTag.GEAR, gear.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RFIDTag.objects.release(RFIDTag.GEAR, gear.pk)
+        self.assertEqual(RFIDTag.objects.resolve("1000000002"), (None, None))
+
+    def test_detail_page_invalidated(self):
+        gear = self.add_gear("1000000001", "M", 160)
+        self.client.force_login(Member.objects.get(rfid=ADMIN_RFID))
+        url = reverse("admin:core_gear_detail", kwargs={"pk": gear.pk})
+        before = self.client.get(url).context["html_representation"]
+        self.assertEqual(self.client.get(url).context["html_representation"], before)
+
+        # Batch checkouts don't save the gear one by one, but must still show up
+        version = CacheVersion.objects.get_version(detail_page_cache.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.batch_checkout(
+                ADMIN_RFID, ADMIN_RFID, ["1000000001"], timezone.now() + timedelta(days=7)
+            )
+            # Nothing is written while the gear is locked, and the page is dropped once the checkout is committed
+            self.assertEqual(CacheVersion.objects.get_version(detail_page_cache.name), version)
+        checked_out = self.client.get(url).context["html_representation"]
+        self.assertNotEqual(checked_out, before)
+
+        version = CacheVersion.objects.get_version(detail_page_cache.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.check_in_gear(ADMIN_RFID, "1000000001")
+            self.assertEqual(CacheVersion.objects.get_version(detail_page_cache.name), version)
+        self.assertEqual(self.client.get(url).context["html_representation"], before)
+
+    def test_detail_pages_dropped_by_key(self):
+        gear = self.add_gear("1000000001", "M", 160)
+        with mock.patch.object(SharedCache, "delete") as delete, self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.make_checkout(ADMIN_RFID, "1000000001", ADMIN_RFID, date.today() + timedelta(days=7))
+        member = Member.objects.get(rfid=ADMIN_RFID)
+        delete.assert_any_call(("core.gear", gear.pk))
+        delete.assert_any_call(("core.member", member.pk))
+        delete.assert_any_call(("core.geartype", gear.geartype_id))
+
+    def test_cache_stats_only_for_admins(self):
+        member = Member.objects.create_member("jo@bro.com", "1000000009", timedelta(days=7), "pass")
+        member.move_to_group("Staff")
+        self.client.force_login(member)
+        self.assertEqual(self.client.get(reverse("admin:cache_stats")).status_code, 403)
+
+        self.client.force_login(Member.objects.get(rfid=ADMIN_RFID))
+        self.assertIn("rfid_tags", self.client.get(reverse("admin:cache_stats")).json())
+
+
+class TimePrefixedIdTest(GearDataTestCase):
+    def test_bulk_ids_are_unique(self):
+        before = timezone.now()
+        ids = IdGenerator().make_ids(20000)
+        self.assertEqual(len(set(ids)), 20000)
+        self.assertEqual(ids, sorted(ids, key=lambda big_id: big_id >> 23))
+        self.assertLessEqual(before - timedelta(milliseconds=1), id_to_time(ids[0]))
+        self.assertLessEqual(id_to_time(ids[-1]), timezone.now())
+
+    def test_created_between(self):
+        gear = self.add_gear("1000000001", "M", 160)
+        admin = Member.objects.get(rfid=ADMIN_RFID)
+        now = timezone.now()
+        Transaction.objects.bulk_create(
+            Transaction(
+                primary_key=time_to_id(now - timedelta(days=days_ago)) + 1,
+                type="Fix",
+                gear=gear,
+                authorizer=admin,
+                comments=str(days_ago),
+            )
+            for days_ago in (1, 10, 40)
+        )
+
+        def comments(transactions):
+            return sorted(transactions.exclude(type="Create").values_list("comments", flat=True))
+
+        self.assertEqual(comments(Transaction.objects.created_between(now - timedelta(days=7))), ["1"])
+        self.assertEqual(
+            comments(Transaction.objects.created_between(now - timedelta(days=30), now - timedelta(days=7))), ["10"]
+        )
+        self.assertEqual(comments(Transaction.objects.created_between(end=now.date() - timedelta(days=30))), ["40"])
+        # The transaction that added the gear was just created
+        self.assertTrue(Transaction.objects.filter(type="Create", pk__created_after=now - timedelta(seconds=5)).exists())
+
+
+@mock.patch("core.models.InventoryModels.INVENTORY_SNAPSHOT_LAG", timedelta(0))
+class InventorySnapshotTest(GearDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = Member.objects.get(rfid=ADMIN_RFID)
+        self.rope = self.add_gear("1000000001", "M", 60)
+        self.skis = self.add_gear("1000000002", "L", 180)
+        self.due = date.today() + timedelta(days=7)
+
+    def live_inventory(self):
+        return {gear.pk: (gear.status, gear.checked_out_to_id, gear.due_date) for gear in Gear.objects.all()}
+
+    def test_replay_matches_gear(self):
+        Transaction.objects.make_checkout(ADMIN_RFID, "1000000001", ADMIN_RFID, self.due)
+        Transaction.objects.batch_checkout(ADMIN_RFID, ADMIN_RFID, ["1000000002"], self.due)
+        Transaction.objects.break_gear(ADMIN_RFID, "1000000001", "frayed")
+        # Ids only go down to the millisecond, so look just past the transactions made in this millisecond
+        self.assertEqual(
+            InventorySnapshot.objects.inventory_at(timezone.now() + timedelta(milliseconds=1)), self.live_inventory()
+        )
+
+    def test_snapshot_and_history(self):
+        Transaction.objects.make_checkout(ADMIN_RFID, "1000000001", ADMIN_RFID, self.due)
+        snapshot = InventorySnapshot.objects.take()
+        self.assertEqual(snapshot.get_inventory(), self.live_inventory())
+        checked_out = self.live_inventory()
+
+        Transaction.objects.check_in_gear(ADMIN_RFID, "1000000001")
+        # Only the transactions since the snapshot are replayed
+        with self.assertNumQueries(3):
+            inventory = InventorySnapshot.objects.inventory_at(timezone.now() + timedelta(milliseconds=1))
+        self.assertEqual(inventory, self.live_inventory())
+
+        self.assertEqual(InventorySnapshot.objects.inventory_at(snapshot.taken_at), checked_out)
+        self.assertEqual(InventorySnapshot.objects.inventory_at(date.today() - timedelta(days=1)), {})
+
+    def test_legacy_transactions(self):
+        # Transactions made before the state of the gear was recorded, after the Create transaction of the gear
+        first_id = time_to_id(timezone.now() + timedelta(milliseconds=1))
+        Transaction.objects.bulk_create([
+            Transaction(
+                primary_key=first_id + 1,
+                type="CheckOut",
+                gear=self.rope,
+                member=self.admin,
+                authorizer=self.admin,
+                comments="Return date = 2030-01-05",
+            ),
+            Transaction(primary_key=first_id + 2, type="Missing", gear=self.rope, authorizer=self.admin),
+        ])
+        inventory = InventorySnapshot.objects.inventory_at(timezone.now() + timedelta(seconds=1))
+        self.assertEqual(inventory[self.rope.pk], (3, self.admin.pk, date(2030, 1, 5)))
+
+
+class TransactionArchiveTest(GearDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = Member.objects.get(rfid=ADMIN_RFID)
+        self.rope = self.add_gear("1000000001", "M", 60)
+        self.skis = self.add_gear("1000000002", "L", 180)
+        Transaction.objects.make_checkout(ADMIN_RFID, "1000000001", ADMIN_RFID, date.today() + timedelta(days=7))
+        Transaction.objects.check_in_gear(ADMIN_RFID, "1000000001")
+
+    def archive_all(self, segment_size=2):
+        return TransactionArchive.objects.archive(timezone.now() + timedelta(seconds=1), segment_size)
+
+    def test_archive_moves_transactions(self):
+        history = [t.pk for t in TransactionArchive.objects.history(gear=self.rope)]
+        inventory = InventorySnapshot.objects.inventory_at(timezone.now())
+
+        self.assertEqual(self.archive_all(), 4)
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(TransactionArchive.objects.count(), 2)
+        self.assertEqual(self.archive_all(), 0)
+
+        # The history and the inventory are the same as before
+        self.assertEqual([t.pk for t in TransactionArchive.objects.history(gear=self.rope)], history)
+        self.assertEqual(InventorySnapshot.objects.inventory_at(timezone.now()), inventory)
+
+    def test_history_merges_archive(self):
+        self.archive_all()
+        Transaction.objects.break_gear(ADMIN_RFID, "1000000001", "frayed")
+
+        history = TransactionArchive.objects.history(gear=self.rope)
+        self.assertEqual([t.type for t in history], ["Break", "CheckIn", "CheckOut", "Create"])
+        self.assertEqual(history[2].member, self.admin)
+        self.assertEqual(history[2].gear, self.rope)
+        self.assertEqual([t.type for t in TransactionArchive.objects.history(member=self.admin)], ["CheckOut"])
+
+        # Only the segments with transactions of the gear are read
+        self.assertEqual([t.type for t in TransactionArchive.objects.history(gear=self.skis)], ["Create"])
+
+    def test_archived_detail_page(self):
+        checkout = Transaction.objects.get(type="CheckOut")
+        self.archive_all()
+
+        self.client.login(email="john@bro.com", password="pass")
+        response = self.client.get(reverse("admin:core_transaction_detail", kwargs={"pk": checkout.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["object"].comments, checkout.comments)
+        response = self.client.get(reverse("admin:core_transaction_detail", kwargs={"pk": checkout.pk + 1}))
+        self.assertEqual(response.status_code, 404)
+
+
+@mock.patch.object(TransactionAdmin, "list_per_page", 2)
+class KeysetPaginationTest(GearDataTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(4):
+            self.add_gear(f"100000000{i}", "M", 160)
+        Transaction.objects.make_checkout(ADMIN_RFID, "1000000000", ADMIN_RFID, date.today() + timedelta(days=7))
+        self.client.login(email="john@bro.com", password="pass")
+
+    def get_pages(self, url):
+        """Follow the next links from the given page, returning the transaction ids of every page and the last list"""
+        pages = []
+        while url:
+            cl = self.client.get(url).context["cl"]
+            self.assertTrue(cl.keyset_pagination)
+            pages.append([t.pk for t in cl.result_list])
+            url = cl.next_url and reverse("admin:core_transaction_changelist") + cl.next_url
+        return pages, cl
+
+    def test_pages(self):
+        pages, cl = self.get_pages(reverse("admin:core_transaction_changelist"))
+        expected = list(Transaction.objects.order_by("-pk").values_list("pk", flat=True))
+        self.assertEqual(pages, [expected[0:2], expected[2:4], expected[4:5]])
+        self.assertEqual((cl.result_count, cl.count_is_estimate), (5, False))
+        response = self.client.get(reverse("admin:core_transaction_changelist"))
+        self.assertContains(response, f'href="{response.context["cl"].next_url}"')
+
+        # Going back from the last page gives the page before it
+        previous = self.client.get(reverse("admin:core_transaction_changelist") + cl.previous_url).context["cl"]
+        self.assertEqual([t.pk for t in previous.result_list], expected[2:4])
+
+    def test_ties_broken_by_pk(self):
+        # Ordered by type, most of which are the same
+        pages, _ = self.get_pages(reverse("admin:core_transaction_changelist") + "?o=0")
+        expected = list(Transaction.objects.order_by("type", "-pk").values_list("pk", flat=True))
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_filtered(self):
+        pages, cl = self.get_pages(reverse("admin:core_transaction_changelist") + "?type__exact=Create")
+        self.assertEqual(len(sum(pages, [])), 4)
+        self.assertEqual(cl.result_count, 4)
+
+    def test_fallback_and_invalid_keyset(self):
+        # Gear is a related field, so the list is paged by offset
+        response = self.client.get(reverse("admin:core_transaction_changelist") + "?o=2")
+        self.assertFalse(response.context["cl"].keyset_pagination)
+        self.assertEqual(len(response.context["cl"].result_list), 2)
+
+        response = self.client.get(reverse("admin:core_transaction_changelist") + "?after=nonsense")
+        self.assertEqual(response.status_code, 302)
+
+    def test_estimate_count(self):
+        self.assertEqual(estimate_count(Transaction.objects.all()), (5, False))
+
+
+@override_settings(DEBUG=True)
+class ListQueryBudgetTest(GearDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.login(email="john@bro.com", password="pass")
+
+    def count_queries(self, url_name):
+        gear_schema_cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def add_checked_out_gear(self, *rfids):
+        for rfid in rfids:
+            self.add_gear(rfid, "M", 160)
+            Transaction.objects.make_checkout(ADMIN_RFID, rfid, ADMIN_RFID, date.today() + timedelta(days=7))
+
+    def test_queries_dont_grow_with_rows(self):
+        self.add_checked_out_gear("1000000001")
+        lists = ("admin:core_gear_changelist", "admin:core_transaction_changelist")
+        few = {name: self.count_queries(name) for name in lists}
+        self.add_checked_out_gear("1000000002", "1000000003", "1000000004")
+        many = {name: self.count_queries(name) for name in few}
+        self.assertEqual(many, few)
+
+    def test_budget_exceeded(self):
+        self.add_checked_out_gear("1000000001")
+        with mock.patch.object(GearAdmin, "list_query_budget", 2):
+            with self.assertRaises(QueryBudgetExceeded), self.assertLogs("django.request", "ERROR"):
+                self.client.get(reverse("admin:core_gear_changelist"))
+        with override_settings(DEBUG=False), mock.patch.object(GearAdmin, "list_query_budget", 2):
+            self.assertEqual(self.client.get(reverse("admin:core_gear_changelist")).status_code, 200)
+
+    def test_actions_not_budgeted(self):
+        self.add_checked_out_gear("1000000001")
+        data = {"action": "delete_selected", "_selected_action": [Gear.objects.get().pk]}
+        with mock.patch.object(GearAdmin, "list_query_budget", 2):
+            response = self.client.post(reverse("admin:core_gear_changelist"), data)
+        self.assertEqual(response.status_code, 200)
+
+    def test_schemas_loaded_at_once(self):
+        gear_schema_cache.clear()
+        with self.assertNumQueries(2):
+            GearType.prefetch_schemas([self.geartype.pk, self.geartype.pk + 1])
+        with self.assertNumQueries(0):
+            self.assertEqual(list(GearType.get_data_fields_for(self.geartype.pk)), ["size", "length"])
+            self.assertEqual(list(GearType.get_data_fields_for(self.geartype.pk + 1)), [])
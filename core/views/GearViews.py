@@ -1,8 +1,10 @@
 from core.models.GearModels import Gear, GearType
-from core.models.TransactionModels import Transaction
+from core.models.ArchiveModels import TransactionArchive
 from core.views.common import ModelDetailView
-from core.views.ViewList import RestrictedViewList
+from core.views.ViewList import KeysetViewList
+from django.contrib.admin.options import IncorrectLookupParameters
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.core.exceptions import FieldError
 from django.urls import reverse
 from django.utils import timezone
 from uwccsystem.settings import WEB_BASE
@@ -45,18 +47,21 @@ class GearDetailView(UserPassesTestMixin, ModelDetailView):
         context["geartype_url"] = reverse(
             "admin:core_geartype_detail", kwargs={"pk": gear.geartype.pk}
         )
-        context["related_transactions"] = Transaction.objects.filter(
-            gear=gear
-        ).order_by("-timestamp")
         if gear.checked_out_to:
             context["checked_out_to_url"] = reverse(
                 "admin:core_member_detail", kwargs={"pk": gear.checked_out_to.pk}
             )
         context['view_transactions'] = self.request.user.has_permission("core.view_all_transactions")
+        if context['view_transactions']:
+            context["related_transactions"] = TransactionArchive.objects.history(gear=gear)
         return super(GearDetailView, self).get_context_data(**context)
 
 
-class GearViewList(RestrictedViewList):
+class GearViewList(KeysetViewList):
+
+    # Gear can be filtered by custom data with parameters like ?data__size=M or ?data__length__gt=170
+    reserved_param_prefixes = KeysetViewList.reserved_param_prefixes + ("data__",)
+
     def __init__(self, *args, **kwargs):
         super(GearViewList, self).__init__(*args, **kwargs)
 
@@ -82,3 +87,16 @@ class GearViewList(RestrictedViewList):
             self.restriction_filters[
                 "checked_out_to_id__exact"
             ] = self.request.user.primary_key
+
+    def get_queryset(self, request):
+        """Additionally filter the gear by any custom data lookups given in the query string"""
+        queryset = super(GearViewList, self).get_queryset(request)
+
+        data_lookups = self.get_reserved_params("data__")
+        if data_lookups:
+            try:
+                queryset = queryset.filter_data(**data_lookups)
+            except (FieldError, ValueError) as e:
+                raise IncorrectLookupParameters(e)
+
+        return queryset
@@ -1,10 +1,12 @@
+from core.models.ArchiveModels import TransactionArchive
 from core.models.TransactionModels import Transaction
 from core.views.common import ModelDetailView
-from core.views.ViewList import RestrictedViewList
+from core.views.ViewList import KeysetViewList
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.http import Http404
 
 
-class TransactionListView(RestrictedViewList):
+class TransactionListView(KeysetViewList):
     def test_func(self):
         return self.request.user.has_permission("core.view_transaction")
 
@@ -21,6 +23,16 @@ class TransactionDetailView(UserPassesTestMixin, ModelDetailView):
 
     model = Transaction
 
+    def get_object(self, queryset=None):
+        """Transactions that were moved to the archive are shown from there"""
+        try:
+            return super(TransactionDetailView, self).get_object(queryset)
+        except Http404:
+            archived = TransactionArchive.objects.get_transaction(int(self.kwargs[self.pk_url_kwarg]))
+            if archived is None:
+                raise
+            return archived
+
     def test_func(self):
         """Can view the detail of transaction of member is a staffer or transaction involves the member"""
         transaction_to_view = self.get_object()
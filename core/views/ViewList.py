@@ -1,7 +1,22 @@
+import binascii
+import json
+import operator
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+
+from django.contrib.admin.options import IncorrectLookupParameters
 from django.contrib.admin.utils import quote
 from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
 from django.urls import reverse
+from uwccsystem.settings import ESTIMATED_COUNT_THRESHOLD
+
+#: Query string parameters of keyset pages, holding the ordering values of the row the page comes after or before
+AFTER_VAR = "after"
+BEFORE_VAR = "before"
 
 
 class ViewList(ChangeList):
@@ -9,10 +24,29 @@ class ViewList(ChangeList):
     List display class that instead of linking to the change page, links to the detail view page
     """
 
+    #: Prefixes of query string parameters that are handled by the list itself, instead of being used as lookups
+    reserved_param_prefixes = ()
+
     def __init__(self, *args, **kwargs):
         super(ViewList, self).__init__(*args, **kwargs)
         self.title = f"Select the {self.opts.verbose_name} to view"
 
+    def get_filters_params(self, params=None):
+        """Exclude the reserved parameters, otherwise django would try to use them to filter the queryset"""
+        lookup_params = super(ViewList, self).get_filters_params(params)
+        for key in list(lookup_params.keys()):
+            if key.startswith(self.reserved_param_prefixes):
+                del lookup_params[key]
+        return lookup_params
+
+    def get_reserved_params(self, prefix):
+        """Get all query string parameters starting with the given prefix, with the prefix removed"""
+        return {
+            key[len(prefix):]: value
+            for key, value in self.params.items()
+            if key.startswith(prefix)
+        }
+
     def url_for_result(self, result):
         pk = getattr(result, self.pk_attname)
         return reverse(
@@ -66,4 +100,155 @@ class RestrictedViewList(UserPassesTestMixin, ViewList):
             self.set_restriction_filters()
             queryset = queryset.filter(**self.restriction_filters)
 
-        return queryset
+        return queryset.prefetch_related(*self.model_admin.list_prefetch_related)
+
+    def get_results(self, request):
+        super(RestrictedViewList, self).get_results(request)
+        self.model_admin.prefetch_list_results(self.result_list)
+
+
+def estimate_count(queryset):
+    """
+    Count the rows of a queryset, using the estimate of the query planner if it is more than ESTIMATED_COUNT_THRESHOLD
+
+    An exact COUNT(*) has to read every matching row, while the estimate is made from the table statistics. Only
+    postgres gives estimates, other databases are always counted exactly.
+
+    :return: the count, whether it is an estimate
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        try:
+            sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+        except EmptyResultSet:
+            return 0, False
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = plan[0]["Plan"]["Plan Rows"]
+        if estimate > ESTIMATED_COUNT_THRESHOLD:
+            return estimate, True
+    return queryset.count(), False
+
+
+class KeysetViewList(RestrictedViewList):
+    """
+    List for large tables, which pages by the values of the ordering columns instead of by an offset
+
+    The next page is the rows ordered after the last row of this one, i.e. ?after=<the last row>, which the database
+    finds through the index of the ordering, however deep the page is. Offsets instead have to skip every row before the
+    page. The primary key breaks ties, so no row is skipped or shown twice.
+
+    Keyset pages only work when ordered by fields of the model itself that can't be null. Other orderings (i.e. by a
+    related field) fall back to the pages of the change list.
+    """
+
+    reserved_param_prefixes = (AFTER_VAR, BEFORE_VAR)
+
+    #: Set when the list is paged by keyset, so the pagination template shows previous and next links
+    keyset_pagination = False
+    count_is_estimate = False
+    previous_url = None
+    next_url = None
+
+    def get_query_string(self, new_params=None, remove=None):
+        """Links to other filters or orderings start at the first page"""
+        new_params = new_params or {}
+        remove = list(remove or []) + [var for var in (AFTER_VAR, BEFORE_VAR) if var not in new_params]
+        return super(KeysetViewList, self).get_query_string(new_params, remove)
+
+    def get_keyset_fields(self):
+        """
+        Get the fields the list is ordered by, ending with the primary key, or None if it can't be paged by keyset
+
+        :return: list of (field, whether it is descending)
+        """
+        fields = []
+        for item in self.queryset.query.order_by:
+            if not isinstance(item, str):
+                return None
+            name = item.lstrip("-")
+            try:
+                field = self.lookup_opts.pk if name == "pk" else self.lookup_opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if field.is_relation or field.null:
+                return None
+            fields.append((field, item.startswith("-")))
+            if field.primary_key:
+                # The primary key is unique, so any later fields don't change the order
+                return fields
+
+        fields.append((self.lookup_opts.pk, fields[-1][1] if fields else False))
+        return fields
+
+    @staticmethod
+    def encode_keyset(values):
+        values = [value.isoformat() if hasattr(value, "isoformat") else value for value in values]
+        return urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode()
+
+    @staticmethod
+    def decode_keyset(fields, keyset):
+        try:
+            values = json.loads(urlsafe_b64decode(keyset.encode()))
+            if len(values) != len(fields):
+                raise ValueError("The keyset doesn't match the ordering")
+            return [field.to_python(value) for (field, _), value in zip(fields, values)]
+        except (ValueError, TypeError, binascii.Error, ValidationError) as e:
+            raise IncorrectLookupParameters(e)
+
+    @staticmethod
+    def keyset_filter(fields, values, forward):
+        """Get the filter for the rows ordered after (or before, if not forward) the row with the given values"""
+        conditions = []
+        equal = {}
+        for (field, descending), value in zip(fields, values):
+            lookup = "lt" if descending == forward else "gt"
+            conditions.append(Q(**equal, **{f"{field.attname}__{lookup}": value}))
+            equal[field.attname] = value
+        return reduce(operator.or_, conditions)
+
+    def get_results(self, request):
+        fields = self.get_keyset_fields()
+        if fields is None or self.show_all:
+            return super(KeysetViewList, self).get_results(request)
+
+        ordering = [f"-{field.attname}" if descending else field.attname for field, descending in fields]
+        queryset = self.queryset.order_by(*ordering)
+        after, before = self.params.get(AFTER_VAR), self.params.get(BEFORE_VAR)
+
+        # Only the keysets of one row more than a page are read, to know whether there is another page after it
+        if before is not None:
+            page = queryset.filter(self.keyset_filter(fields, self.decode_keyset(fields, before), False)).reverse()
+        elif after is not None:
+            page = queryset.filter(self.keyset_filter(fields, self.decode_keyset(fields, after), True))
+        else:
+            page = queryset
+        keysets = list(
+            page.prefetch_related(None).values_list(*[field.attname for field, _ in fields])[:self.list_per_page + 1]
+        )
+        has_more = len(keysets) > self.list_per_page
+        keysets = keysets[:self.list_per_page]
+        if before is not None:
+            keysets.reverse()
+
+        has_previous = (has_more if before is not None else after is not None) and bool(keysets)
+        has_next = (has_more if before is None else True) and bool(keysets)
+        if has_previous:
+            self.previous_url = self.get_query_string({BEFORE_VAR: self.encode_keyset(keysets[0])})
+        if has_next:
+            self.next_url = self.get_query_string({AFTER_VAR: self.encode_keyset(keysets[-1])})
+
+        self.result_count, self.count_is_estimate = estimate_count(self.queryset)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = queryset.filter(pk__in=[keyset[-1] for keyset in keysets])
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = None
+        self.keyset_pagination = True
+        self.model_admin.prefetch_list_results(self.result_list)
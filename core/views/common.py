@@ -1,3 +1,5 @@
+from core.caching import SharedCache
+from django.db import transaction
 from django.urls import reverse
 from django.urls.exceptions import NoReverseMatch
 from django.utils import timezone
@@ -5,6 +7,21 @@ from django.utils.safestring import mark_safe
 from django.views.generic import DetailView
 from uwccsystem.settings import WEB_BASE
 
+#: The rendered data of the detail pages, as a dict by view name, by model and pk. Kept up to date by core.signals
+detail_page_cache = SharedCache("detail_pages")
+
+
+def drop_detail_pages(model, *pks):
+    """
+    Drop the cached detail pages of the objects of a model with the given pks, once the current transaction is committed
+
+    Unlike invalidating the whole cache, this doesn't write to the database while the kiosk holds its locks, and keeps
+    the pages of everything else cached.
+    """
+    keys = [(model._meta.label_lower, pk) for pk in pks if pk is not None]
+    if keys:
+        transaction.on_commit(lambda: detail_page_cache.delete(*keys))
+
 
 def get_default_context(view, context):
     """Convenience function for getting the default context data of a member"""
@@ -125,5 +142,13 @@ class ModelDetailView(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context = get_default_context(self, context)
-        context["html_representation"] = self.get_html_repr(kwargs["object"])
+        obj = kwargs["object"]
+        # All views of an object are cached under one key, so drop_detail_pages doesn't need to know the views
+        key = (obj._meta.label_lower, obj.pk)
+        pages = detail_page_cache.get(key, dict)
+        view_name = type(self).__name__
+        if view_name not in pages:
+            pages = {**pages, view_name: self.get_html_repr(obj)}
+            detail_page_cache.set(key, pages)
+        context["html_representation"] = pages[view_name]
         return context
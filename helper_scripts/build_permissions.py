@@ -3,11 +3,13 @@ from helper_scripts import setup_django
 from core.models.CertificationModels import Certification
 from core.models.DepartmentModels import Department
 from core.models.GearModels import CustomDataField, Gear, GearType
-from core.models.MemberModels import Member, Staffer
+from core.models.MemberModels import Member, Staffer, permission_cache
 from core.models.QuizModels import Answer, Question
 from core.models.TransactionModels import Transaction
 from core.models.FileModels import AlreadyUploadedImage
-from api.models import MemberRFIDCheck
+from core.models.EmailModels import OutboxEmail
+from core.models.CampaignModels import EmailCampaign
+from api.models import MemberRFIDCheck, MemberRFIDCheckDay
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.db import IntegrityError, transaction
@@ -30,11 +32,16 @@ group_type = ContentType.objects.get_for_model(Group)
 question_type = ContentType.objects.get_for_model(Question)
 answer_type = ContentType.objects.get_for_model(Answer)
 image_type = ContentType.objects.get_for_model(AlreadyUploadedImage)
+outbox_email_type = ContentType.objects.get_for_model(OutboxEmail)
+campaign_type = ContentType.objects.get_for_model(EmailCampaign)
 rfid_check_type = ContentType.objects.get_for_model(MemberRFIDCheck)
+rfid_check_day_type = ContentType.objects.get_for_model(MemberRFIDCheckDay)
 
 
 def build_all():
     """Build all the groups. Must be done in ascending order of power"""
+    # Start from scratch, otherwise building again would give the lowest groups all the permissions of the last build
+    all_permissions.clear()
     build_just_joined()
     build_expired()
     build_member()
@@ -42,6 +49,9 @@ def build_all():
     build_board()
     build_admin()
 
+    # Changing the groups already invalidates the permissions, but make sure they are reloaded even if nothing changed
+    permission_cache.invalidate()
+
 
 def build_just_joined():
     """Create all the permissions for the lowest group, of freshly joined members"""
@@ -154,6 +164,26 @@ def build_staffer():
         name="View member RFID check log",
         content_type=rfid_check_type,
     )
+    add_permission(
+        codename="view_memberrfidcheckday",
+        name="View the daily counts of member RFID checks",
+        content_type=rfid_check_day_type,
+    )
+    add_permission(
+        codename="view_emailcampaign",
+        name="Can see email campaigns",
+        content_type=campaign_type,
+    )
+    add_permission(
+        codename="add_emailcampaign",
+        name="Can write email campaigns",
+        content_type=campaign_type,
+    )
+    add_permission(
+        codename="change_emailcampaign",
+        name="Can change and start email campaigns",
+        content_type=campaign_type,
+    )
     add_group("Staff", all_permissions)
 
 
@@ -239,6 +269,16 @@ def build_board():
 
 def build_admin():
     """Create the admin group, which has all possible permissions"""
+    add_permission(
+        codename="view_outboxemail",
+        name="Can see the outgoing emails",
+        content_type=outbox_email_type,
+    )
+    add_permission(
+        codename="change_outboxemail",
+        name="Can send outgoing emails again",
+        content_type=outbox_email_type,
+    )
     add_permission(
         codename="add_group", name="Can add permission groups", content_type=group_type
     )
@@ -6,16 +6,18 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions, wait
 
+from core import emailing
 from core.convinience import notify_info
+from django.core.exceptions import ImproperlyConfigured
+from core.models.ListservModels import ListservSubscription
 from core.models.MemberModels import Member
 
 LOAD_WAIT_SECS = 10
 
 
 def get_active_emails():
-    members = Member.objects.all()
-    emails = [f"{member.email}\n" for member in members if member.is_active_member]
-    return emails
+    emails = Member.objects.active().values_list("email", flat=True).iterator(chunk_size=2000)
+    return (f"{email}\n" for email in emails)
 
 
 def write_emails(email_list):
@@ -90,11 +92,105 @@ def push_to_listserv(emails_file):
     return change_message
 
 
+class EmailCommandTransport:
+    """
+    Changes the listserv by emailing ADD and DELETE commands to the listserv command address
+
+    Only the emails that changed are sent. The commands are authorized with the password of the list owner,
+    LISTSERV_USERNAME, so they are sent right away instead of through the outbox, which would keep the password in the
+    database. If sending fails the error is raised, and sync retries the same changes the next time.
+    """
+
+    required_settings = (
+        "LISTSERV_NAME", "LISTSERV_COMMAND_ADDRESS", "LISTSERV_USERNAME", "LISTSERV_PASSWORD", "EMAIL_HOST_USER"
+    )
+
+    def push(self, added, removed, active):
+        password = f" PW={settings.LISTSERV_PASSWORD}"
+        commands = [f"QUIET ADD {settings.LISTSERV_NAME} {email}{password}" for email in sorted(added)]
+        commands += [f"QUIET DELETE {settings.LISTSERV_NAME} {email}{password}" for email in sorted(removed)]
+        with emailing.EmailBatch() as batch:
+            error = batch.send(
+                [settings.LISTSERV_COMMAND_ADDRESS],
+                "Listserv update",
+                "\n".join(commands),
+                from_email=settings.LISTSERV_USERNAME,
+                smtp_user=settings.EMAIL_HOST_USER,
+                smtp_password=getattr(settings, "EMAIL_HOST_PASSWORD", ""),
+            )
+        if error is not None:
+            raise error
+        return f"Sent the listserv {len(added)} emails to add and {len(removed)} to remove"
+
+
+class SeleniumTransport:
+    """Replaces the whole listserv by uploading all active emails through the web form. Slow, but always works"""
+
+    required_settings = ("LISTSERV_FORM_ADDRESS", "LISTSERV_USERNAME", "LISTSERV_PASSWORD")
+
+    def push(self, added, removed, active):
+        return push_to_listserv(write_emails(f"{email}\n" for email in sorted(active)))
+
+
+class FakeListserv:
+    """A listserv that only exists in memory, to test updating the listserv without a real one"""
+
+    def __init__(self, emails=()):
+        self.emails = set(emails)
+        self.pushes = []
+
+    def push(self, added, removed, active):
+        self.pushes.append((set(added), set(removed)))
+        self.emails = (self.emails - set(removed)) | set(added)
+        return f"Added {len(added)}, removed {len(removed)}"
+
+
+TRANSPORTS = {"email": EmailCommandTransport, "selenium": SeleniumTransport}
+
+
+def get_transport():
+    """
+    Get the transport chosen by the LISTSERV_TRANSPORT setting
+
+    Raises ImproperlyConfigured if the transport is unknown or a setting it needs is missing, so a broken update is
+    never pushed and recorded as done
+    """
+    if settings.LISTSERV_TRANSPORT not in TRANSPORTS:
+        raise ImproperlyConfigured(
+            f"LISTSERV_TRANSPORT must be one of {', '.join(TRANSPORTS)}, not {settings.LISTSERV_TRANSPORT!r}"
+        )
+    transport = TRANSPORTS[settings.LISTSERV_TRANSPORT]
+    missing = [name for name in transport.required_settings if not getattr(settings, name, None)]
+    if missing:
+        raise ImproperlyConfigured(
+            f"The {settings.LISTSERV_TRANSPORT} listserv transport needs the settings {', '.join(missing)}"
+        )
+    return transport()
+
+
+def sync(transport):
+    """
+    Push the members that joined or expired since the last update to the listserv
+
+    The emails that are on the listserv are remembered in ListservSubscription, so only the difference with the active
+    members has to be pushed. They are only updated after the transport succeeded, so a failed update is retried in full
+    the next time.
+
+    :return: the message of the transport, or None if nothing changed
+    """
+    added, removed, active = ListservSubscription.objects.get_changes()
+    if not added and not removed:
+        return None
+
+    change_message = transport.push(added, removed, active)
+    ListservSubscription.objects.record(added, removed)
+    return change_message
+
+
 def run_update():
-    emails = get_active_emails()
-    email_file = write_emails(emails)
-    change_message = push_to_listserv(email_file)
-    notify_info("Listserv Updated", change_message)
+    change_message = sync(get_transport())
+    if change_message is not None:
+        notify_info("Listserv Updated", change_message)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,31 @@
+from typing import List
+
 from core.models.TransactionModels import Transaction
 from django.utils.timezone import now, timedelta
 
 
-def do_checkout(staffer_rfid: str, member_rfid: str, gear_rfid: str) -> None:
+def get_return_date():
     # TODO: make return date a choose-able parameter, currently just a week from rental date
-    return_date = now().today() + timedelta(days=7)
+    return now().today() + timedelta(days=7)
+
+
+def do_checkout(staffer_rfid: str, member_rfid: str, gear_rfid: str) -> None:
+    return_date = get_return_date()
     Transaction.objects.make_checkout(staffer_rfid, gear_rfid, member_rfid, return_date)
 
 
 def do_checkin(staffer_rfid: str, gear_rfid: str) -> None:
     Transaction.objects.check_in_gear(staffer_rfid, gear_rfid)
+
+
+def do_batch_checkout(staffer_rfid: str, member_rfid: str, gear_rfids: List[str]) -> list:
+    return_date = get_return_date()
+    return Transaction.objects.batch_checkout(staffer_rfid, member_rfid, gear_rfids, return_date)
+
+
+def do_batch_checkin(staffer_rfid: str, gear_rfids: List[str]) -> list:
+    return Transaction.objects.batch_check_in(staffer_rfid, gear_rfids)
+
+
+def do_return_all(staffer_rfid: str, member_rfid: str) -> list:
+    return Transaction.objects.return_all_gear(staffer_rfid, member_rfid)
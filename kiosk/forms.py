@@ -1,4 +1,4 @@
-from core.models.GearModels import Gear
+from core.models.GearModels import Gear, GearType
 from django import forms
 
 
@@ -8,7 +8,66 @@ class HomeForm(forms.Form):
     )
 
 
+class BatchForm(forms.Form):
+    """Many scanned RFIDs at once, one per line (each scan ends with a new line)"""
+
+    rfids = forms.CharField(
+        label="Scanned RFIDs",
+        required=False,
+        widget=forms.Textarea(attrs={"rows": 8, "placeholder": "Scan all the gear, then check it out or in at once"}),
+    )
+
+    def clean_rfids(self):
+        """Split the scanned text into a list of RFIDs, in the order they were scanned and without duplicates"""
+        rfids = self.cleaned_data["rfids"].replace(",", " ").split()
+        return list(dict.fromkeys(rfids))
+
+
 class RetagGearForm(forms.ModelForm):
     class Meta:
         model = Gear
         fields = ["geartype", "rfid"]
+
+
+class GearSearchForm(forms.Form):
+    """Search the available gear of one gear type by the values of its custom data fields"""
+
+    geartype = forms.ModelChoiceField(GearType.objects.all(), required=False, label="Gear Type")
+
+    def __init__(self, *args, geartype=None, **kwargs):
+        super(GearSearchForm, self).__init__(*args, **kwargs)
+
+        # Once a gear type is known, add an input for each of its data fields. The input names are the lookups to use
+        if geartype:
+            schema = geartype.get_schema()
+            for field in schema.data_fields.values():
+                if field.data_type == "rfid":
+                    continue
+                if field.data_type in ("int", "float"):
+                    self.fields[f"data__{field.name}__gte"] = forms.FloatField(
+                        label=f"{field.label} at least", required=False
+                    )
+                    self.fields[f"data__{field.name}__lte"] = forms.FloatField(
+                        label=f"{field.label} at most", required=False
+                    )
+                elif field.data_type == "choice":
+                    choices = (("", "Any"),) + schema.choices[field.name]
+                    self.fields[f"data__{field.name}"] = forms.ChoiceField(
+                        label=field.label, choices=choices, required=False
+                    )
+                elif field.data_type == "boolean":
+                    self.fields[f"data__{field.name}"] = forms.NullBooleanField(
+                        label=field.label, required=False
+                    )
+                else:
+                    self.fields[f"data__{field.name}__iexact"] = forms.CharField(
+                        label=field.label, required=False
+                    )
+
+    def get_data_lookups(self):
+        """Get the filled in data field inputs as lookups for Gear.objects.filter_data"""
+        return {
+            name[len("data__"):]: value
+            for name, value in self.cleaned_data.items()
+            if name.startswith("data__") and value not in (None, "")
+        }
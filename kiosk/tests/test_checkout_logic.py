@@ -7,12 +7,13 @@ from core.models.FileModels import AlreadyUploadedImage
 from django.core.exceptions import ValidationError
 from django.test import TestCase
 from django.utils.timezone import timedelta
-from kiosk.CheckoutLogic import do_checkin, do_checkout
+from kiosk.CheckoutLogic import do_batch_checkin, do_batch_checkout, do_checkin, do_checkout, do_return_all
 
 ADMIN_RFID = "0000000000"
 MEMBER_RFID1 = "0000000001"
 MEMBER_RFID2 = "0000000002"
 GEAR_RFID = "0123456789"
+GEAR_RFID2 = "0123456788"
 
 
 class CheckoutLogicTest(TestCase):
@@ -166,9 +167,69 @@ class CheckoutLogicTest(TestCase):
         self.assertEqual(gear.is_rented_out(), True)
 
     def test_checkin_of_already_returned_gear(self):
-        """Test checkin of available gear by valid staffer is fine"""
-        gear = Gear.objects.get(rfid=GEAR_RFID)
-        self.assertEqual(gear.is_available(), True)
+        """Test checkin of available gear is refused, i.e. when two kiosks check in the same gear"""
+        do_checkout(ADMIN_RFID, MEMBER_RFID1, GEAR_RFID)
         do_checkin(ADMIN_RFID, GEAR_RFID)
+        with self.assertRaises(ValidationError):
+            do_checkin(ADMIN_RFID, GEAR_RFID)
         gear = Gear.objects.get(rfid=GEAR_RFID)
         self.assertEqual(gear.is_available(), True)
+        self.assertEqual(Transaction.objects.filter(type="CheckIn").count(), 1)
+
+    def add_second_gear(self):
+        gear = Gear.objects.get(rfid=GEAR_RFID)
+        Transaction.objects.add_gear(ADMIN_RFID, GEAR_RFID2, gear.geartype, gear.image)
+
+    def test_batch_checkout(self):
+        """Test checkout of several pieces of gear at once, where unknown gear is reported but does not stop the rest"""
+        self.add_second_gear()
+        results = do_batch_checkout(ADMIN_RFID, MEMBER_RFID1, [GEAR_RFID, "0123456780", GEAR_RFID2])
+
+        self.assertEqual([rfid for rfid, _, _ in results], [GEAR_RFID, "0123456780", GEAR_RFID2])
+        self.assertEqual([error is None for _, _, error in results], [True, False, True])
+        member = Member.objects.get(rfid=MEMBER_RFID1)
+        self.assertEqual(Gear.objects.filter(checked_out_to=member, status=1).count(), 2)
+        self.assertEqual(Transaction.objects.filter(type="CheckOut", member=member).count(), 2)
+
+    def test_batch_checkout_of_checked_out_gear(self):
+        """Test gear that is already checked out is refused, but the rest of the batch is checked out"""
+        self.add_second_gear()
+        do_checkout(ADMIN_RFID, MEMBER_RFID2, GEAR_RFID)
+        results = do_batch_checkout(ADMIN_RFID, MEMBER_RFID1, [GEAR_RFID, GEAR_RFID2])
+
+        self.assertIsNotNone(results[0][2])
+        self.assertEqual(Gear.objects.get(rfid=GEAR_RFID).checked_out_to.rfid, MEMBER_RFID2)
+        self.assertEqual(Gear.objects.get(rfid=GEAR_RFID2).checked_out_to.rfid, MEMBER_RFID1)
+
+    def test_batch_checkin(self):
+        """Test check in of several pieces of gear at once"""
+        self.add_second_gear()
+        do_batch_checkout(ADMIN_RFID, MEMBER_RFID1, [GEAR_RFID, GEAR_RFID2])
+        results = do_batch_checkin(ADMIN_RFID, [GEAR_RFID, GEAR_RFID2])
+
+        self.assertTrue(all(error is None for _, _, error in results))
+        self.assertEqual(Gear.objects.filter(status=0, checked_out_to=None).count(), 2)
+        self.assertEqual(Transaction.objects.filter(type="CheckIn").count(), 2)
+
+    def test_batch_checkin_of_gear_not_checked_out(self):
+        """Test gear that is in stock or broken is refused, but the rest of the batch is checked in"""
+        self.add_second_gear()
+        do_checkout(ADMIN_RFID, MEMBER_RFID1, GEAR_RFID)
+        Transaction.objects.break_gear(ADMIN_RFID, GEAR_RFID2, "torn")
+        results = do_batch_checkin(ADMIN_RFID, [GEAR_RFID, GEAR_RFID2])
+
+        self.assertEqual([error is None for _, _, error in results], [True, False])
+        self.assertTrue(Gear.objects.get(rfid=GEAR_RFID).is_available())
+        self.assertEqual(Gear.objects.get(rfid=GEAR_RFID2).status, 2)
+        self.assertEqual(Transaction.objects.filter(type="CheckIn").count(), 1)
+
+    def test_return_all(self):
+        """Test all the gear of one member is checked in, and the gear of other members is not"""
+        self.add_second_gear()
+        do_checkout(ADMIN_RFID, MEMBER_RFID1, GEAR_RFID)
+        do_checkout(ADMIN_RFID, MEMBER_RFID2, GEAR_RFID2)
+        results = do_return_all(ADMIN_RFID, MEMBER_RFID1)
+
+        self.assertEqual([rfid for rfid, _, _ in results], [GEAR_RFID])
+        self.assertTrue(Gear.objects.get(rfid=GEAR_RFID).is_available())
+        self.assertTrue(Gear.objects.get(rfid=GEAR_RFID2).is_rented_out())
@@ -9,5 +9,7 @@ urlpatterns = [
     path("", include("django.contrib.auth.urls")),
     path("gear/<slug:rfid>/", views.GearView.as_view(), name="gear"),
     path("member/<slug:rfid>/", views.CheckOutView.as_view(), name="check_out"),
+    path("member/<slug:rfid>/batch/", views.BatchCheckOutView.as_view(), name="batch"),
+    path("search/", views.GearSearchView.as_view(), name="search"),
     path("retag-gear/<slug:rfid>/", views.RetagGearView.as_view(), name="retag_gear"),
 ]
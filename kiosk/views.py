@@ -1,7 +1,8 @@
 from typing import List
 
-from core.models.GearModels import Gear
+from core.models.GearModels import Gear, GearType
 from core.models.MemberModels import Member
+from core.models.RFIDModels import RFIDTag
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import ValidationError
@@ -9,8 +10,8 @@ from django.http import Http404
 from django.urls import reverse
 from django.shortcuts import redirect, render
 from django.views import View, generic
-from kiosk.CheckoutLogic import do_checkin, do_checkout
-from kiosk.forms import HomeForm, RetagGearForm
+from kiosk.CheckoutLogic import do_batch_checkin, do_batch_checkout, do_checkin, do_checkout, do_return_all
+from kiosk.forms import BatchForm, GearSearchForm, HomeForm, RetagGearForm
 
 
 class HomeView(LoginRequiredMixin, generic.TemplateView):
@@ -38,20 +39,15 @@ class HomeView(LoginRequiredMixin, generic.TemplateView):
 
         if form.is_valid():
             rfid = form.cleaned_data["rfid"]
+            kind, _ = RFIDTag.objects.resolve(rfid)
 
             # If the scaned RFID belongs to gear, go to the relevant gear view
-            try:
-                Gear.objects.get(rfid=rfid)
+            if kind == RFIDTag.GEAR:
                 return redirect("kiosk:gear", rfid)
-            except Gear.DoesNotExist:
-                pass
 
             # If the scaned RFID belongs to a member, go to the relevant member view
-            try:
-                Member.objects.get(rfid=rfid)
+            if kind == RFIDTag.MEMBER:
                 return redirect("kiosk:check_out", rfid)
-            except Member.DoesNotExist:
-                pass
 
             # Something probably went wrong, so try and figure out what it might be
             if rfid.isdigit() and len(rfid) == 10:
@@ -89,11 +85,15 @@ class CheckOutView(View):
             messages.add_message(request, messages.WARNING, alert_message)
 
         checked_out_gear = get_checked_out_gear(rfid)
+        rentable_geartypes, restricted_geartypes = GearType.split_by_eligibility(member)
 
         args = {
             "form": form,
+            "batch_form": BatchForm(),
             "member": member,
             "checked_out_gear": checked_out_gear,
+            "rentable_geartypes": rentable_geartypes,
+            "restricted_geartypes": restricted_geartypes,
             "kiosk_home": reverse("kiosk:home")}
         return render(request, self.template_name, args)
 
@@ -111,15 +111,19 @@ class CheckOutView(View):
                 gear = None
 
             if gear:
-                # Check the scanned piece of gear in or out, depending on the current state
-                if gear.is_available():
-                    do_checkout(staffer_rfid, member_rfid, gear_rfid)
-                    alert_message = f"{gear.name} was checked out successfully"
-                    messages.add_message(request, messages.INFO, alert_message)
-                else:
-                    do_checkin(staffer_rfid, gear_rfid)
-                    alert_message = f"{gear.name} was checked in successfully"
-                    messages.add_message(request, messages.WARNING, alert_message)
+                # Check the scanned piece of gear in or out, depending on the current state. Another kiosk might have
+                # changed the state in the meantime, in which case the transaction is refused
+                try:
+                    if gear.is_available():
+                        do_checkout(staffer_rfid, member_rfid, gear_rfid)
+                        alert_message = f"{gear.name} was checked out successfully"
+                        messages.add_message(request, messages.INFO, alert_message)
+                    else:
+                        do_checkin(staffer_rfid, gear_rfid)
+                        alert_message = f"{gear.name} was checked in successfully"
+                        messages.add_message(request, messages.WARNING, alert_message)
+                except ValidationError as e:
+                    messages.add_message(request, messages.ERROR, e.message)
             else:
                 alert_message = "The RFID tag is not registered to a piece of gear"
                 messages.add_message(request, messages.WARNING, alert_message)
@@ -127,6 +131,53 @@ class CheckOutView(View):
             return redirect("kiosk:check_out", member_rfid)
 
 
+class BatchCheckOutView(LoginRequiredMixin, View):
+    """
+    Check out or check in a whole list of scanned gear for one member at once, or return all of the member's gear
+
+    All the gear is changed in a single database transaction. Gear that can't be checked out or in is reported, the rest
+    of the batch still goes through.
+    """
+
+    login_url = "kiosk:login"
+    redirect_field_name = ""
+
+    @staticmethod
+    def post(request, rfid: str):
+        form = BatchForm(request.POST)
+        action = request.POST.get("action")
+        staffer_rfid = request.user.rfid
+
+        if form.is_valid():
+            gear_rfids = form.cleaned_data["rfids"]
+            try:
+                if action == "return_all":
+                    results = do_return_all(staffer_rfid, rfid)
+                    done = "checked in"
+                elif action == "check_in":
+                    results = do_batch_checkin(staffer_rfid, gear_rfids)
+                    done = "checked in"
+                else:
+                    results = do_batch_checkout(staffer_rfid, rfid, gear_rfids)
+                    done = "checked out"
+            except Member.DoesNotExist:
+                messages.add_message(request, messages.WARNING, "There is no member with this RFID!")
+                return redirect("kiosk:home")
+            except ValidationError as e:
+                messages.add_message(request, messages.ERROR, e.message)
+            else:
+                for gear_rfid, transaction, error in results:
+                    if error:
+                        messages.add_message(request, messages.ERROR, error)
+                    else:
+                        alert_message = f"{transaction.gear.name} was {done} successfully"
+                        messages.add_message(request, messages.INFO, alert_message)
+                if not results:
+                    messages.add_message(request, messages.WARNING, "No gear was scanned")
+
+        return redirect("kiosk:check_out", rfid)
+
+
 class GearView(View):
     template_name = "kiosk/gear.html"
 
@@ -157,21 +208,12 @@ class GearView(View):
             except Gear.DoesNotExist:
                 raise Http404()
 
-            # See if the newly scanned RFID belongs to a piece of gear
-            try:
-                gear = Gear.objects.get(rfid=form_rfid)
-                gear_rfid = form_rfid
-            except Gear.DoesNotExist:
-                gear = None
-                gear_rfid = None
-
-            # See if the available RFID belong to members
-            try:
-                member = Member.objects.get(rfid=form_rfid)
-                member_rfid = form_rfid
-            except Member.DoesNotExist:
-                member = None
-                member_rfid = None
+            # See whether the newly scanned RFID belongs to a piece of gear or to a member
+            kind, object_id = RFIDTag.objects.resolve(form_rfid)
+            gear = Gear.objects.filter(pk=object_id).first() if kind == RFIDTag.GEAR else None
+            gear_rfid = form_rfid if gear else None
+            member = Member.objects.filter(pk=object_id).first() if kind == RFIDTag.MEMBER else None
+            member_rfid = form_rfid if member else None
 
             # If we scanned a member RFID, then try to check this piece of gear out to a member
             if member:
@@ -229,6 +271,42 @@ class RetagGearView(View):
         return render(request, self.template_name, args)
 
 
+class GearSearchView(LoginRequiredMixin, View):
+    """
+    Search for available gear by type and by the values of its custom data, e.g. all size M wetsuits in stock
+    """
+
+    template_name = "kiosk/search.html"
+    login_url = "kiosk:login"
+    redirect_field_name = ""
+
+    def get(self, request):
+        # The data field inputs depend on the gear type, so it is cleaned before the rest of the form. An invalid gear type
+        # is shown as an error of the form
+        try:
+            geartype = GearSearchForm.base_fields["geartype"].clean(request.GET.get("geartype"))
+        except ValidationError:
+            geartype = None
+
+        form = GearSearchForm(request.GET or None, geartype=geartype)
+
+        results = []
+        if geartype and form.is_valid():
+            results = (
+                Gear.objects.filter(geartype=geartype, status=0)
+                .filter_data(**form.get_data_lookups())
+                .order_by("rfid")
+            )
+
+        args = {
+            "form": form,
+            "geartype": geartype,
+            "results": results,
+            "kiosk_home": reverse("kiosk:home"),
+        }
+        return render(request, self.template_name, args)
+
+
 def get_member(member_rfid: str, member=None) -> Member:
     try:
         member = Member.objects.get(rfid=member_rfid)
@@ -1,6 +1,19 @@
 import sys
 from helper_scripts import setup_django
-from core.tasks import expire_members, update_listserv, expire_gear, email_overdue_gear
+from core.tasks import (
+    expire_members,
+    update_listserv,
+    expire_gear,
+    email_overdue_gear,
+    refresh_gear_display,
+    import_gear,
+    compact_rfid_checks,
+    snapshot_inventory,
+    export_inventory,
+    archive_transactions,
+    send_emails,
+    retry_dead_emails,
+)
 from helper_scripts.build_permissions import build_all as build_all_perms
 from helper_scripts.listserv_interface import get_email_file
 from helper_scripts.fix_member_group import fix_all_group_names
@@ -18,6 +31,14 @@ tasks = {
     "expire_members": expire_members,
     "expire_gear": expire_gear,
     "email_overdue_gear": email_overdue_gear,
+    "refresh_gear_display": refresh_gear_display,
+    "import_gear": import_gear,
+    "compact_rfid_checks": compact_rfid_checks,
+    "snapshot_inventory": snapshot_inventory,
+    "export_inventory": export_inventory,
+    "archive_transactions": archive_transactions,
+    "send_emails": send_emails,
+    "retry_dead_emails": retry_dead_emails,
     "update_listserv": update_listserv,
     "get_email_file": get_email_file,
     "build_permissions": build_all_perms,
@@ -27,16 +48,16 @@ tasks = {
 }
 
 
-def run_task(task_name):
+def run_task(task_name, *args):
     task_name = task_name.lower()
     if task_name in tasks.keys():
         func = tasks[task_name]
-        return func()
+        return func(*args)
     else:
         raise KeyError("Unknown task name!")
 
 
 if __name__ == "__main__":
     task_to_run = sys.argv[1]
-    value = run_task(task_to_run)
+    value = run_task(task_to_run, *sys.argv[2:])
     print(value)
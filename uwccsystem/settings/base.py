@@ -19,6 +19,54 @@ EXC_EMAIL = '@climbingclubuw.org'
 
 GEAR_EXPIRE_TIME = timedelta(days=90)
 
+# How many seconds a process may use its cached data before checking whether another process has changed it
+PROCESS_CACHE_CHECK_INTERVAL = 5
+
+# The cache shared between processes (see core.caching.SharedCache). CACHE_BACKEND is "locmem" (every process keeps its
+# own), "file" (shared by the processes of one server, stored in the CACHE_LOCATION directory) or "redis" (shared by all
+# servers, at the CACHE_LOCATION url, needs the django-redis package). Entries expire after SHARED_CACHE_TIMEOUT seconds.
+# With "locmem" a change only reaches the other processes through the database, within PROCESS_CACHE_CHECK_INTERVAL
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "locmem")
+CACHE_LOCATION = os.environ.get("CACHE_LOCATION", "")
+SHARED_CACHE_TIMEOUT = 300
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "redis": "django_redis.cache.RedisCache",
+}
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND],
+        "LOCATION": CACHE_LOCATION or ("/tmp/uwccsystem_cache" if CACHE_BACKEND == "file" else ""),
+        "TIMEOUT": SHARED_CACHE_TIMEOUT,
+        "KEY_PREFIX": "uwccsystem",
+    }
+}
+
+# The door rfid checks are saved in batches, at most this many seconds after the check or once this many are waiting
+RFID_CHECK_LOG_FLUSH_INTERVAL = 2
+RFID_CHECK_LOG_BATCH_SIZE = 200
+# Older door rfid checks are compacted into daily counts per rfid, see the compact_rfid_checks task
+RFID_CHECK_LOG_RETENTION = timedelta(days=90)
+# Inventory snapshots leave out the last few minutes, in which transactions may still be being saved
+INVENTORY_SNAPSHOT_LAG = timedelta(minutes=5)
+# Older transactions are moved into compressed archive segments of this many transactions, see archive_transactions
+TRANSACTION_ARCHIVE_AFTER = timedelta(days=365)
+TRANSACTION_ARCHIVE_SEGMENT_SIZE = 5000
+# Lists of more rows than this (as estimated by the postgres query planner) show the estimate instead of an exact count
+ESTIMATED_COUNT_THRESHOLD = 10000
+# With DEBUG on, a page of an admin list fails if it makes more queries than this, see ViewableModelAdmin
+LIST_QUERY_BUDGET = 25
+
+# Emails are saved to the outbox and sent by the send_emails task. How many it sends at once, how many seconds a worker
+# may take to send them before another worker picks them up, and how often they are tried before giving up on them.
+# Failed emails wait OUTBOX_RETRY_DELAY seconds before the next attempt, twice as long after every attempt after that.
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_LEASE_TIME = 300
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_DELAY = 60
+OUTBOX_POLL_INTERVAL = 5
+
 ALLOWED_HOSTS = ["*"]
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
@@ -112,3 +160,8 @@ LOGOUT_REDIRECT_URL = "front-page:home"
 LISTSERV_USERNAME = os.environ.get("LISTSERV_USERNAME")
 LISTSERV_PASSWORD = os.environ.get("LISTSERV_PASSWORD")
 LISTSERV_FORM_ADDRESS = os.environ.get("LISTSERV_FORM_ADDRESS")
+# Changes are sent as commands to the LISTSERV_COMMAND_ADDRESS (i.e. LISTSERV@lists.uw.edu) for the list LISTSERV_NAME.
+# Set LISTSERV_TRANSPORT to "selenium" to upload the whole list through the web form instead
+LISTSERV_NAME = os.environ.get("LISTSERV_NAME")
+LISTSERV_COMMAND_ADDRESS = os.environ.get("LISTSERV_COMMAND_ADDRESS")
+LISTSERV_TRANSPORT = os.environ.get("LISTSERV_TRANSPORT", "email" if LISTSERV_COMMAND_ADDRESS else "selenium")
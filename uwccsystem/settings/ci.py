@@ -24,6 +24,8 @@ DATABASES = {
 # Email host settings
 EMAIL_HOST = "localhost"
 EMAIL_PORT = 1024
+EMAIL_HOST_USER = "excursion@UWCCDev.org"
+EMAIL_HOST_PASSWORD = ""
 MEMBERSHIP_EMAIL_HOST_USER = "membership@UWCCDev.org"
 MEMBERSHIP_EMAIL_HOST_PASSWORD = ""
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
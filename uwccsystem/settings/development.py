@@ -38,6 +38,8 @@ DATABASES = {
 # Email host settings
 EMAIL_HOST = "localhost"
 EMAIL_PORT = 1024
+EMAIL_HOST_USER = "excursion@UWCCDev.org"
+EMAIL_HOST_PASSWORD = ""
 EMAIL_USE_TLS = False
 MEMBERSHIP_EMAIL_NAME = "UWCC Membership"
 MEMBERSHIP_EMAIL_HOST_USER = "membership@UWCCDev.org"